@@ -0,0 +1,256 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+
+log = logging.getLogger('bot.actions')
+
+
+# Приоритеты: меньше — раньше
+PRIORITY_INTERACTION = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOG = 2
+
+
+class _Action:
+    __slots__ = ('bucket', 'key', 'priority', 'run', 'description', 'future', 'queued_at', 'started', 'state')
+
+    def __init__(self, bucket, key, priority, run, description, state=None):
+        self.bucket = bucket
+        self.key = key
+        self.priority = priority
+        self.run = run
+        self.description = description
+        self.future = asyncio.get_running_loop().create_future()
+        self.queued_at = time.monotonic()
+        self.started = False
+        self.state = state
+
+
+# 🔹 Очередь исходящих действий Discord
+class ActionScheduler:
+    """
+    Все изменения в Discord (роли, права каналов, сообщения, удаление каналов)
+    проходят через одну очередь с приоритетами.
+    - Действия одного маршрута (участники сервера, конкретный канал) выполняются по очереди,
+      поэтому не упираются в один и тот же лимит одновременно. У каждого маршрута своя
+      очередь по приоритету; обработчики берут маршруты из очереди готовых (свободных,
+      с действиями) по приоритету первого действия и не простаивают на занятом маршруте.
+      Маршрут стоит в очереди готовых не больше одного раза.
+    - Общее число запросов в полёте ограничено max_concurrency.
+    - Ещё не начатые действия над тем же участником/каналом сливаются в одно.
+    - Очередь ограничена max_queue: при переполнении submit() ждёт (backpressure).
+    Ожидание при 429 делает discord.py (HTTPClient) внутри запроса.
+    """
+
+    def __init__(self, max_concurrency=4, max_queue=1000):
+        self.max_concurrency = max_concurrency
+        self._space = asyncio.Semaphore(max_queue)
+        self._seq = itertools.count()
+        self._pending = {}
+        # {маршрут: куча (приоритет, номер, действие)} — ещё не начатые действия маршрута
+        self._buckets = {}
+        # Свободные маршруты с действиями: (приоритет первого действия, номер, маршрут)
+        self._ready = asyncio.PriorityQueue()
+        # Маршруты с записью в _ready: их, как и занятые (_busy), повторно в _ready не ставим
+        self._scheduled = set()
+        self._busy = set()
+        self._queued = 0
+        self._unfinished = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._workers = []
+        # Метрики
+        self.executed = 0
+        self.coalesced = 0
+        self.failed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def start(self):
+        if not self._workers:
+            self._workers = [asyncio.create_task(self._worker()) for _ in range(self.max_concurrency)]
+
+    async def close(self, timeout=10):
+        """Дождаться выполнения очереди (не дольше timeout секунд) и остановить обработчики"""
+        if self._workers:
+            try:
+                await asyncio.wait_for(self._idle.wait(), timeout)
+            except asyncio.TimeoutError:
+                log.warning('Очередь действий не успела опустеть: %s', self._queued)
+        for worker in self._workers:
+            worker.cancel()
+        self._workers = []
+
+    async def drain(self):
+        """Дождаться выполнения всех поставленных действий"""
+        await self._idle.wait()
+
+    def stats(self):
+        return {
+            'queue_depth': self._queued,
+            'executed': self.executed,
+            'coalesced': self.coalesced,
+            'failed': self.failed,
+            'avg_wait': self.total_wait / self.executed if self.executed else 0.0,
+            'max_wait': self.max_wait
+        }
+
+    async def submit(self, bucket, run, description, priority=PRIORITY_NORMAL, key=None, state=None):
+        """Поставить действие в очередь; вернуть future с результатом"""
+        await self._space.acquire()
+        action = _Action(bucket, key, priority, run, description, state)
+        if key is not None:
+            self._pending[key] = action
+        entry = (priority, next(self._seq), action)
+        queue = self._buckets.setdefault(bucket, [])
+        heapq.heappush(queue, entry)
+        self._queued += 1
+        self._unfinished += 1
+        self._idle.clear()
+        if bucket not in self._busy and bucket not in self._scheduled:
+            self._schedule(bucket, queue)
+        return action.future
+
+    def _schedule(self, bucket, queue):
+        """Поставить свободный маршрут в _ready по приоритету его первого действия"""
+        self._scheduled.add(bucket)
+        self._ready.put_nowait((queue[0][0], queue[0][1], bucket))
+
+    def _mergeable(self, key):
+        action = self._pending.get(key)
+        return action if action is not None and not action.started else None
+
+    async def _worker(self):
+        while True:
+            _, _, bucket = await self._ready.get()
+            self._scheduled.discard(bucket)
+            queue = self._buckets[bucket]
+            _, _, action = heapq.heappop(queue)
+            self._busy.add(bucket)
+            self._queued -= 1
+            self._space.release()
+            try:
+                await self._execute(action)
+            finally:
+                self._busy.discard(bucket)
+                if queue:
+                    self._schedule(bucket, queue)
+                else:
+                    del self._buckets[bucket]
+                self._unfinished -= 1
+                if not self._unfinished:
+                    self._idle.set()
+
+    async def _execute(self, action):
+        action.started = True
+        if action.key is not None and self._pending.get(action.key) is action:
+            del self._pending[action.key]
+
+        wait = time.monotonic() - action.queued_at
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+
+        try:
+            result = await action.run()
+        except Exception as e:
+            self.failed += 1
+            log.error('ОШИБКА действия «%s»: %s', action.description, e)
+            if not action.future.done():
+                action.future.set_exception(e)
+                # Исключение уже залогировано — не шуметь, если результат никто не ждёт
+                action.future.exception()
+            return
+
+        self.executed += 1
+        if not action.future.done():
+            action.future.set_result(result)
+
+    # --- типовые действия ---
+    async def edit_member_roles(self, member, add=(), remove=(), reason=None):
+        """
+        Выдать/снять роли участнику. Несколько ещё не выполненных изменений
+        одного участника сливаются в один запрос.
+        """
+        key = ('member_roles', member.guild.id, member.id)
+        action = self._mergeable(key)
+        if action is not None:
+            to_add, to_remove = action.state
+            for role in remove:
+                to_add.pop(role.id, None)
+                to_remove[role.id] = role
+            for role in add:
+                to_remove.pop(role.id, None)
+                to_add[role.id] = role
+            self.coalesced += 1
+            return action.future
+
+        to_add = {role.id: role for role in add}
+        to_remove = {role.id: role for role in remove if role.id not in to_add}
+
+        async def run():
+            if not to_remove and len(to_add) == 1:
+                await member.add_roles(*to_add.values(), reason=reason)
+            elif not to_add and len(to_remove) == 1:
+                await member.remove_roles(*to_remove.values(), reason=reason)
+            elif to_add or to_remove:
+                # Полный список ролей — по участнику из кэша на момент выполнения: роли, изменённые,
+                # пока действие ждало в очереди, не откатываются
+                current = member.guild.get_member(member.id) or member
+                roles = [role for role in current.roles[1:] if role.id not in to_remove]
+                roles.extend(role for role_id, role in to_add.items() if current.get_role(role_id) is None)
+                await current.edit(roles=roles, reason=reason)
+
+        description = f'роли участника {member} (+{len(to_add)}/-{len(to_remove)})'
+        return await self.submit(('member', member.guild.id), run, description, key=key, state=(to_add, to_remove))
+
+    async def timeout_member(self, member, until, reason=None):
+        """Тайм-аут участника до until; из нескольких ожидающих остаётся последний"""
+        key = ('member_timeout', member.guild.id, member.id)
+        action = self._mergeable(key)
+        if action is not None:
+            action.state[0] = until
+            self.coalesced += 1
+            return action.future
+
+        state = [until]
+
+        async def run():
+            await member.timeout(state[0], reason=reason)
+
+        return await self.submit(('member', member.guild.id), run, f'тайм-аут участника {member}', key=key, state=state)
+
+    async def edit_channel(self, channel, priority=PRIORITY_INTERACTION, **fields):
+        """Изменение канала; ожидающие изменения того же канала объединяются"""
+        key = ('channel_edit', channel.id)
+        action = self._mergeable(key)
+        if action is not None:
+            action.state.update(fields)
+            self.coalesced += 1
+            return action.future
+
+        state = dict(fields)
+
+        async def run():
+            return await channel.edit(**state)
+
+        return await self.submit(('channel', channel.id), run, f'изменение канала {channel}', priority, key, state)
+
+    async def delete_channel(self, channel, reason=None):
+        key = ('channel_delete', channel.id)
+        action = self._mergeable(key)
+        if action is not None:
+            self.coalesced += 1
+            return action.future
+
+        async def run():
+            await channel.delete(reason=reason)
+
+        return await self.submit(('channel', channel.id), run, f'удаление канала {channel}', PRIORITY_NORMAL, key)
+
+    async def send(self, channel, priority=PRIORITY_LOG, **kwargs):
+        async def run():
+            return await channel.send(**kwargs)
+
+        return await self.submit(('send', channel.id), run, f'сообщение в {channel}', priority)
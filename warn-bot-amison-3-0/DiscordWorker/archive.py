@@ -0,0 +1,134 @@
+import asyncio
+import gzip
+import heapq
+import json
+import logging
+import os
+import zlib
+from datetime import datetime, timedelta
+
+log = logging.getLogger('bot.storage')
+
+
+def created_at(ticket_data):
+    return ticket_data.get('created_at') or ''
+
+
+# 🔹 Архив удалённых заявок
+class TicketArchive:
+    """
+    Удалённые заявки старше retain_days уходят из основного хранилища в сжатые
+    сегменты по месяцам удаления: <directory>/tickets-ГГГГ-ММ.jsonl.gz.
+    Сегменты только дописываются — каждая пачка становится отдельным gzip-блоком,
+    уже записанные данные не переписываются. История читается лениво, от новых
+    сегментов к старым, и останавливается, как только набрана страница.
+    """
+
+    PREFIX = 'tickets-'
+    SUFFIX = '.jsonl.gz'
+
+    def __init__(self, directory, retain_days=30.0, batch_size=5000):
+        self.directory = directory
+        self.retain_days = retain_days
+        self.batch_size = batch_size
+        self.archived = 0
+
+    def cutoff(self):
+        """Заявки, удалённые раньше этого момента (ISO-строка, как updated_at), архивируются"""
+        return (datetime.now() - timedelta(days=self.retain_days)).isoformat()
+
+    def _segment(self, ticket_data):
+        month = (ticket_data.get('updated_at') or ticket_data.get('created_at') or '0000-00')[:7]
+        return os.path.join(self.directory, f'{self.PREFIX}{month}{self.SUFFIX}')
+
+    def append(self, tickets):
+        """Дописать заявки в сегменты их месяцев (в рабочем потоке), по одному fsync на сегмент"""
+        if not tickets:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        segments = {}
+        for ticket_data in tickets:
+            segments.setdefault(self._segment(ticket_data), []).append(json.dumps(ticket_data, ensure_ascii=False))
+        for path, lines in segments.items():
+            with open(path, 'ab') as raw:
+                with gzip.GzipFile(fileobj=raw, mode='ab') as f:
+                    f.write(('\n'.join(lines) + '\n').encode('utf-8'))
+                raw.flush()
+                os.fsync(raw.fileno())
+        self.archived += len(tickets)
+
+    def segments(self):
+        """Пути сегментов, новые первыми"""
+        if not os.path.isdir(self.directory):
+            return []
+        names = [name for name in os.listdir(self.directory)
+                 if name.startswith(self.PREFIX) and name.endswith(self.SUFFIX)]
+        return [os.path.join(self.directory, name) for name in sorted(names, reverse=True)]
+
+    def _user_tickets(self, path, guild_id, user_id):
+        """Заявки пользователя из одного сегмента, новые первыми"""
+        # Быстрый отсев строк без разбора JSON
+        needle = f'"user_id": "{user_id}"'
+        found = []
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                for line in f:
+                    if needle not in line:
+                        continue
+                    ticket_data = json.loads(line)
+                    if ticket_data.get('guild_id') == guild_id:
+                        found.append(ticket_data)
+        except (EOFError, OSError, zlib.error, ValueError) as e:
+            # Недописанный последний блок (сбой во время записи) — берём то, что прочиталось
+            log.warning('Сегмент архива %s прочитан не полностью: %s', path, e)
+        found.reverse()
+        return found
+
+    def iter_history(self, guild_id, user_id):
+        """
+        Ленивый обход архивных заявок пользователя по created_at, новые первыми;
+        повторы после прерванной архивации пропускаются. Заявка лежит в сегменте месяца
+        удаления и создана не позже него, поэтому после сегмента месяца М всё созданное
+        с начала М уже прочитано и отдаётся, остальное ждёт более старых сегментов.
+        """
+        guild_id, user_id = str(guild_id), str(user_id)
+        seen = set()
+        pending = []
+        for path in self.segments():
+            for ticket_data in self._user_tickets(path, guild_id, user_id):
+                key = ticket_data['ticket_number']
+                if key not in seen:
+                    seen.add(key)
+                    pending.append(ticket_data)
+            month = os.path.basename(path)[len(self.PREFIX):-len(self.SUFFIX)]
+            pending.sort(key=created_at, reverse=True)
+            ready = 0
+            while ready < len(pending) and created_at(pending[ready]) >= month:
+                ready += 1
+            yield from pending[:ready]
+            del pending[:ready]
+        yield from pending
+
+    def _history(self, guild_id, user_id, skip, limit, merge=()):
+        """Страница истории; merge — заявки из хранилища (новые первыми), вливаются по created_at"""
+        numbers = {ticket_data['ticket_number'] for ticket_data in merge}
+        archived = (ticket_data for ticket_data in self.iter_history(guild_id, user_id)
+                    if ticket_data['ticket_number'] not in numbers)
+        page = []
+        for ticket_data in heapq.merge(merge, archived, key=created_at, reverse=True):
+            if skip:
+                skip -= 1
+                continue
+            page.append(ticket_data)
+            if len(page) >= limit:
+                break
+        return page
+
+    async def history(self, guild_id, user_id, skip=0, limit=10, merge=()):
+        """Страница истории вместе с заявками merge; чтение сегментов — в отдельном потоке"""
+        if limit <= 0:
+            return []
+        return await asyncio.to_thread(self._history, guild_id, user_id, skip, limit, merge)
+
+    def stats(self):
+        return {'archived': self.archived}
@@ -0,0 +1,996 @@
+"""
+Офлайн-нагрузочный стенд: настоящие обработчики bot.py на локальных заглушках Discord.
+
+    python bench.py --tickets 100000 --warned-users 50000 --warns 20000 --nicks 2000 --views 1000
+    python bench.py --backend sqlite --latency 0.05 --rate-limit 5/1 --json result.json
+    python bench.py --baseline result.json --tolerance 0.25   # код выхода 1 при регрессии
+    python bench.py --backend sqlite --processes 4           # 4 процесса-шарда с общей базой
+    python bench.py --codecs                                 # форматы снимков и память на 100k заявок
+
+Сервер, участники, роли, каналы, сообщения и взаимодействия подменены объектами
+из этого файла, а каждый вызов REST проходит через FakeHTTP с настраиваемой
+задержкой и лимитами. Вызываются настоящие on_message, check_nickname и
+callback-и кнопок заявок (через WhitelistButton, как при нажатии).
+"""
+import argparse
+import asyncio
+import gc
+import itertools
+import json
+import logging
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import discord
+
+from snapshot_codec import CODECS, get_codec
+from storage import TicketStore, WarnStore
+
+GUILD_ID = 1037346178846703727
+BOT_USER_ID = 1000000000000000001
+WARN_BOT_ID = 1000000000000000002
+FIRST_MEMBER_ID = 200000000000000000
+
+
+# 🔹 Фейковый HTTP-слой
+class FakeHTTP:
+    """
+    Задержка на каждый запрос плюс лимит limit запросов за per секунд на маршрут
+    и его основной параметр (сервер/канал) — как бакеты Discord. При исчерпании
+    запрос ждёт сброса бакета (discord.py делает так же после 429).
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, limit=0, per=1.0, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.limit = limit
+        self.per = per
+        self.random = random.Random(seed)
+        self.requests = {}
+        self.rate_limited = {}
+        self.rate_limit_wait = {}
+        self._buckets = {}
+
+    def totals(self):
+        return (
+            sum(self.requests.values()),
+            sum(self.rate_limited.values()),
+            sum(self.rate_limit_wait.values())
+        )
+
+    async def request(self, method, path, major):
+        route = f'{method} {path}'
+        loop = asyncio.get_running_loop()
+        if self.limit:
+            key = (route, major)
+            while True:
+                now = loop.time()
+                bucket = self._buckets.get(key)
+                if bucket is None or now >= bucket[1]:
+                    bucket = self._buckets[key] = [self.limit, now + self.per]
+                if bucket[0] > 0:
+                    bucket[0] -= 1
+                    break
+                wait = bucket[1] - now
+                self.rate_limited[route] = self.rate_limited.get(route, 0) + 1
+                self.rate_limit_wait[route] = self.rate_limit_wait.get(route, 0.0) + wait
+                await asyncio.sleep(wait)
+
+        self.requests[route] = self.requests.get(route, 0) + 1
+        delay = self.latency + (self.random.uniform(0, self.jitter) if self.jitter else 0.0)
+        await asyncio.sleep(delay)
+
+
+# 🔹 Заглушки объектов Discord
+class _Snowflakes:
+    def __init__(self, start):
+        self.next_id = start
+
+    def __call__(self):
+        self.next_id += 1
+        return self.next_id
+
+
+SNOWFLAKE_START = 1500000000000000000
+# Свой диапазон id у каждого процесса-шарда: id не совпадают с историческими данными и между шардами
+SHARD_SNOWFLAKES = 10 ** 15
+
+snowflake = _Snowflakes(SNOWFLAKE_START)
+
+
+class FakeRole:
+    __slots__ = ('id', 'name', 'guild')
+
+    def __init__(self, guild, role_id, name):
+        self.id = role_id
+        self.name = name
+        self.guild = guild
+
+    @property
+    def mention(self):
+        return f'<@&{self.id}>'
+
+    def __str__(self):
+        return self.name
+
+
+class FakeMember:
+    __slots__ = ('id', 'name', 'guild', 'bot', 'created_at', 'joined_at', '_roles')
+
+    def __init__(self, guild, member_id, name, created_at, joined_at=None, bot=False):
+        self.id = member_id
+        self.name = name
+        self.guild = guild
+        self.bot = bot
+        self.created_at = created_at
+        self.joined_at = joined_at
+        self._roles = {}
+
+    @property
+    def mention(self):
+        return f'<@{self.id}>'
+
+    @property
+    def display_avatar(self):
+        return SimpleNamespace(url=f'https://cdn.discordapp.com/embed/avatars/{self.id % 5}.png')
+
+    @property
+    def roles(self):
+        return [self.guild.default_role, *self._roles.values()]
+
+    def get_role(self, role_id):
+        return self._roles.get(role_id)
+
+    async def add_roles(self, *roles, reason=None):
+        for role in roles:
+            await self.guild.http.request('PUT', '/guilds/{guild_id}/members/{user_id}/roles/{role_id}', self.guild.id)
+            self._roles[role.id] = role
+
+    async def remove_roles(self, *roles, reason=None):
+        for role in roles:
+            await self.guild.http.request('DELETE', '/guilds/{guild_id}/members/{user_id}/roles/{role_id}', self.guild.id)
+            self._roles.pop(role.id, None)
+
+    async def edit(self, roles=None, reason=None):
+        await self.guild.http.request('PATCH', '/guilds/{guild_id}/members/{user_id}', self.guild.id)
+        if roles is not None:
+            self._roles = {role.id: role for role in roles if role is not self.guild.default_role}
+
+    async def timeout(self, until, reason=None):
+        await self.guild.http.request('PATCH', '/guilds/{guild_id}/members/{user_id}', self.guild.id)
+
+    def __str__(self):
+        return self.name
+
+
+class FakeCategory:
+    __slots__ = ('id', 'name', 'guild')
+
+    def __init__(self, guild, category_id, name):
+        self.id = category_id
+        self.name = name
+        self.guild = guild
+
+
+class FakeTextChannel:
+    def __init__(self, guild, channel_id, name, overwrites=None, category=None, topic=None):
+        self.id = channel_id
+        self.name = name
+        self.guild = guild
+        self.category = category
+        self.topic = topic
+        self.messages_sent = 0
+        self.messages = []
+        self._overwrites = dict(overwrites or {})
+
+    @property
+    def mention(self):
+        return f'<#{self.id}>'
+
+    @property
+    def overwrites(self):
+        # Как в discord.py: каждый раз новые объекты PermissionOverwrite
+        return {target: discord.PermissionOverwrite.from_pair(*overwrite.pair())
+                for target, overwrite in self._overwrites.items()}
+
+    async def send(self, content=None, **kwargs):
+        await self.guild.http.request('POST', '/channels/{channel_id}/messages', self.id)
+        self.messages_sent += 1
+        message = FakeSentMessage(self, content, kwargs.get('embeds') or ([kwargs['embed']] if kwargs.get('embed') else ()))
+        self.messages.append(message)
+        return message
+
+    def add_message(self, author, content):
+        """Сообщение участника в канале (без REST)"""
+        self.messages.append(FakeMessage(author, self.guild, self, [], content))
+
+    async def history(self, limit=None, after=None, oldest_first=True):
+        """Как discord.py: REST-страницы по 100 сообщений"""
+        messages = [message for message in self.messages if after is None or message.id > after.id]
+        if not oldest_first:
+            messages.reverse()
+        for start in range(0, len(messages[:limit]), 100):
+            await self.guild.http.request('GET', '/channels/{channel_id}/messages', self.id)
+            for message in messages[start:start + 100]:
+                yield message
+
+    async def edit(self, **fields):
+        await self.guild.http.request('PATCH', '/channels/{channel_id}', self.id)
+        if 'overwrites' in fields:
+            self._overwrites = dict(fields['overwrites'])
+        if 'name' in fields:
+            self.name = fields['name']
+        return self
+
+    async def delete(self, reason=None):
+        await self.guild.http.request('DELETE', '/channels/{channel_id}', self.id)
+        self.guild.channels.pop(self.id, None)
+
+    def __str__(self):
+        return self.name
+
+
+class FakeSentMessage:
+    __slots__ = ('id', 'channel', 'content', 'author', 'created_at', 'embeds', 'attachments')
+
+    def __init__(self, channel, content, embeds=()):
+        self.id = snowflake()
+        self.channel = channel
+        self.content = content
+        self.author = channel.guild.me
+        self.created_at = datetime.now(timezone.utc)
+        self.embeds = list(embeds)
+        self.attachments = ()
+
+    async def edit(self, content=None, **kwargs):
+        await self.channel.guild.http.request('PATCH', '/channels/{channel_id}/messages/{message_id}', self.channel.id)
+        self.content = content
+        return self
+
+
+class FakeGuild:
+    def __init__(self, http, guild_id, role_ids, role_names, category_name, log_channel_id):
+        self.id = guild_id
+        self.name = 'bench'
+        self.http = http
+        self.filesize_limit = 10 * 1024 * 1024
+        self.default_role = FakeRole(self, guild_id, '@everyone')
+        self._roles = {guild_id: self.default_role}
+        for role_id in role_ids:
+            self._roles[role_id] = FakeRole(self, role_id, f'role-{role_id}')
+        for name in role_names:
+            role_id = snowflake()
+            self._roles[role_id] = FakeRole(self, role_id, name)
+        self.channels = {}
+        category = FakeCategory(self, snowflake(), category_name)
+        self.channels[category.id] = category
+        self.channels[log_channel_id] = FakeTextChannel(self, log_channel_id, 'логи')
+        self._members = {}
+        # lean — как MemberCacheFlags.none(): get_member() видит только самого бота
+        self.lean = False
+        self.me = self.add_member(BOT_USER_ID, 'amison-bot', bot=True)
+        self.ticket_channels = []
+
+    @property
+    def roles(self):
+        return list(self._roles.values())
+
+    @property
+    def members(self):
+        return list(self._members.values())
+
+    @property
+    def categories(self):
+        return [channel for channel in self.channels.values() if isinstance(channel, FakeCategory)]
+
+    def add_member(self, member_id, name, created_at=None, bot=False):
+        created_at = created_at or datetime.now(timezone.utc) - timedelta(days=365)
+        member = self._members[member_id] = FakeMember(self, member_id, name, created_at, created_at, bot)
+        return member
+
+    def get_role(self, role_id):
+        return self._roles.get(role_id)
+
+    @property
+    def member_count(self):
+        return len(self._members)
+
+    def get_member(self, member_id):
+        if self.lean and member_id != BOT_USER_ID:
+            return None
+        return self._members.get(member_id)
+
+    @property
+    def chunked(self):
+        return not self.lean
+
+    async def fetch_members(self, limit=None):
+        """Как discord.py: REST-страницы по 1000 участников"""
+        members = list(self._members.values())[:limit]
+        for start in range(0, len(members), 1000):
+            await self.http.request('GET', '/guilds/{guild_id}/members', self.id)
+            for member in members[start:start + 1000]:
+                yield member
+
+    async def fetch_member(self, member_id):
+        await self.http.request('GET', '/guilds/{guild_id}/members/{user_id}', self.id)
+        member = self._members.get(member_id)
+        if member is None:
+            raise discord.NotFound(SimpleNamespace(status=404, reason='Not Found'), 'Unknown Member')
+        return member
+
+    def get_channel(self, channel_id):
+        return self.channels.get(channel_id)
+
+    async def create_text_channel(self, name, overwrites=None, category=None, topic=None):
+        await self.http.request('POST', '/guilds/{guild_id}/channels', self.id)
+        channel = FakeTextChannel(self, snowflake(), name, overwrites, category, topic)
+        self.channels[channel.id] = channel
+        self.ticket_channels.append(channel)
+        return channel
+
+
+class FakeMessage:
+    __slots__ = ('id', 'author', 'guild', 'channel', 'embeds', 'content', 'created_at', 'attachments')
+
+    def __init__(self, author, guild, channel, embeds, content=''):
+        self.id = snowflake()
+        self.created_at = datetime.now(timezone.utc)
+        self.author = author
+        self.guild = guild
+        self.channel = channel
+        self.embeds = embeds
+        self.content = content
+        self.attachments = ()
+
+
+class FakeResponse:
+    def __init__(self, interaction):
+        self._interaction = interaction
+        self._done = False
+
+    def is_done(self):
+        return self._done
+
+    async def _callback(self):
+        if self._done:
+            raise discord.InteractionResponded(self._interaction)
+        self._done = True
+        await self._interaction.http.request('POST', '/interactions/{interaction_id}/{token}/callback', self._interaction.id)
+
+    async def send_message(self, content=None, **kwargs):
+        await self._callback()
+
+    async def edit_message(self, **kwargs):
+        await self._callback()
+
+    async def defer(self, **kwargs):
+        await self._callback()
+
+
+class FakeInteraction:
+    def __init__(self, http, user, channel):
+        self.id = snowflake()
+        self.http = http
+        self.user = user
+        self.guild = channel.guild
+        self.guild_id = channel.guild.id
+        self.channel = channel
+        self.response = FakeResponse(self)
+        self.followup = SimpleNamespace(send=self._webhook)
+
+    async def _webhook(self, *args, **kwargs):
+        await self.http.request('POST', '/webhooks/{application_id}/{token}', self.id)
+
+    async def edit_original_response(self, **kwargs):
+        await self.http.request('PATCH', '/webhooks/{application_id}/{token}/messages/@original', self.id)
+
+
+class FakeContext:
+    def __init__(self, guild, author, channel):
+        self.guild = guild
+        self.author = author
+        self.channel = channel
+
+    async def send(self, content=None, **kwargs):
+        return await self.channel.send(content, **kwargs)
+
+
+# 🔹 Исторические данные
+def seed_data(workdir, tickets, warned_users, member_ids, seed, guild_ids=(GUILD_ID,)):
+    """Снимки warns.json / whitelist_tickets.json в формате бота; данные делятся поровну между серверами"""
+    rng = random.Random(seed)
+    guild_ids = [str(guild_id) for guild_id in guild_ids]
+
+    started = datetime.now() - timedelta(days=365)
+    warned_at = started.timestamp()
+    warns = {guild_id: {str(user_id): [[warned_at, snowflake(), 'spam'] for _ in range(rng.randint(1, 3))]
+                        for user_id in rng.sample(member_ids, warned_users // len(guild_ids))}
+             for guild_id in guild_ids}
+    ticket_data = {}
+    for number in range(1, tickets + 1):
+        guild_id = guild_ids[number % len(guild_ids)]
+        user_id = str(rng.choice(member_ids))
+        created = (started + timedelta(seconds=number * 60)).isoformat()
+        ticket_data[f'{guild_id}_{user_id}_{number}'] = {
+            'ticket_number': number,
+            'guild_id': guild_id,
+            'user_id': user_id,
+            'channel_id': str(snowflake()),
+            'nickname': f'Player{number}',
+            'status': rng.choice(('deleted', 'deleted', 'deleted', 'approved', 'denied', 'closed')),
+            'created_at': created,
+            'updated_at': created
+        }
+
+    warns_file = os.path.join(workdir, 'warns.json')
+    tickets_file = os.path.join(workdir, 'whitelist_tickets.json')
+    with open(warns_file, 'w', encoding='utf-8') as f:
+        json.dump(warns, f)
+    with open(tickets_file, 'w', encoding='utf-8') as f:
+        json.dump({'last_ticket_number': tickets, 'tickets': ticket_data}, f, indent=2, ensure_ascii=False)
+    return warns_file, tickets_file
+
+
+# 🔹 Измерения
+def bytes_written(workdir):
+    """Байты, записанные процессом (Linux /proc/self/io), иначе размер рабочего каталога"""
+    try:
+        with open('/proc/self/io') as f:
+            for line in f:
+                if line.startswith('wchar:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return sum(entry.stat().st_size for entry in os.scandir(workdir) if entry.is_file())
+
+
+class ErrorCounter(logging.Handler):
+    """Обработчики бота не пробрасывают исключения, а пишут ERROR в лог — считаем их"""
+
+    def __init__(self):
+        super().__init__(logging.ERROR)
+        self.count = 0
+        self.samples = []
+
+    def emit(self, record):
+        self.count += 1
+        if len(self.samples) < 5:
+            self.samples.append(record.getMessage())
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(int(q * len(sorted_values)), len(sorted_values) - 1)]
+
+
+class Measurement:
+    """Время, REST-запросы, 429, записанные байты и выделения памяти для одного сценария"""
+
+    def __init__(self, name, http, errors, workdir):
+        self.name = name
+        self.http = http
+        self.errors = errors
+        self.workdir = workdir
+        self.latencies = {}
+
+    def record(self, op, seconds):
+        self.latencies.setdefault(op, []).append(seconds)
+
+    def __enter__(self):
+        self._errors = self.errors.count
+        self._http = self.http.totals()
+        self._bytes = bytes_written(self.workdir)
+        self._blocks = sys.getallocatedblocks()
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+            self._traced = tracemalloc.get_traced_memory()[0]
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self._started
+        self.bytes = bytes_written(self.workdir) - self._bytes
+        self.blocks = sys.getallocatedblocks() - self._blocks
+        self.traced_peak = None
+        if tracemalloc.is_tracing():
+            self.traced_peak = tracemalloc.get_traced_memory()[1] - self._traced
+        requests, rate_limited, waited = self.http.totals()
+        self.requests = requests - self._http[0]
+        self.rate_limited = rate_limited - self._http[1]
+        self.rate_limit_wait = waited - self._http[2]
+        self.error_count = self.errors.count - self._errors
+
+    def result(self, ops):
+        result = {
+            'ops': ops,
+            'seconds': round(self.elapsed, 4),
+            'throughput': round(ops / self.elapsed, 2) if self.elapsed else 0.0,
+            'errors': self.error_count,
+            'rest_requests': self.requests,
+            'rest_429': self.rate_limited,
+            'rest_429_wait_seconds': round(self.rate_limit_wait, 3),
+            'bytes_written': self.bytes,
+            'allocated_blocks': self.blocks,
+            'latency_ms': {}
+        }
+        if self.traced_peak is not None:
+            result['traced_peak_bytes'] = self.traced_peak
+        for op, values in self.latencies.items():
+            values.sort()
+            result['latency_ms'][op] = {
+                'p50': round(percentile(values, 0.5) * 1000, 3),
+                'p95': round(percentile(values, 0.95) * 1000, 3),
+                'p99': round(percentile(values, 0.99) * 1000, 3),
+                'max': round(values[-1] * 1000, 3)
+            }
+        return result
+
+
+async def drive(count, op, rate, concurrency, measurement, name):
+    """
+    rate > 0 — открытая нагрузка: запуск по расписанию, задержка считается от
+    запланированного момента (включая ожидание свободного слота).
+    rate == 0 — закрытая: concurrency обработчиков без пауз.
+    """
+    loop = asyncio.get_running_loop()
+    if not rate:
+        indexes = iter(range(count))
+
+        async def worker():
+            for i in indexes:
+                started = loop.time()
+                await op(i)
+                measurement.record(name, loop.time() - started)
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return
+
+    slots = asyncio.Semaphore(concurrency)
+    pending = set()
+
+    async def run(i, scheduled):
+        async with slots:
+            await op(i)
+        measurement.record(name, loop.time() - scheduled)
+
+    started = loop.time()
+    for i in range(count):
+        scheduled = started + i / rate
+        delay = scheduled - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        task = loop.create_task(run(i, scheduled))
+        pending.add(task)
+        task.add_done_callback(pending.discard)
+    if pending:
+        await asyncio.gather(*pending)
+
+
+# 🔹 Сценарии
+async def run_bench(args, workdir, guild_id=GUILD_ID):
+    import bot as bot_module
+
+    http = FakeHTTP(args.latency, args.jitter, *args.rate_limit, seed=args.seed)
+    guild = FakeGuild(
+        http, guild_id,
+        role_ids=(bot_module.ADMIN_ROLE_ID, bot_module.MOD_ROLE_ID, bot_module.OWNER_ROLE_ID, bot_module.PERMA_BAN_ROLE_ID),
+        role_names=bot_module.warn_rules.value.ladder(guild_id).role_names,
+        category_name=bot_module.TICKETS_CATEGORY_NAME,
+        log_channel_id=bot_module.LOG_CHANNEL_ID
+    )
+    rng = random.Random(args.seed)
+    now = datetime.now(timezone.utc)
+    for member_id in range(FIRST_MEMBER_ID, FIRST_MEMBER_ID + args.members):
+        guild.add_member(member_id, f'user{member_id - FIRST_MEMBER_ID}', now - timedelta(days=rng.randint(1, 3000)))
+    member_ids = list(range(FIRST_MEMBER_ID, FIRST_MEMBER_ID + args.members))
+    perma_ban = guild.get_role(bot_module.PERMA_BAN_ROLE_ID)
+    for member_id in rng.sample(member_ids, args.members // 50):
+        guild._members[member_id]._roles[perma_ban.id] = perma_ban
+
+    moderator = guild.add_member(snowflake(), 'owner')
+    for role_id in (bot_module.ADMIN_ROLE_ID, bot_module.OWNER_ROLE_ID):
+        moderator._roles[role_id] = guild.get_role(role_id)
+    warn_bot = guild.add_member(WARN_BOT_ID, 'moderation-bot', bot=True)
+    warn_channel = FakeTextChannel(guild, snowflake(), 'наказания')
+    commands_channel = FakeTextChannel(guild, snowflake(), 'заявки')
+    guild.channels[warn_channel.id] = warn_channel
+    guild.channels[commands_channel.id] = commands_channel
+
+    guild.lean = bot_module.LEAN_MEMBERS
+    bot_module.bot.get_guild = {guild.id: guild}.get
+
+    errors = ErrorCounter()
+    bot_logger = logging.getLogger('bot')
+    bot_logger.setLevel(logging.WARNING)
+    bot_logger.addHandler(errors)
+
+    results = {}
+
+    def measure(name):
+        return Measurement(name, http, errors, workdir)
+
+    with measure('load') as m:
+        await bot_module.storage.open()
+    results['load'] = m.result(1)
+    bot_module.actions.start()
+
+    # Варны: embed [WARN] от бота модерации
+    def warn_message(i):
+        embed = discord.Embed(title='Warn')
+        embed.set_author(name=f'[WARN] case {i}')
+        embed.add_field(name='User', value=f'<@{rng.choice(member_ids)}>')
+        embed.add_field(name='Reason', value='spam')
+        return FakeMessage(warn_bot, guild, warn_channel, [embed])
+
+    async def warn_op(i):
+        await bot_module.on_message(warn_message(i))
+
+    if args.warns:
+        with measure('warns') as m:
+            await drive(args.warns, warn_op, args.rate, args.concurrency, m, 'on_message')
+            await bot_module.actions.drain()
+            await bot_module.storage.flush()
+        results['warns'] = m.result(args.warns)
+
+    # Заявки: !nick от случайных участников
+    async def nick_op(i):
+        ctx = FakeContext(guild, guild._members[rng.choice(member_ids)], commands_channel)
+        await bot_module.check_nickname.callback(ctx, f'Player{i}')
+
+    if args.nicks:
+        with measure('nick') as m:
+            await drive(args.nicks, nick_op, args.rate, args.concurrency, m, 'check_nickname')
+            await bot_module.actions.drain()
+            await bot_module.storage.flush()
+        results['nick'] = m.result(args.nicks)
+
+    # Кнопки: полный цикл заявки approve/deny → close → reopen → close → delete
+    channels = guild.ticket_channels[:args.views]
+
+    async def views_op(i):
+        channel = channels[i]
+        ticket_number = int(channel.name.rsplit('-', 1)[1])
+        # Переписка в канале заявки — сохраняется перед удалением канала
+        for k in range(args.ticket_messages):
+            channel.add_message(moderator, f'Сообщение {k} в заявке #{ticket_number}')
+        decision = 'approve' if i % 2 else 'deny'
+        for action in (decision, 'close', 'reopen', 'close', 'delete'):
+            started = time.perf_counter()
+            interaction = FakeInteraction(http, moderator, channel)
+            await bot_module.WhitelistButton(action, ticket_number).callback(interaction)
+            m.record(f'view.{action}', time.perf_counter() - started)
+
+    async def rewrite_config():
+        """Перезапись файла настроек серверов во время нажатий: те же значения, другой размер файла"""
+        config_file = bot_module.guild_configs
+        for k in itertools.count():
+            with open(config_file.path, 'w', encoding='utf-8') as f:
+                json.dump({'default': dict(bot_module.DEFAULT_GUILD_CONFIG)}, f, indent=k % 2 + 1)
+            await config_file.check()
+            await asyncio.sleep(0.02)
+
+    if channels:
+        with measure('views') as m:
+            reloads = asyncio.ensure_future(rewrite_config()) if args.config_reloads else None
+            await drive(len(channels), views_op, args.rate, args.concurrency, m, 'ticket_lifecycle')
+            if reloads is not None:
+                reloads.cancel()
+                print('Перезагрузок настроек серверов во время нажатий:', bot_module.guild_configs.reloads)
+            await bot_module.actions.drain()
+            await bot_module.notifier.close()
+            await bot_module.actions.drain()
+            await bot_module.storage.flush()
+        results['views'] = m.result(len(channels))
+
+    # Сверка ролей варнов: пробная (только подсчёт) и с исправлением
+    if args.reconcile:
+        for name, dry_run in (('reconcile_dry', True), ('reconcile', False)):
+            with measure(name) as m:
+                started = time.perf_counter()
+                report = await bot_module.reconciler.run(guild, dry_run)
+                m.record(name, time.perf_counter() - started)
+                await bot_module.actions.drain()
+            results[name] = m.result(report['members'])
+            print(f'{name}: изменений {report["changes"]} (+{report["added"]}/-{report["removed"]}), '
+                  f'ошибок {report["failed"]}')
+
+    with measure('close') as m:
+        await bot_module.actions.close()
+        await bot_module.storage.close()
+    results['close'] = m.result(1)
+
+    print('Кэш участников:', bot_module.member_cache.stats([guild]))
+    print('Разбор варнов:', bot_module.warn_rules.value.stats())
+    print('Права участников:', bot_module.permissions.stats())
+    if errors.samples:
+        print('Ошибки обработчиков (первые):', *errors.samples, sep='\n  ', file=sys.stderr)
+    return results
+
+
+# 🔹 Отчёт и сравнение с эталоном
+def print_report(results):
+    print(f'{"сценарий":<10} {"ops":>7} {"ops/s":>9} {"ошибки":>6} {"REST":>7} {"429":>5} {"записано":>10} {"блоки":>9}')
+    for name, result in results.items():
+        print(f'{name:<10} {result["ops"]:>7} {result["throughput"]:>9.1f} {result["errors"]:>6} '
+              f'{result["rest_requests"]:>7} {result["rest_429"]:>5} {result["bytes_written"] / 1024:>8.0f}КБ '
+              f'{result["allocated_blocks"]:>9}')
+        for op, latency in result['latency_ms'].items():
+            print(f'    {op:<22} p50 {latency["p50"]:>9.2f}  p95 {latency["p95"]:>9.2f}  '
+                  f'p99 {latency["p99"]:>9.2f}  max {latency["max"]:>9.2f} мс')
+
+
+def compare(results, baseline, tolerance):
+    """Регрессии относительно эталона: падение пропускной способности или рост p99 больше tolerance"""
+    regressions = []
+    for name, base in baseline.items():
+        current = results.get(name)
+        if current is None or name in ('load', 'close'):
+            continue
+        if current['throughput'] < base['throughput'] * (1 - tolerance):
+            regressions.append(f'{name}: пропускная способность {current["throughput"]} < {base["throughput"]}')
+        for op, base_latency in base['latency_ms'].items():
+            latency = current['latency_ms'].get(op)
+            if latency and latency['p99'] > base_latency['p99'] * (1 + tolerance):
+                regressions.append(f'{name}/{op}: p99 {latency["p99"]} мс > {base_latency["p99"]} мс')
+    return regressions
+
+
+# 🔹 Форматы снимков и память заявок
+def convert_snapshots(warns_file, tickets_file, codec):
+    """Переписать снимки стенда в формат codec (до запуска бота)"""
+    for store in (WarnStore(warns_file, get_codec(codec)), TicketStore(tickets_file, get_codec(codec))):
+        store.load().write_snapshot(store.snapshot())
+
+
+def resident_bytes():
+    """Резидентная память процесса (Linux /proc/self/statm), иначе пиковая из getrusage"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def probe_memory(kind, workdir):
+    """
+    Прирост резидентной памяти после загрузки заявок (в отдельном процессе, чтобы
+    освобождённая память прошлых замеров не искажала результат): records — TicketStore
+    из компактного снимка, dicts — словари прежнего формата, как их держало хранилище.
+    """
+    gc.collect()
+    before = resident_bytes()
+    if kind == 'records':
+        loaded = TicketStore(os.path.join(workdir, 'compact', 'whitelist_tickets.json'), get_codec('compact')).load()
+    else:
+        with open(os.path.join(workdir, 'whitelist_tickets.json'), 'r', encoding='utf-8') as f:
+            loaded = json.load(f)['tickets']
+    gc.collect()
+    return {'resident_bytes': resident_bytes() - before, 'tickets': len(loaded)}
+
+
+def run_codec_bench(workdir, warns_file, tickets_file):
+    """Запись и загрузка снимков заявок и варнов в каждом формате, размер файлов, память на 100k заявок"""
+    results = {}
+    for codec in CODECS.values():
+        directory = os.path.join(workdir, codec.name)
+        os.makedirs(directory)
+        result = results[codec.name] = {}
+        for label, store_class, source in (('tickets', TicketStore, tickets_file), ('warns', WarnStore, warns_file)):
+            path = os.path.join(directory, os.path.basename(source))
+            shutil.copy(source, path)
+            store = store_class(path, codec).load()
+            started = time.perf_counter()
+            store.write_snapshot(store.snapshot())
+            result[f'{label}_save_seconds'] = round(time.perf_counter() - started, 4)
+            started = time.perf_counter()
+            store_class(path, codec).load()
+            result[f'{label}_load_seconds'] = round(time.perf_counter() - started, 4)
+            result[f'{label}_file_bytes'] = os.path.getsize(codec.path(path))
+
+    memory = results['memory_per_100k'] = {}
+    for kind in ('records', 'dicts'):
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), '--memory-probe', kind, '--workdir', workdir],
+                                check=True, capture_output=True, text=True).stdout
+        probe = json.loads(output)
+        memory[kind] = round(probe['resident_bytes'] * 100000 / max(probe['tickets'], 1))
+    return results
+
+
+def print_codec_report(results):
+    print(f'{"формат":<8} {"заявки: запись":>15} {"загрузка":>9} {"файл":>9}   '
+          f'{"варны: запись":>14} {"загрузка":>9} {"файл":>9}')
+    for name in CODECS:
+        result = results[name]
+        print(f'{name:<8} {result["tickets_save_seconds"]:>13.3f} с {result["tickets_load_seconds"]:>7.3f} с '
+              f'{result["tickets_file_bytes"] / 1024 ** 2:>6.1f} МБ   {result["warns_save_seconds"]:>12.3f} с '
+              f'{result["warns_load_seconds"]:>7.3f} с {result["warns_file_bytes"] / 1024 ** 2:>6.1f} МБ')
+    memory = results['memory_per_100k']
+    print(f'Резидентная память на 100k заявок: записи Ticket с индексами {memory["records"] / 1024 ** 2:.1f} МБ, '
+          f'словари прежнего формата (без индексов) {memory["dicts"] / 1024 ** 2:.1f} МБ')
+
+
+# 🔹 Несколько процессов с шардами и общей SQLite
+def shard_guild_id(shard, shard_count):
+    """ID сервера, который Discord отнёс бы к шарду shard"""
+    guild_id = GUILD_ID
+    while shard_count > 1 and (guild_id >> 22) % shard_count != shard:
+        guild_id += 1 << 22
+    return guild_id
+
+
+def set_bench_env(args, workdir, shard=None):
+    """До импорта bot.py: хранилище во временном каталоге, удаление канала без паузы"""
+    os.environ.update({
+        'WARNS_FILE': os.path.join(workdir, 'warns.json'),
+        'TICKETS_FILE': os.path.join(workdir, 'whitelist_tickets.json'),
+        'SQLITE_FILE': os.path.join(workdir, 'bot.db'),
+        'ARCHIVE_DIR': os.path.join(workdir, 'ticket_archive'),
+        'TRANSCRIPT_DIR': os.path.join(workdir, 'ticket_transcripts'),
+        'STORAGE_BACKEND': args.backend,
+        'STORAGE_CODEC': args.codec,
+        'TICKET_DELETE_DELAY': '0',
+        'LEAN_MEMBERS': '1' if args.lean_members else '0',
+        'WARN_RULES_FILE': os.path.abspath(args.warn_rules) if args.warn_rules else '',
+        'GUILD_CONFIG_FILE': os.path.join(workdir, 'guild_config.json')
+    })
+    if shard is not None:
+        os.environ.update({'SHARD_COUNT': str(args.processes), 'SHARD_IDS': str(shard), 'SHARD_PROCESS': str(shard)})
+
+
+def run_shard_worker(args):
+    """Рабочий процесс: один шард, свой сервер, общая база с остальными процессами"""
+    shard = int(args.shard)
+    snowflake.next_id = SNOWFLAKE_START + (shard + 1) * SHARD_SNOWFLAKES
+    set_bench_env(args, args.workdir, shard)
+    if args.trace_alloc:
+        tracemalloc.start()
+    return asyncio.run(run_bench(args, args.workdir, shard_guild_id(shard, args.processes)))
+
+
+def run_sharded(args, workdir):
+    """
+    По процессу на шард, одновременно; результаты каждого шарда — под именами
+    «сценарий#шард», плюс суммарная пропускная способность по сценарию.
+    """
+    procs = []
+    for shard in range(args.processes):
+        result_file = os.path.join(workdir, f'result-{shard}.json')
+        command = [sys.executable, os.path.abspath(__file__), *sys.argv[1:],
+                   '--shard', str(shard), '--workdir', workdir, '--json', result_file]
+        procs.append((shard, result_file, subprocess.Popen(command)))
+
+    results = {}
+    totals = {}
+    for shard, result_file, proc in procs:
+        if proc.wait() != 0:
+            print(f'Шард {shard}: процесс завершился с кодом {proc.returncode}', file=sys.stderr)
+            continue
+        with open(result_file, 'r', encoding='utf-8') as f:
+            shard_results = json.load(f)
+        for name, result in shard_results.items():
+            results[f'{name}#{shard}'] = result
+            if name in ('load', 'close'):
+                continue
+            total = totals.setdefault(name, {key: 0 for key in (
+                'ops', 'seconds', 'throughput', 'errors', 'rest_requests', 'rest_429',
+                'rest_429_wait_seconds', 'bytes_written', 'allocated_blocks')})
+            for key in total:
+                total[key] = max(total[key], result[key]) if key == 'seconds' else total[key] + result[key]
+    for name, total in totals.items():
+        total['throughput'] = round(total['throughput'], 2)
+        total['latency_ms'] = {}
+        results[f'{name}#все'] = total
+    return results
+
+
+def parse_rate_limit(value):
+    """'5/1' -> (5, 1.0): 5 запросов в секунду на бакет; '0' — без лимита"""
+    limit, _, per = value.partition('/')
+    return int(limit), float(per or 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Офлайн-нагрузочный стенд bot.py')
+    parser.add_argument('--backend', choices=('json', 'sqlite'), default='json')
+    parser.add_argument('--tickets', type=int, default=100000, help='исторических заявок в хранилище')
+    parser.add_argument('--warned-users', type=int, default=50000, help='пользователей с варнами в хранилище')
+    parser.add_argument('--members', type=int, default=60000, help='участников на сервере')
+    parser.add_argument('--warns', type=int, default=5000, help='сообщений [WARN]')
+    parser.add_argument('--nicks', type=int, default=1000, help='команд !nick')
+    parser.add_argument('--views', type=int, default=500, help='полных циклов кнопок заявки (не больше --nicks)')
+    parser.add_argument('--ticket-messages', type=int, default=50,
+                        help='сообщений в канале заявки (сохраняются в переписку перед удалением)')
+    parser.add_argument('--rate', type=float, default=0, help='операций в секунду (0 — без пауз)')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--latency', type=float, default=0.0, help='задержка REST-запроса, с')
+    parser.add_argument('--jitter', type=float, default=0.0, help='случайная добавка к задержке, с')
+    parser.add_argument('--rate-limit', type=parse_rate_limit, default=(0, 1.0), help='лимит на бакет, например 5/1')
+    parser.add_argument('--warn-rules', help='файл правил варнов (WARN_RULES_FILE)')
+    parser.add_argument('--config-reloads', action='store_true',
+                        help='перезагружать файл настроек серверов во время сценария кнопок')
+    parser.add_argument('--reconcile', action='store_true', help='сверка ролей варнов (пробная и с исправлением)')
+    parser.add_argument('--lean-members', action='store_true', help='экономный режим участников (LEAN_MEMBERS)')
+    parser.add_argument('--trace-alloc', action='store_true', help='tracemalloc (замедляет выполнение)')
+    parser.add_argument('--processes', type=int, default=1,
+                        help='процессов-шардов с общей SQLite (пропускная способность по шардам)')
+    parser.add_argument('--codec', choices=tuple(CODECS), default='json', help='формат снимков json-хранилища')
+    parser.add_argument('--codecs', action='store_true',
+                        help='только сравнение форматов снимков: запись, загрузка, память на 100k заявок')
+    parser.add_argument('--shard', help=argparse.SUPPRESS)
+    parser.add_argument('--memory-probe', choices=('records', 'dicts'), help=argparse.SUPPRESS)
+    parser.add_argument('--workdir', help=argparse.SUPPRESS)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', help='сохранить результат в файл')
+    parser.add_argument('--baseline', help='эталонный результат для сравнения')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    args = parser.parse_args()
+    if args.memory_probe:
+        print(json.dumps(probe_memory(args.memory_probe, args.workdir)))
+        return
+    args.members = max(args.members, args.warned_users)
+    if args.processes > 1 and args.backend != 'sqlite':
+        parser.error('--processes: общее состояние процессов — только --backend sqlite')
+
+    if args.shard:
+        results = run_shard_worker(args)
+    else:
+        with tempfile.TemporaryDirectory(prefix='amison-bench-') as workdir:
+            guild_ids = [shard_guild_id(shard, args.processes) for shard in range(args.processes)]
+            warns_file, tickets_file = seed_data(
+                workdir, args.tickets, args.warned_users,
+                list(range(FIRST_MEMBER_ID, FIRST_MEMBER_ID + args.members)), args.seed, guild_ids
+            )
+            sqlite_file = os.path.join(workdir, 'bot.db')
+            if args.codecs:
+                results = run_codec_bench(workdir, warns_file, tickets_file)
+                print_codec_report(results)
+                if args.json:
+                    with open(args.json, 'w', encoding='utf-8') as f:
+                        json.dump(results, f, indent=2, ensure_ascii=False)
+                return
+            if args.backend == 'sqlite':
+                from sqlite_storage import import_json
+                import_json(sqlite_file, warns_file, tickets_file)
+            elif args.codec != 'json':
+                convert_snapshots(warns_file, tickets_file, args.codec)
+
+            if args.processes > 1:
+                results = run_sharded(args, workdir)
+            else:
+                set_bench_env(args, workdir)
+                if args.trace_alloc:
+                    tracemalloc.start()
+                results = asyncio.run(run_bench(args, workdir, guild_ids[0]))
+
+    if args.shard:
+        # Рабочий процесс отдаёт результат родителю через файл
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f)
+        return
+
+    print_report(results)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print('РЕГРЕССИЯ:', regression)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
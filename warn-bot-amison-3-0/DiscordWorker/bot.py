@@ -1,173 +1,259 @@
 import discord
-from discord.ext import commands
-from discord.ui import View, Button
-import json
+from discord.ext import commands, tasks
+from discord.ui import View, Button, DynamicItem
+import asyncio
+import logging
 import os
-import re
-from datetime import datetime
+from datetime import datetime, timedelta
 
-# 🔹 1. Flask-сервер для UptimeRobot
-from flask import Flask
-import threading
+from actions import ActionScheduler
+from archive import TicketArchive
+from config_file import ConfigFile
+from guild_cache import GuildCache
+from guild_config import DECISION, OWNER, GuildConfigs, PermissionResolver
+from logging_setup import parse_levels, setup_logging
+from member_cache import MemberCache
+from metrics import metrics
+from notifications import NotificationBatcher
+from reconcile import WarnRoleReconciler
+from shards import ShardConfig
+from storage import open_backend
+from transcripts import TranscriptStore
+from warn_backfill import WarnBackfill
+from warn_expiry import DAY, WarnExpiryScheduler, parse_windows
+from warn_parser import WarnParser, ladder_diff
+from web import HealthServer, prefixed
 
-# 🔹 Загрузка переменных окружения из .env
+log = logging.getLogger('bot')
+warns_log = logging.getLogger('bot.warns')
+tickets_log = logging.getLogger('bot.tickets')
+views_log = logging.getLogger('bot.views')
+storage_log = logging.getLogger('bot.storage')
+
+# 🔹 1. Загрузка переменных окружения из .env
 from dotenv import load_dotenv
 load_dotenv()
 
-app = Flask(__name__)
-
-@app.route('/')
-def home():
-    return "Bot is alive!"
-
-def run_web():
-    try:
-        app.run(host="0.0.0.0", port=5000, use_reloader=False)
-    except OSError as e:
-        print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] Flask сервер не смог запуститься: {e}')
-
-threading.Thread(target=run_web, daemon=True).start()
-
 
 # 🔹 2. Настройки Discord
 intents = discord.Intents.default()
 intents.message_content = True
 intents.members = True
 
-bot = commands.Bot(command_prefix='!', intents=intents)
+# Экономный режим: без загрузки всех участников при старте и без кэша сообщений,
+# участники запрашиваются по необходимости через member_cache
+LEAN_MEMBERS = os.getenv('LEAN_MEMBERS', '').lower() in ('1', 'true', 'yes')
+bot_options = {}
+if LEAN_MEMBERS:
+    bot_options.update(
+        chunk_guilds_at_startup=False,
+        member_cache_flags=discord.MemberCacheFlags.none(),
+        max_messages=None
+    )
+
+# Несколько процессов (python shards.py): у процесса свой диапазон шардов, состояние — в общей SQLite
+shards = ShardConfig.from_env()
+if shards.sharded:
+    bot = commands.AutoShardedBot(
+        command_prefix='!',
+        intents=intents,
+        shard_count=shards.shard_count,
+        shard_ids=sorted(shards.shard_ids),
+        **bot_options
+    )
+else:
+    bot = commands.Bot(command_prefix='!', intents=intents, **bot_options)
+
+# HTTP-сервер здоровья и метрик (для UptimeRobot и Prometheus) в цикле событий бота;
+# при запуске несколькими процессами его держит только основной
+health_server = HealthServer(bot, port=int(os.getenv('PORT', '5000')))
 
-WARNS_FILE = 'warns.json'
-TICKETS_FILE = 'whitelist_tickets.json'
+WARNS_FILE = os.getenv('WARNS_FILE', 'warns.json')
+TICKETS_FILE = os.getenv('TICKETS_FILE', 'whitelist_tickets.json')
+SQLITE_FILE = os.getenv('SQLITE_FILE', 'bot.db')
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'json')
+# Формат снимков json-хранилища: json (прежний) или compact (двоичный, быстрее и меньше)
+STORAGE_CODEC = os.getenv('STORAGE_CODEC', 'json')
+PERSIST_WINDOW = float(os.getenv('PERSIST_WINDOW', '1.0'))
 
-# Константы ID ролей
+# ID ролей и каналов по умолчанию (для серверов без своих настроек в GUILD_CONFIG_FILE)
 ADMIN_ROLE_ID = 1193894492663713792
 MOD_ROLE_ID = 1037412954481639476
 OWNER_ROLE_ID = 1037411767611052182
 PERMA_BAN_ROLE_ID = 1424009252137205864
 LOG_CHANNEL_ID = 1431367741553639498
+NOTIFY_FLUSH_INTERVAL = float(os.getenv('NOTIFY_FLUSH_INTERVAL', '2.0'))
+# Пауза между сообщением об удалении тикета и удалением канала (секунды)
+TICKET_DELETE_DELAY = float(os.getenv('TICKET_DELETE_DELAY', '5'))
 
+WARN1_ROLE_NAME = 'Warn1lvl'
+WARN2_ROLE_NAME = 'Warn2lvl'
+TICKETS_CATEGORY_NAME = 'Проверки'
 
-# 🔹 3. Работа с JSON-файлом варнов
-def load_warns():
-    if os.path.exists(WARNS_FILE):
-        with open(WARNS_FILE, 'r') as f:
-            return json.load(f)
-    return {}
+# Настройки серверов: роли, канал логов и категория заявок (GUILD_CONFIG_FILE)
+DEFAULT_GUILD_CONFIG = {
+    'admin_role_id': ADMIN_ROLE_ID,
+    'mod_role_id': MOD_ROLE_ID,
+    'owner_role_id': OWNER_ROLE_ID,
+    'perma_ban_role_id': PERMA_BAN_ROLE_ID,
+    'log_channel_id': LOG_CHANNEL_ID,
+    'tickets_category': TICKETS_CATEGORY_NAME
+}
+guild_configs = ConfigFile(os.getenv('GUILD_CONFIG_FILE', 'guild_config.json'),
+                           lambda data: GuildConfigs.from_config(data, DEFAULT_GUILD_CONFIG), 'Настройки серверов')
+guild_configs.load()
 
-def save_warns(warns):
-    with open(WARNS_FILE, 'w') as f:
-        json.dump(warns, f, indent=4)
+# Правила варнов: источники, форматы embed и лестница наказаний по серверам (WARN_RULES_FILE);
+# по умолчанию — embed MEE6 от любого бота в любом канале, Warn1lvl за 1 варн и Warn2lvl за 2
+DEFAULT_WARN_RULES = {
+    'formats': ['mee6'],
+    'ladder': [{'warns': 1, 'role': WARN1_ROLE_NAME}, {'warns': 2, 'role': WARN2_ROLE_NAME}]
+}
+warn_rules = ConfigFile(os.getenv('WARN_RULES_FILE', 'warn_rules.json'),
+                        lambda data: WarnParser.from_config(data, DEFAULT_WARN_RULES), 'Правила варнов',
+                        carry=WarnParser.carry_stats)
+warn_rules.load()
+# Изменения файлов настроек подхватываются без перезапуска: проверка раз в CONFIG_RELOAD_INTERVAL секунд
+CONFIG_RELOAD_INTERVAL = float(os.getenv('CONFIG_RELOAD_INTERVAL', '10'))
 
-warns_data = load_warns()
+guild_cache = GuildCache()
+member_cache = MemberCache(
+    max_size=int(os.getenv('MEMBER_CACHE_SIZE', '5000')),
+    ttl=float(os.getenv('MEMBER_CACHE_TTL', '300')),
+    lean=LEAN_MEMBERS
+)
+actions = ActionScheduler(
+    max_concurrency=int(os.getenv('ACTIONS_CONCURRENCY', '4')),
+    max_queue=int(os.getenv('ACTIONS_QUEUE_SIZE', '1000'))
+)
 
 
-# 🔹 4. Работа с заявками в белый список
-def load_tickets():
-    """Загрузка данных заявок"""
-    try:
-        if os.path.exists(TICKETS_FILE):
-            with open(TICKETS_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        return {"last_ticket_number": 0, "tickets": {}}
-    except Exception as e:
-        print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] ОШИБКА при загрузке заявок: {e}')
-        return {"last_ticket_number": 0, "tickets": {}}
+def guild_settings(guild):
+    """Действующие настройки сервера (после перезагрузки файла — уже новые)"""
+    return guild_configs.value.get(guild.id)
+
+
+# Уровни доступа участников: кэш по участнику, сброс в on_member_update и при смене настроек
+permissions = PermissionResolver(
+    lambda guild_id: guild_configs.value.get(guild_id),
+    max_size=int(os.getenv('PERMISSION_CACHE_SIZE', '5000')),
+    ttl=0.0 if LEAN_MEMBERS else float(os.getenv('PERMISSION_CACHE_TTL', '60'))
+)
+
+
+async def edit_member_roles(member, add=(), remove=(), reason=None):
+    """Изменение ролей через очередь; после выполнения запись участника в member_cache устаревает"""
+    future = await actions.edit_member_roles(member, add=add, remove=remove, reason=reason)
+    future.add_done_callback(lambda _: member_cache.forget(member.guild.id, member.id))
+    return future
+
 
-def save_tickets(data):
-    """Сохранение данных заявок"""
+# 🔹 3. Хранилище варнов и заявок (json или sqlite)
+# Удалённые заявки старше ARCHIVE_AFTER_DAYS переносятся в сжатые сегменты ARCHIVE_DIR
+ticket_archive = TicketArchive(
+    os.getenv('ARCHIVE_DIR', 'ticket_archive'),
+    retain_days=float(os.getenv('ARCHIVE_AFTER_DAYS', '30'))
+)
+storage = open_backend(STORAGE_BACKEND, WARNS_FILE, TICKETS_FILE, SQLITE_FILE, PERSIST_WINDOW, ticket_archive,
+                       STORAGE_CODEC)
+# Переписка канала заявки сохраняется перед его удалением: TRANSCRIPT_DIR/<guild_id>/ticket-<номер>.jsonl.gz
+transcripts = TranscriptStore(os.getenv('TRANSCRIPT_DIR', 'ticket_transcripts'))
+
+# Сверка ролей лестницы варнов с числом варнов: при первом запуске и по команде !reconcile
+reconciler = WarnRoleReconciler(storage, guild_cache, edit_member_roles,
+                                lambda guild_id: warn_rules.value.ladder(guild_id), lean=LEAN_MEMBERS)
+RECONCILE_ON_STARTUP = os.getenv('RECONCILE_ON_STARTUP', '1').lower() in ('1', 'true', 'yes')
+startup_sync = None
+
+
+@tasks.loop(seconds=60)
+async def storage_maintenance():
+    """Фоновое обслуживание хранилища: архивация удалённых заявок, checkpoint WAL (только основной процесс)"""
+    if not shards.primary:
+        return
     try:
-        with open(TICKETS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
-        print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] Заявки успешно сохранены')
+        await storage.maintenance()
     except Exception as e:
-        print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] ОШИБКА при сохранении заявок: {e}')
+        storage_log.error('ОШИБКА при обслуживании хранилища: %s', e)
 
-def get_next_ticket_number(guild_id):
-    """Получение следующего номера заявки"""
+
+@tasks.loop(seconds=CONFIG_RELOAD_INTERVAL or 60)
+async def config_reload():
+    """Подхватить изменения GUILD_CONFIG_FILE и WARN_RULES_FILE без перезапуска"""
+    for config in (guild_configs, warn_rules):
+        try:
+            await config.check()
+        except Exception as e:
+            log.error('ОШИБКА при проверке файла настроек %s: %s', config.path, e)
+
+
+# 🔹 4. Работа с заявками в белый список
+async def allocate_ticket(guild_id, user_id, nickname):
+    """
+    Выдача номера заявки сервера и создание заявки одной атомарной операцией.
+    Возвращает (номер, сводка прошлых заявок) или (None, None) при ошибке.
+    """
     try:
-        data = load_tickets()
-        data['last_ticket_number'] += 1
-        save_tickets(data)
-        print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] Выдан номер заявки: {data["last_ticket_number"]}')
-        return data['last_ticket_number']
+        ticket_number, summary = await storage.allocate_ticket(guild_id, user_id, nickname)
+        tickets_log.debug('Выдан номер заявки: %s', ticket_number)
+        return ticket_number, summary
     except Exception as e:
-        print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] ОШИБКА при получении номера заявки: {e}')
-        return 1
+        tickets_log.error('ОШИБКА при создании заявки: %s', e)
+        return None, None
 
-def create_ticket(guild_id, user_id, channel_id, nickname):
-    """Создание новой заявки"""
+async def set_ticket_channel(guild_id, user_id, ticket_number, channel_id):
+    """Привязка канала к созданной заявке"""
     try:
-        data = load_tickets()
-        ticket_number = data['last_ticket_number']
-        
-        ticket_key = f"{guild_id}_{user_id}_{ticket_number}"
-        data['tickets'][ticket_key] = {
-            'ticket_number': ticket_number,
-            'guild_id': str(guild_id),
-            'user_id': str(user_id),
-            'channel_id': str(channel_id),
-            'nickname': nickname,
-            'status': 'pending',
-            'created_at': datetime.now().isoformat(),
-            'updated_at': datetime.now().isoformat()
-        }
-        
-        save_tickets(data)
-        print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] Создана заявка #{ticket_number} для пользователя {user_id}')
-        return ticket_number
+        return await storage.set_ticket_channel(guild_id, user_id, ticket_number, channel_id)
     except Exception as e:
-        print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] ОШИБКА при создании заявки: {e}')
-        return None
+        tickets_log.error('ОШИБКА при привязке канала к заявке #%s: %s', ticket_number, e)
+        return False
 
-def get_user_tickets(guild_id, user_id):
-    """Получение истории заявок пользователя"""
+async def save_transcript(channel, guild_id, user_id, ticket_number):
+    """Сохранить переписку канала заявки и привязать файл к заявке; False — не удалось"""
     try:
-        data = load_tickets()
-        user_tickets = []
-        
-        for ticket_key, ticket_data in data['tickets'].items():
-            if ticket_data['guild_id'] == str(guild_id) and ticket_data['user_id'] == str(user_id):
-                user_tickets.append(ticket_data)
-        
-        user_tickets.sort(key=lambda x: x.get('created_at', ''), reverse=True)
-        print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] Найдено {len(user_tickets)} заявок для пользователя {user_id}')
-        return user_tickets
+        with metrics.timer('tickets.transcript'):
+            name, count = await transcripts.save(channel, guild_id, ticket_number)
+        await storage.set_ticket_transcript(guild_id, user_id, ticket_number, name)
+        tickets_log.info('Переписка заявки #%s сохранена: %s сообщений', ticket_number, count)
+        return True
     except Exception as e:
-        print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] ОШИБКА при получении истории заявок: {e}')
-        return []
+        tickets_log.error('ОШИБКА при сохранении переписки заявки #%s: %s', ticket_number, e)
+        return False
 
-def update_ticket_status(guild_id, user_id, ticket_number, status):
+async def update_ticket_status(guild_id, user_id, ticket_number, status):
     """Обновление статуса заявки"""
     try:
-        data = load_tickets()
-        ticket_key = f"{guild_id}_{user_id}_{ticket_number}"
-        
-        if ticket_key in data['tickets']:
-            data['tickets'][ticket_key]['status'] = status
-            data['tickets'][ticket_key]['updated_at'] = datetime.now().isoformat()
-            save_tickets(data)
-            print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] Статус заявки #{ticket_number} обновлен на: {status}')
+        if await storage.update_ticket_status(guild_id, user_id, ticket_number, status):
+            tickets_log.debug('Статус заявки #%s обновлен на: %s', ticket_number, status)
             return True
         else:
-            print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] ОШИБКА: заявка #{ticket_number} не найдена')
+            tickets_log.error('ОШИБКА: заявка #%s не найдена', ticket_number)
             return False
     except Exception as e:
-        print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] ОШИБКА при обновлении статуса заявки: {e}')
+        tickets_log.error('ОШИБКА при обновлении статуса заявки: %s', e)
         return False
 
 
 # 🔹 5. Функция отправки уведомлений
+async def send_log_embeds(channel, embeds):
+    # Ждём само сообщение, а не постановку в очередь: ошибку отправки увидит NotificationBatcher
+    await (await actions.send(channel, embeds=embeds))
+
+notifier = NotificationBatcher(send_log_embeds, interval=NOTIFY_FLUSH_INTERVAL)
+
+
 async def send_notification(bot, guild_id, ticket_number, decision, username):
-    """Отправка уведомления о решении по заявке"""
+    """Постановка уведомления о решении по заявке в пачку для канала логов"""
     try:
         guild = bot.get_guild(int(guild_id))
         if not guild:
-            print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] ОШИБКА: сервер {guild_id} не найден')
+            tickets_log.error('ОШИБКА: сервер %s не найден', guild_id)
             return
         
-        log_channel = guild.get_channel(LOG_CHANNEL_ID)
+        log_channel = guild.get_channel(guild_settings(guild).log_channel_id)
         if not log_channel:
-            print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] ОШИБКА: канал логов не найден')
+            tickets_log.error('ОШИБКА: канал логов не найден')
             return
         
         decision_text = "Принято" if decision == "approved" else "Отказано"
@@ -180,14 +266,91 @@ async def send_notification(bot, guild_id, ticket_number, decision, username):
             timestamp=datetime.now()
         )
         
-        await log_channel.send(embed=embed)
-        print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] Уведомление отправлено: Заявка #{ticket_number} — {decision_text} — {username}')
+        notifier.add(log_channel, embed)
+        tickets_log.debug('Уведомление поставлено в очередь: Заявка #%s — %s — %s', ticket_number, decision_text, username)
     except Exception as e:
-        print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] ОШИБКА при отправке уведомления: {e}')
+        tickets_log.error('ОШИБКА при отправке уведомления: %s', e)
 
 
 # 🔹 6. Discord Views для управления заявками
 
+async def apply_overwrites(channel, overwrites, calls_before):
+    """
+    Применение полной карты прав канала одним запросом вместо set_permissions на каждую цель.
+    Возвращает, сколько HTTP-запросов сэкономлено по сравнению с calls_before.
+    """
+    if overwrites == channel.overwrites:
+        return calls_before
+    await (await actions.edit_channel(channel, overwrites=overwrites))
+    return max(calls_before - 1, 0)
+
+
+async def send_error(interaction, text):
+    """Сообщение об ошибке и до, и после defer()"""
+    if interaction.response.is_done():
+        await interaction.followup.send(text, ephemeral=True)
+    else:
+        await interaction.response.send_message(text, ephemeral=True)
+
+
+class WhitelistButton(DynamicItem[Button], template=r'whitelist_(?P<action>approve|deny|close|delete|reopen)_(?P<number>\d+)'):
+    """
+    Единый обработчик всех кнопок заявок (custom_id вида whitelist_<действие>_<номер>).
+    Регистрируется один раз; состояние заявки берётся из хранилища только при нажатии.
+    """
+
+    BUTTONS = {
+        'approve': ("Добавлен в белый список", discord.ButtonStyle.success),
+        'deny': ("Отказ в белом списке", discord.ButtonStyle.danger),
+        'close': ("Закрыть тикет", discord.ButtonStyle.danger),
+        'delete': ("Удалить тикет", discord.ButtonStyle.danger),
+        'reopen': ("Открыть тикет", discord.ButtonStyle.success)
+    }
+
+    # Статусы, при которых кнопка активна (как раньше при регистрации views в on_ready)
+    STATUSES = {
+        'approve': ('pending',),
+        'deny': ('pending',),
+        'close': ('approved', 'denied', 'reopened'),
+        'delete': ('closed',),
+        'reopen': ('closed',)
+    }
+
+    def __init__(self, action, ticket_number):
+        label, style = self.BUTTONS[action]
+        super().__init__(Button(label=label, style=style, custom_id=f"whitelist_{action}_{ticket_number}"))
+        self.action = action
+        self.ticket_number = ticket_number
+
+    @classmethod
+    async def from_custom_id(cls, interaction, item, match):
+        return cls(match['action'], int(match['number']))
+
+    async def callback(self, interaction: discord.Interaction):
+        """Поиск заявки по номеру и передача нажатия нужному View"""
+        ticket = await storage.get_ticket_by_number(interaction.guild_id, self.ticket_number) if interaction.guild_id else None
+        if ticket is None:
+            await interaction.response.send_message(f'❌ Заявка #{self.ticket_number} не найдена', ephemeral=True)
+            views_log.error('ОШИБКА: заявка #%s не найдена для кнопки %s', self.ticket_number, self.action)
+            return
+
+        if ticket.get('status', 'pending') not in self.STATUSES[self.action]:
+            await interaction.response.send_message(f'❌ Заявка #{self.ticket_number} уже обработана', ephemeral=True)
+            return
+
+        guild_id, user_id = ticket['guild_id'], ticket['user_id']
+        if self.action in ('approve', 'deny'):
+            member = await member_cache.get(interaction.guild, user_id)
+            username = member.name if member else ticket.get('nickname', 'Unknown')
+            view = WhitelistDecisionView(self.ticket_number, guild_id, user_id, username)
+        elif self.action == 'close':
+            view = WhitelistCloseView(self.ticket_number, guild_id, user_id)
+        else:
+            view = WhitelistManageView(self.ticket_number, guild_id, user_id, ticket.get('channel_id'))
+
+        await getattr(view, f'{self.action}_callback')(interaction)
+
+
 class WhitelistDecisionView(View):
     """Первая группа кнопок: принятие/отказ"""
     
@@ -198,69 +361,55 @@ class WhitelistDecisionView(View):
         self.user_id = user_id
         self.username = username
         
-        approve_button = Button(
-            label="Добавлен в белый список",
-            style=discord.ButtonStyle.success,
-            custom_id=f"whitelist_approve_{ticket_number}"
-        )
-        approve_button.callback = self.approve_callback
-        
-        deny_button = Button(
-            label="Отказ в белом списке",
-            style=discord.ButtonStyle.danger,
-            custom_id=f"whitelist_deny_{ticket_number}"
-        )
-        deny_button.callback = self.deny_callback
-        
-        self.add_item(approve_button)
-        self.add_item(deny_button)
+        self.add_item(WhitelistButton('approve', ticket_number))
+        self.add_item(WhitelistButton('deny', ticket_number))
     
+    @metrics.timed('view.approve')
     async def approve_callback(self, interaction: discord.Interaction):
         """Обработка одобрения заявки"""
         try:
             if not await self.check_permissions(interaction):
                 return
             
-            update_ticket_status(self.guild_id, self.user_id, self.ticket_number, 'approved')
-            await send_notification(bot, self.guild_id, self.ticket_number, 'approved', self.username)
-            
+            await update_ticket_status(self.guild_id, self.user_id, self.ticket_number, 'approved')
             await interaction.response.edit_message(
                 content=f"✅ Заявка #{self.ticket_number} одобрена администратором {interaction.user.mention}",
                 view=WhitelistCloseView(self.ticket_number, self.guild_id, self.user_id)
             )
+            await send_notification(bot, self.guild_id, self.ticket_number, 'approved', self.username)
             
-            print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] Заявка #{self.ticket_number} одобрена пользователем {interaction.user.name}')
+            views_log.info('Заявка #%s одобрена пользователем %s', self.ticket_number, interaction.user.name)
         except Exception as e:
-            print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] ОШИБКА при одобрении заявки: {e}')
-            await interaction.response.send_message(f'❌ Ошибка при обработке заявки: {str(e)}', ephemeral=True)
+            views_log.error('ОШИБКА при одобрении заявки: %s', e)
+            await send_error(interaction, f'❌ Ошибка при обработке заявки: {str(e)}')
     
+    @metrics.timed('view.deny')
     async def deny_callback(self, interaction: discord.Interaction):
         """Обработка отказа в заявке"""
         try:
             if not await self.check_permissions(interaction):
                 return
             
-            update_ticket_status(self.guild_id, self.user_id, self.ticket_number, 'denied')
-            await send_notification(bot, self.guild_id, self.ticket_number, 'denied', self.username)
-            
+            await update_ticket_status(self.guild_id, self.user_id, self.ticket_number, 'denied')
             await interaction.response.edit_message(
                 content=f"❌ Заявка #{self.ticket_number} отклонена администратором {interaction.user.mention}",
                 view=WhitelistCloseView(self.ticket_number, self.guild_id, self.user_id)
             )
+            await send_notification(bot, self.guild_id, self.ticket_number, 'denied', self.username)
             
-            print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] Заявка #{self.ticket_number} отклонена пользователем {interaction.user.name}')
+            views_log.info('Заявка #%s отклонена пользователем %s', self.ticket_number, interaction.user.name)
         except Exception as e:
-            print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] ОШИБКА при отклонении заявки: {e}')
-            await interaction.response.send_message(f'❌ Ошибка при обработке заявки: {str(e)}', ephemeral=True)
+            views_log.error('ОШИБКА при отклонении заявки: %s', e)
+            await send_error(interaction, f'❌ Ошибка при обработке заявки: {str(e)}')
     
     async def check_permissions(self, interaction: discord.Interaction):
         """Проверка прав доступа (админ или модератор)"""
         member = interaction.user
-        has_permission = any(role.id in [ADMIN_ROLE_ID, MOD_ROLE_ID] for role in member.roles)
+        has_permission = permissions.allowed(member, DECISION)
         
         if not has_permission:
             await interaction.response.send_message('❌ У вас нет прав для выполнения этого действия!', ephemeral=True)
-            print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] Отказ в доступе для {member.name} (нет прав админа/модератора)')
+            views_log.info('Отказ в доступе для %s (нет прав админа/модератора)', member.name)
         
         return has_permission
 
@@ -274,53 +423,55 @@ class WhitelistCloseView(View):
         self.guild_id = guild_id
         self.user_id = user_id
         
-        close_button = Button(
-            label="Закрыть тикет",
-            style=discord.ButtonStyle.danger,
-            custom_id=f"whitelist_close_{ticket_number}"
-        )
-        close_button.callback = self.close_callback
-        
-        self.add_item(close_button)
+        self.add_item(WhitelistButton('close', ticket_number))
     
+    @metrics.timed('view.close')
     async def close_callback(self, interaction: discord.Interaction):
         """Обработка закрытия тикета"""
         try:
             if not await self.check_permissions(interaction):
                 return
             
+            await interaction.response.defer()
             channel = interaction.channel
             
             overwrites = channel.overwrites
+            owner_role_id = guild_settings(interaction.guild).owner_role_id
+            restricted = 0
             for target, overwrite in overwrites.items():
-                if target != interaction.guild.me and target.id != OWNER_ROLE_ID:
+                if target != interaction.guild.me and target.id != owner_role_id:
                     overwrite.send_messages = False
-                    await channel.set_permissions(target, overwrite=overwrite)
+                    restricted += 1
+            saved = await apply_overwrites(channel, overwrites, restricted)
             
-            update_ticket_status(self.guild_id, self.user_id, self.ticket_number, 'closed')
+            await update_ticket_status(self.guild_id, self.user_id, self.ticket_number, 'closed')
             
-            await interaction.response.edit_message(
+            await interaction.edit_original_response(
                 content=f"🔒 Тикет #{self.ticket_number} закрыт администратором {interaction.user.mention}",
                 view=WhitelistManageView(self.ticket_number, self.guild_id, self.user_id, channel.id)
             )
             
-            print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] Тикет #{self.ticket_number} закрыт пользователем {interaction.user.name}')
+            views_log.info('Тикет #%s закрыт пользователем %s (сэкономлено HTTP-запросов: %s)', self.ticket_number, interaction.user.name, saved)
         except Exception as e:
-            print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] ОШИБКА при закрытии тикета: {e}')
-            await interaction.response.send_message(f'❌ Ошибка при закрытии тикета: {str(e)}', ephemeral=True)
+            views_log.error('ОШИБКА при закрытии тикета: %s', e)
+            await send_error(interaction, f'❌ Ошибка при закрытии тикета: {str(e)}')
     
     async def check_permissions(self, interaction: discord.Interaction):
         """Проверка прав доступа (только владелец)"""
         member = interaction.user
-        has_permission = any(role.id == OWNER_ROLE_ID for role in member.roles)
+        has_permission = permissions.allowed(member, OWNER)
         
         if not has_permission:
             await interaction.response.send_message('❌ У вас нет прав для выполнения этого действия!', ephemeral=True)
-            print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] Отказ в доступе для {member.name} (нет прав владельца)')
+            views_log.info('Отказ в доступе для %s (нет прав владельца)', member.name)
         
         return has_permission
 
 
+# Заявки, канал которых сейчас сохраняется перед удалением: (guild_id, номер)
+tickets_deleting = set()
+
+
 class WhitelistManageView(View):
     """Третья группа кнопок: удаление/открытие тикета"""
     
@@ -331,23 +482,10 @@ class WhitelistManageView(View):
         self.user_id = user_id
         self.channel_id = channel_id
         
-        delete_button = Button(
-            label="Удалить тикет",
-            style=discord.ButtonStyle.danger,
-            custom_id=f"whitelist_delete_{ticket_number}"
-        )
-        delete_button.callback = self.delete_callback
-        
-        reopen_button = Button(
-            label="Открыть тикет",
-            style=discord.ButtonStyle.success,
-            custom_id=f"whitelist_reopen_{ticket_number}"
-        )
-        reopen_button.callback = self.reopen_callback
-        
-        self.add_item(delete_button)
-        self.add_item(reopen_button)
+        self.add_item(WhitelistButton('delete', ticket_number))
+        self.add_item(WhitelistButton('reopen', ticket_number))
     
+    @metrics.timed('view.delete')
     async def delete_callback(self, interaction: discord.Interaction):
         """Обработка удаления тикета"""
         try:
@@ -355,186 +493,486 @@ class WhitelistManageView(View):
                 return
             
             channel = interaction.channel
-            
-            update_ticket_status(self.guild_id, self.user_id, self.ticket_number, 'deleted')
-            
-            await interaction.response.send_message(
-                f"🗑️ Тикет #{self.ticket_number} будет удален через 5 секунд...",
-                ephemeral=False
-            )
-            
-            print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] Тикет #{self.ticket_number} удален пользователем {interaction.user.name}')
-            
-            import asyncio
-            await asyncio.sleep(5)
-            await channel.delete()
+            key = (self.guild_id, self.ticket_number)
+            if key in tickets_deleting:
+                await interaction.response.send_message(f'❌ Тикет #{self.ticket_number} уже удаляется', ephemeral=True)
+                return
+            tickets_deleting.add(key)
+            try:
+                await interaction.response.send_message(
+                    f"🗑️ Тикет #{self.ticket_number} будет удален через {TICKET_DELETE_DELAY:g} секунд "
+                    f"(после сохранения переписки)...",
+                    ephemeral=False
+                )
+
+                # Ответ уже отправлен; переписка сохраняется во время паузы перед удалением
+                saved, _ = await asyncio.gather(
+                    save_transcript(channel, self.guild_id, self.user_id, self.ticket_number),
+                    asyncio.sleep(TICKET_DELETE_DELAY)
+                )
+                if not saved:
+                    # Статус остаётся «закрыта»: канал не удалён, кнопка «Удалить» снова активна
+                    await channel.send('⚠️ Не удалось сохранить переписку, канал не удалён. Нажмите «Удалить» ещё раз.')
+                    return
+                # «Удалена» — только с сохранённой перепиской: такие заявки уходят в архив
+                await update_ticket_status(self.guild_id, self.user_id, self.ticket_number, 'deleted')
+            finally:
+                tickets_deleting.discard(key)
+
+            views_log.info('Тикет #%s удален пользователем %s', self.ticket_number, interaction.user.name)
+            await actions.delete_channel(channel)
             
         except Exception as e:
-            print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] ОШИБКА при удалении тикета: {e}')
+            views_log.error('ОШИБКА при удалении тикета: %s', e)
             if not interaction.response.is_done():
                 await interaction.response.send_message(f'❌ Ошибка при удалении тикета: {str(e)}', ephemeral=True)
     
+    @metrics.timed('view.reopen')
     async def reopen_callback(self, interaction: discord.Interaction):
         """Обработка открытия тикета"""
         try:
             if not await self.check_permissions(interaction):
                 return
             
+            await interaction.response.defer()
             channel = interaction.channel
             guild = interaction.guild
+            settings = guild_settings(guild)
             
-            admin_role = guild.get_role(ADMIN_ROLE_ID)
-            mod_role = guild.get_role(MOD_ROLE_ID)
-            member = guild.get_member(int(self.user_id))
+            admin_role = guild.get_role(settings.admin_role_id)
+            mod_role = guild.get_role(settings.mod_role_id)
+            member = await member_cache.get(guild, self.user_id)
             
-            if admin_role:
-                await channel.set_permissions(admin_role, send_messages=True, read_messages=True)
-            if mod_role:
-                await channel.set_permissions(mod_role, send_messages=True, read_messages=True)
-            if member:
-                await channel.set_permissions(member, send_messages=True, read_messages=True)
+            overwrites = dict(channel.overwrites)
+            targets = [target for target in (admin_role, mod_role, member) if target]
+            target_ids = {target.id for target in targets}
+            # Участник вне кэша (экономный режим) лежит в overwrites ключом discord.Object:
+            # прежний ключ убирается, иначе в запрос уйдут две записи для одного id
+            for key in [key for key in overwrites if key.id in target_ids]:
+                del overwrites[key]
+            for target in targets:
+                overwrites[target] = discord.PermissionOverwrite(send_messages=True, read_messages=True)
+            saved = await apply_overwrites(channel, overwrites, len(targets))
             
-            update_ticket_status(self.guild_id, self.user_id, self.ticket_number, 'reopened')
+            await update_ticket_status(self.guild_id, self.user_id, self.ticket_number, 'reopened')
             
-            await interaction.response.edit_message(
+            await interaction.edit_original_response(
                 content=f"🔓 Тикет #{self.ticket_number} открыт администратором {interaction.user.mention}",
                 view=WhitelistCloseView(self.ticket_number, self.guild_id, self.user_id)
             )
             
-            print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] Тикет #{self.ticket_number} открыт пользователем {interaction.user.name}')
+            views_log.info('Тикет #%s открыт пользователем %s (сэкономлено HTTP-запросов: %s)', self.ticket_number, interaction.user.name, saved)
         except Exception as e:
-            print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] ОШИБКА при открытии тикета: {e}')
-            await interaction.response.send_message(f'❌ Ошибка при открытии тикета: {str(e)}', ephemeral=True)
+            views_log.error('ОШИБКА при открытии тикета: %s', e)
+            await send_error(interaction, f'❌ Ошибка при открытии тикета: {str(e)}')
     
     async def check_permissions(self, interaction: discord.Interaction):
         """Проверка прав доступа (только владелец)"""
         member = interaction.user
-        has_permission = any(role.id == OWNER_ROLE_ID for role in member.roles)
+        has_permission = permissions.allowed(member, OWNER)
         
         if not has_permission:
             await interaction.response.send_message('❌ У вас нет прав для выполнения этого действия!', ephemeral=True)
-            print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] Отказ в доступе для {member.name} (нет прав владельца)')
+            views_log.info('Отказ в доступе для %s (нет прав владельца)', member.name)
         
         return has_permission
 
 
 # 🔹 7. События Discord
+@bot.event
+async def setup_hook():
+    await storage.open()
+    storage_maintenance.start()
+    if CONFIG_RELOAD_INTERVAL > 0:
+        config_reload.start()
+    actions.start()
+    for guild_id, user_id, oldest in await storage.warn_expiry_schedule():
+        if shards.owns(guild_id):
+            warn_expiry.schedule(guild_id, user_id, oldest)
+    warn_expiry.start()
+    # Один обработчик на все кнопки заявок вместо View на каждую заявку
+    bot.add_dynamic_items(WhitelistButton)
+
+    metrics.instrument_http(bot.http)
+    health_server.metric_sources += [
+        metrics.collect,
+        prefixed('storage', storage.stats),
+        prefixed('actions', actions.stats),
+        prefixed('member_cache', lambda: member_cache.stats(bot.guilds)),
+        prefixed('warn_expiry', warn_expiry.stats),
+        prefixed('warn_backfill', warn_backfill.stats),
+        prefixed('warn_parser', lambda: warn_rules.value.stats()),
+        prefixed('permissions', permissions.stats),
+        prefixed('config_guilds', guild_configs.stats),
+        prefixed('config_warn_rules', warn_rules.stats),
+        prefixed('transcripts', transcripts.stats),
+        lambda: {'notifications_pending': notifier.pending(), 'notifications_sent_embeds': notifier.sent_embeds}
+    ]
+    if shards.primary:
+        if shards.sharded:
+            health_server.metric_sources.append(shards.collect)
+        await health_server.start()
+    else:
+        health_server.lag_monitor.start()
+        publish_shard_status.start()
+
+
+@tasks.loop(seconds=15)
+async def publish_shard_status():
+    """Метрики неосновного процесса — в файл состояния для /metrics основного"""
+    try:
+        await asyncio.to_thread(shards.publish, health_server.collect())
+    except Exception as e:
+        log.error('ОШИБКА при публикации состояния процесса: %s', e)
+
+
 @bot.event
 async def on_ready():
-    print(f'Бот {bot.user} успешно запущен!')
-    print(f'ID: {bot.user.id}')
-    print('------')
-    
-    print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] Регистрация persistent views...')
-    
-    data = load_tickets()
-    for ticket_key, ticket_data in data['tickets'].items():
-        ticket_number = ticket_data['ticket_number']
-        guild_id = ticket_data['guild_id']
-        user_id = ticket_data['user_id']
-        username = ticket_data.get('nickname', 'Unknown')
-        status = ticket_data.get('status', 'pending')
-        channel_id = ticket_data.get('channel_id')
-        
-        if status == 'pending':
-            bot.add_view(WhitelistDecisionView(ticket_number, guild_id, user_id, username))
-        elif status in ['approved', 'denied', 'reopened']:
-            bot.add_view(WhitelistCloseView(ticket_number, guild_id, user_id))
-        elif status == 'closed':
-            bot.add_view(WhitelistManageView(ticket_number, guild_id, user_id, channel_id))
-    
-    print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] Persistent views зарегистрированы')
+    log.info('Бот %s успешно запущен! ID: %s', bot.user, bot.user.id)
+    global startup_sync
+    # Изменения ролей и категорий за время разрыва не пришли событиями
+    guild_cache.clear()
+    # После каждого (пере)подключения без RESUME — догрузка сообщений, пришедших без бота
+    warn_backfill.start()
+    if RECONCILE_ON_STARTUP and startup_sync is None:
+        startup_sync = asyncio.create_task(reconcile_on_startup())
 
 
 @bot.event
-async def on_message(message):
-    if message.author.bot and message.embeds:
-        for embed in message.embeds:
-            if embed.author and '[WARN]' in str(embed.author.name):
-                try:
-                    user_id = None
-                    for field in embed.fields:
-                        if field.name == 'User':
-                            user_mention = field.value
-                            match = re.search(r'<@(\d+)>', user_mention)
-                            if match:
-                                user_id = match.group(1)
-                                break
-
-                    if not user_id:
-                        print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] ОШИБКА: ID пользователя не найден в embed')
-                        continue
-
-                    guild_id = str(message.guild.id)
-
-                    if guild_id not in warns_data:
-                        warns_data[guild_id] = {}
-
-                    if user_id not in warns_data[guild_id]:
-                        warns_data[guild_id][user_id] = 0
-
-                    warns_data[guild_id][user_id] += 1
-                    save_warns(warns_data)
-
-                    warn_count = warns_data[guild_id][user_id]
-
-                    member = message.guild.get_member(int(user_id))
-                    if member:
-                        print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] Варн выдан: {member.name} ({user_id}) - Всего варнов: {warn_count}')
-
-                        if warn_count == 1:
-                            role = discord.utils.get(message.guild.roles, name='Warn1lvl')
-                            if role:
-                                await member.add_roles(role)
-                                print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] Роль Warn1lvl выдана: {member.name}')
-                            else:
-                                print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] ОШИБКА: Роль Warn1lvl не найдена!')
-
-                        elif warn_count == 2:
-                            role1 = discord.utils.get(message.guild.roles, name='Warn1lvl')
-                            role2 = discord.utils.get(message.guild.roles, name='Warn2lvl')
-
-                            if role1 and role1 in member.roles:
-                                await member.remove_roles(role1)
-                                print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] Роль Warn1lvl снята: {member.name}')
-
-                            if role2:
-                                await member.add_roles(role2)
-                                print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] Роль Warn2lvl выдана: {member.name}')
-                            else:
-                                print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] ОШИБКА: Роль Warn2lvl не найдена!')
-
-                        elif warn_count > 2:
-                            print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] У пользователя {member.name} уже {warn_count} варнов')
-                    else:
-                        print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] ОШИБКА: Участник с ID {user_id} не найден на сервере')
-
-                except Exception as e:
-                    print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] ОШИБКА при обработке варна: {e}')
+async def on_guild_role_create(role):
+    guild_cache.role_created(role)
+
+
+@bot.event
+async def on_guild_role_update(before, after):
+    guild_cache.role_updated(before, after)
+
+
+@bot.event
+async def on_guild_role_delete(role):
+    guild_cache.role_deleted(role)
+
+
+@bot.event
+async def on_guild_channel_create(channel):
+    guild_cache.channel_created(channel)
+
+
+@bot.event
+async def on_guild_channel_update(before, after):
+    guild_cache.channel_updated(before, after)
+
+
+@bot.event
+async def on_guild_channel_delete(channel):
+    guild_cache.channel_deleted(channel)
+
+
+@bot.event
+async def on_guild_remove(guild):
+    guild_cache.forget_guild(guild)
+    member_cache.forget_guild(guild.id)
+    permissions.forget_guild(guild.id)
+
+
+@bot.event
+async def on_member_update(before, after):
+    member_cache.forget(after.guild.id, after.id)
+    permissions.forget(after.guild.id, after.id)
+
+
+@bot.event
+async def on_raw_member_remove(payload):
+    member_cache.forget(payload.guild_id, payload.user.id)
+    permissions.forget(payload.guild_id, payload.user.id)
+
+
+@metrics.timed('warn')
+async def process_warn(message, user_id, reason):
+    """
+    Один разобранный варн: запись события и ступень лестницы наказаний сервера.
+    Возвращает True, если варн принят (не повтор уже учтённого варна этому участнику из этого сообщения).
+    """
+    try:
+        created_at = message.created_at.timestamp()
+        window = warn_expiry.window(message.guild.id)
+        if window and created_at <= datetime.now().timestamp() - window:
+            # Догруженный из истории варн, срок которого уже истёк
+            return False
+        # Checkpoint канала сдвигает только варн в канале, догруженном без пропусков
+        channel_id = message.channel.id if warn_backfill.caught_up(message.channel.id) else None
+        warn_count = await storage.add_warn(message.guild.id, user_id, message.id, reason, created_at, channel_id)
+        if warn_count is None:
+            warns_log.debug('Варн %s из сообщения %s уже учтён', user_id, message.id)
+            return False
+        # Планировщик держит самый ранний срок пользователя: догруженный из истории варн
+        # старше уже учтённых сдвигает истечение вперёд, более поздний ничего не меняет
+        warn_expiry.schedule(message.guild.id, user_id, created_at)
+
+        member = await member_cache.get(message.guild, user_id)
+        if member:
+            warns_log.info('Варн выдан: %s (%s) - Всего варнов: %s', member.name, user_id, warn_count)
+            if not await escalate(member, warn_count, message.created_at):
+                warns_log.info('У пользователя %s уже %s варнов', member.name, warn_count)
+        else:
+            warns_log.error('ОШИБКА: Участник с ID %s не найден на сервере', user_id)
+        return True
+
+    except Exception as e:
+        warns_log.error('ОШИБКА при обработке варна: %s', e)
+        return False
+
+
+def ladder_roles(guild, ladder):
+    """Роли лестницы на сервере в порядке ступеней; отсутствующие — None"""
+    roles = []
+    for name in ladder.role_names:
+        role = guild_cache.role(guild, name)
+        if role is None:
+            warns_log.error('ОШИБКА: Роль %s не найдена!', name)
+        roles.append(role)
+    return roles
+
+
+async def escalate(member, warn_count, warned_at):
+    """
+    Наказание ступени лестницы, порог которой ровно warn_count: роль (снятие прежней
+    роли лестницы и выдача новой — одно изменение участника) и тайм-аут; изменения —
+    через очередь действий. Между ступенями роли не трогаются — их выравнивает сверка.
+    Тайм-аут отсчитывается от времени варна: у догруженного варна он может быть уже в прошлом.
+    Возвращает True, если что-то поставлено в очередь.
+    """
+    ladder = warn_rules.value.ladder(member.guild.id)
+    step = ladder.step_at(warn_count)
+    if step is None:
+        return False
+    changed = False
+    if step.role:
+        add, remove = ladder_diff(member, ladder_roles(member.guild, ladder), ladder.level(warn_count))
+        if add or remove:
+            await edit_member_roles(member, add=add, remove=remove, reason=step.role)
+            warns_log.info('Роли варнов поставлены в очередь: %s (+%s/-%s)', member.name,
+                           [role.name for role in add], [role.name for role in remove])
+            changed = True
+
+    if step.timeout_minutes:
+        until = warned_at + timedelta(minutes=step.timeout_minutes)
+        if until > discord.utils.utcnow():
+            await actions.timeout_member(member, until, reason=f'Варнов: {warn_count}')
+            warns_log.info('Тайм-аут до %s поставлен в очередь: %s', until.isoformat(timespec='minutes'), member.name)
+            changed = True
+    return changed
+
+
+async def downgrade_warn_roles(member, warn_count):
+    """Привести роли варнов к оставшемуся числу варнов; только понижение. True, если изменение поставлено"""
+    ladder = warn_rules.value.ladder(member.guild.id)
+    add, remove = ladder_diff(member, [guild_cache.role(member.guild, name) for name in ladder.role_names],
+                              ladder.level(warn_count), downgrade_only=True)
+    if not add and not remove:
+        return False
+    await edit_member_roles(member, add=add, remove=remove, reason='Истечение варна')
+    return True
+
+
+async def expire_warns(batch):
+    """Пачка пользователей с истёкшими варнами: снятие варнов и понижение ролей"""
+    await bot.wait_until_ready()
+    now = datetime.now().timestamp()
+    results = await storage.expire_warns(
+        [(guild_id, user_id, now - warn_expiry.window(guild_id)) for guild_id, user_id in batch]
+    )
+
+    downgraded = 0
+    for guild_id, user_id, warn_count, oldest in results:
+        if oldest is not None:
+            warn_expiry.schedule(guild_id, user_id, oldest)
+        guild = bot.get_guild(guild_id)
+        if guild is None:
+            continue
+        member = await member_cache.get(guild, user_id)
+        if member is not None and await downgrade_warn_roles(member, warn_count):
+            downgraded += 1
+    warns_log.info('Истечение варнов: проверено %s, понижено ролей %s', len(results), downgraded)
+
 
+# Срок жизни варнов: WARN_EXPIRY_DAYS для всех серверов (0 — бессрочно),
+# WARN_EXPIRY_GUILDS="guild_id=дни,..." — отдельные сроки серверов
+warn_expiry = WarnExpiryScheduler(
+    expire_warns,
+    default_window=float(os.getenv('WARN_EXPIRY_DAYS', '0')) * DAY,
+    windows=parse_windows(os.getenv('WARN_EXPIRY_GUILDS'))
+)
+
+
+async def ingest_warns(message):
+    """Варны из сообщения (живого или догруженного из истории); вернуть число принятых"""
+    applied = 0
+    for _, user_id, reason in warn_rules.value.parse(message):
+        applied += await process_warn(message, user_id, reason)
+    return applied
+
+
+# Пропущенные за время простоя варны: история каналов от сохранённых checkpoint;
+# каналы без checkpoint — за последние WARN_BACKFILL_HOURS часов (0 — не догружать)
+warn_backfill = WarnBackfill(
+    bot, storage, ingest_warns, owns=shards.owns,
+    channels_for=lambda guild_id: warn_rules.value.rules(guild_id).channels,
+    window=float(os.getenv('WARN_BACKFILL_HOURS', '24')) * 3600
+)
+
+
+async def reconcile_on_startup():
+    """Первая сверка ролей варнов — после догрузки пропущенных варнов"""
+    await warn_backfill.start()
+    for guild in bot.guilds:
+        try:
+            await reconciler.run(guild)
+        except Exception as e:
+            warns_log.error('ОШИБКА при сверке ролей варнов на %s: %s', guild.name, e)
+
+
+@bot.event
+async def on_message(message):
+    if await ingest_warns(message) and not warn_backfill.caught_up(message.channel.id):
+        warn_backfill.discover(message.channel)
     await bot.process_commands(message)
 
 
 # 🔹 8. Команда /nick для заявки в белый список
+STATUS_NAMES = {
+    'pending': 'на рассмотрении',
+    'approved': 'принята',
+    'denied': 'отклонена',
+    'closed': 'закрыта',
+    'reopened': 'открыта повторно',
+    'deleted': 'удалена'
+}
+
+
+def build_ticket_embed(member, requested_nick, ticket_number, summary):
+    """Карточка заявки: данные участника и отклонения (возраст аккаунта, пермач бан, прошлые заявки)"""
+    account_age = datetime.now(member.created_at.tzinfo) - member.created_at
+    account_age_days = account_age.days
+    
+    has_perma_ban = member.get_role(guild_settings(member.guild).perma_ban_role_id) is not None
+    
+    previous_count = summary['count']
+    
+    embed = discord.Embed(
+        title='🔍 Заявка в белый список',
+        description=f'Участник {member.mention} запросил добавление в белый список: **{requested_nick}**',
+        color=discord.Color.blue(),
+        timestamp=datetime.now()
+    )
+    
+    embed.add_field(
+        name='🎫 Номер заявки',
+        value=f'#{ticket_number}',
+        inline=True
+    )
+    
+    embed.add_field(
+        name='📜 Предыдущие заявки',
+        value=(f'{previous_count} заявок (последняя: {STATUS_NAMES.get(summary["last_status"], summary["last_status"])})'
+               if previous_count > 0 else 'Первая заявка'),
+        inline=True
+    )
+    
+    embed.add_field(
+        name='📅 Дата регистрации аккаунта',
+        value=f'{member.created_at.strftime("%d.%m.%Y %H:%M")} UTC\n({account_age_days} дней назад)',
+        inline=False
+    )
+    
+    embed.add_field(
+        name='📅 Присоединился к серверу',
+        value=f'{member.joined_at.strftime("%d.%m.%Y %H:%M")} UTC' if member.joined_at else 'Неизвестно',
+        inline=False
+    )
+    
+    embed.add_field(
+        name='🚫 Роль "пермач бан на сервере в майнкрафте"',
+        value='✅ Есть' if has_perma_ban else '❌ Нет',
+        inline=False
+    )
+    
+    warnings = []
+    
+    if account_age_days < 30:
+        warnings.append(f'⚠️ **ВНИМАНИЕ**: Аккаунт создан недавно ({account_age_days} дней)')
+    
+    if has_perma_ban:
+        warnings.append('⚠️ **ВНИМАНИЕ**: У участника есть роль "пермач бан на сервере в майнкрафте"')
+    
+    if previous_count > 0:
+        warnings.append(f'⚠️ **ВНИМАНИЕ**: У участника уже есть {previous_count} предыдущих заявок')
+    
+    if warnings:
+        embed.add_field(
+            name='⚠️ Отклонения',
+            value='\n'.join(warnings),
+            inline=False
+        )
+        embed.color = discord.Color.orange()
+    else:
+        embed.add_field(
+            name='✅ Статус',
+            value='Проверка пройдена, отклонений не обнаружено',
+            inline=False
+        )
+        embed.color = discord.Color.green()
+    
+    embed.set_thumbnail(url=member.display_avatar.url)
+    embed.set_footer(text=f'ID участника: {member.id}')
+    return embed
+
+
+async def edit_reply(reply, text):
+    """Заменить текст подтверждения, отправленного в начале команды"""
+    message = await reply
+    await message.edit(content=text)
+
+
 @bot.command(name='nick')
+@metrics.timed('command.nick')
 async def check_nickname(ctx, requested_nick: str):
     """
     Команда для создания заявки на добавление в белый список.
     Создаёт приватный канал для администрации и модерации.
+    Подтверждение пользователю уходит сразу, номер и заявка создаются
+    одной атомарной операцией хранилища, остальные шаги — одновременно.
     """
+    reply = None
+    ticket_number = channel = None
     try:
         guild = ctx.guild
         member = ctx.author
+        if isinstance(member, discord.User):
+            # Автор без данных участника (экономный режим) — запрос через member_cache
+            member = await member_cache.get(guild, member.id)
+            if member is None:
+                await ctx.send('❌ Не удалось получить данные участника, попробуйте ещё раз')
+                return
         
-        admin_role = guild.get_role(ADMIN_ROLE_ID)
-        mod_role = guild.get_role(MOD_ROLE_ID)
+        settings = guild_settings(guild)
+        admin_role = guild.get_role(settings.admin_role_id)
+        mod_role = guild.get_role(settings.mod_role_id)
         
         if not admin_role or not mod_role:
             await ctx.send('❌ Ошибка: роли администрации или модерации не найдены на сервере!')
-            print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] ОШИБКА: роли для команды /nick не найдены')
+            tickets_log.error('ОШИБКА: роли для команды /nick не найдены')
             return
         
-        ticket_number = get_next_ticket_number(str(guild.id))
+        # Подтверждение уходит сразу; по готовности канала сообщение редактируется
+        reply = asyncio.ensure_future(ctx.send('⏳ Заявка принята, создаю канал...'))
+        
+        ticket_number, summary = await allocate_ticket(str(guild.id), str(member.id), requested_nick)
+        if ticket_number is None:
+            await edit_reply(reply, '❌ Не удалось создать заявку, попробуйте ещё раз')
+            return
+        category = guild_cache.category(guild, settings.tickets_category)
+        embed = build_ticket_embed(member, requested_nick, ticket_number, summary)
         
         channel_name = f'заявка-в-белый-список-{ticket_number}'
         
@@ -546,7 +984,6 @@ async def check_nickname(ctx, requested_nick: str):
             guild.me: discord.PermissionOverwrite(read_messages=True, send_messages=True)
         }
         
-        category = discord.utils.get(guild.categories, name='Проверки') or None
         channel = await guild.create_text_channel(
             name=channel_name,
             overwrites=overwrites,
@@ -554,104 +991,230 @@ async def check_nickname(ctx, requested_nick: str):
             topic=f'Заявка в белый список #{ticket_number} для {member.name}'
         )
         
-        create_ticket(str(guild.id), str(member.id), str(channel.id), requested_nick)
-        
-        account_age = datetime.now(member.created_at.tzinfo) - member.created_at
-        account_age_days = account_age.days
-        
-        perma_ban_role = guild.get_role(PERMA_BAN_ROLE_ID)
-        has_perma_ban = perma_ban_role in member.roles if perma_ban_role else False
-        
-        previous_tickets = get_user_tickets(str(guild.id), str(member.id))
-        previous_count = len(previous_tickets) - 1
-        
-        embed = discord.Embed(
-            title='🔍 Заявка в белый список',
-            description=f'Участник {member.mention} запросил добавление в белый список: **{requested_nick}**',
-            color=discord.Color.blue(),
-            timestamp=datetime.now()
-        )
-        
-        embed.add_field(
-            name='🎫 Номер заявки',
-            value=f'#{ticket_number}',
-            inline=True
-        )
-        
-        embed.add_field(
-            name='📜 Предыдущие заявки',
-            value=f'{previous_count} заявок' if previous_count > 0 else 'Первая заявка',
-            inline=True
-        )
-        
-        embed.add_field(
-            name='📅 Дата регистрации аккаунта',
-            value=f'{member.created_at.strftime("%d.%m.%Y %H:%M")} UTC\n({account_age_days} дней назад)',
-            inline=False
-        )
-        
-        embed.add_field(
-            name='📅 Присоединился к серверу',
-            value=f'{member.joined_at.strftime("%d.%m.%Y %H:%M")} UTC' if member.joined_at else 'Неизвестно',
-            inline=False
-        )
-        
-        embed.add_field(
-            name='🚫 Роль "пермач бан на сервере в майнкрафте"',
-            value='✅ Есть' if has_perma_ban else '❌ Нет',
-            inline=False
-        )
-        
-        warnings = []
-        
-        if account_age_days < 30:
-            warnings.append(f'⚠️ **ВНИМАНИЕ**: Аккаунт создан недавно ({account_age_days} дней)')
-        
-        if has_perma_ban:
-            warnings.append('⚠️ **ВНИМАНИЕ**: У участника есть роль "пермач бан на сервере в майнкрафте"')
-        
-        if previous_count > 0:
-            warnings.append(f'⚠️ **ВНИМАНИЕ**: У участника уже есть {previous_count} предыдущих заявок')
-        
-        if warnings:
-            embed.add_field(
-                name='⚠️ Отклонения',
-                value='\n'.join(warnings),
-                inline=False
-            )
-            embed.color = discord.Color.orange()
-        else:
-            embed.add_field(
-                name='✅ Статус',
-                value='Проверка пройдена, отклонений не обнаружено',
-                inline=False
-            )
-            embed.color = discord.Color.green()
-        
-        embed.set_thumbnail(url=member.display_avatar.url)
-        embed.set_footer(text=f'ID участника: {member.id}')
-        
         view = WhitelistDecisionView(ticket_number, str(guild.id), str(member.id), member.name)
         
-        await channel.send(
-            f'{admin_role.mention} {mod_role.mention}\n\nНовая заявка в белый список!',
-            embed=embed,
-            view=view
+        await asyncio.gather(
+            set_ticket_channel(str(guild.id), str(member.id), ticket_number, channel.id),
+            channel.send(
+                f'{admin_role.mention} {mod_role.mention}\n\nНовая заявка в белый список!',
+                embed=embed,
+                view=view
+            ),
+            edit_reply(reply, f'✅ Создана заявка #{ticket_number}: {channel.mention}')
         )
         
-        await ctx.send(f'✅ Создана заявка #{ticket_number}: {channel.mention}')
-        
-        print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] Создана заявка #{ticket_number} для {member.name} (ник: {requested_nick})')
+        tickets_log.info('Создана заявка #%s для %s (ник: %s)', ticket_number, member.name, requested_nick)
         
     except Exception as e:
-        await ctx.send(f'❌ Произошла ошибка при создании заявки: {str(e)}')
-        print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] ОШИБКА в команде /nick: {e}')
+        text = f'❌ Произошла ошибка при создании заявки: {str(e)}'
+        try:
+            if reply is not None:
+                await edit_reply(reply, text)
+            else:
+                await ctx.send(text)
+        except Exception:
+            await ctx.send(text)
+        tickets_log.error('ОШИБКА в команде /nick: %s', e)
+        if ticket_number is not None and channel is None:
+            # Номер выдан, но канал не создан — заявка без канала не остаётся висеть в ожидании
+            await update_ticket_status(str(guild.id), str(member.id), ticket_number, 'deleted')
+
+
+# 🔹 Команда !history — полная история заявок участника (с архивом)
+HISTORY_PAGE_SIZE = 10
+
+
+@bot.command(name='history')
+@commands.guild_only()
+async def ticket_history(ctx, user: discord.User, page: int = 1):
+    if not permissions.allowed(ctx.author, DECISION, OWNER):
+        await ctx.send('❌ У вас нет прав для выполнения этого действия!')
+        return
+
+    page = max(page, 1)
+    try:
+        tickets, has_more = await storage.ticket_history(
+            ctx.guild.id, user.id, (page - 1) * HISTORY_PAGE_SIZE, HISTORY_PAGE_SIZE
+        )
+    except Exception as e:
+        tickets_log.error('ОШИБКА при чтении истории заявок: %s', e)
+        await ctx.send(f'❌ Ошибка при чтении истории: {str(e)}')
+        return
+
+    if not tickets:
+        await ctx.send(f'📜 У {user.mention} нет заявок' if page == 1 else '📜 Больше заявок нет')
+        return
+
+    lines = [
+        f'#{ticket["ticket_number"]} — {STATUS_NAMES.get(ticket.get("status"), ticket.get("status"))} — '
+        f'{ticket.get("nickname") or "?"} — {(ticket.get("created_at") or "")[:10]}'
+        for ticket in tickets
+    ]
+    embed = discord.Embed(
+        title=f'📜 История заявок {user.name}',
+        description='\n'.join(lines),
+        color=discord.Color.blue()
+    )
+    embed.set_footer(text=f'Страница {page}' + (f' · следующая: !history {user.id} {page + 1}' if has_more else ''))
+    await ctx.send(embed=embed)
+
+
+# 🔹 Команда !transcript — сохранённая переписка заявки
+TRANSCRIPT_PAGE_SIZE = 15
+
+
+def format_transcript_line(message):
+    content = message.get('content') or ''
+    if not content and message.get('embeds'):
+        embed = message['embeds'][0]
+        content = f'[embed] {embed.get("title") or embed.get("description") or ""}'
+    if message.get('attachments'):
+        content = f'{content} 📎{len(message["attachments"])}'.strip()
+    if len(content) > 150:
+        content = content[:147] + '...'
+    return f'`{message["at"][:16].replace("T", " ")}` **{message["author"]}**: {content}'
+
+
+@bot.command(name='transcript')
+@commands.guild_only()
+async def ticket_transcript(ctx, ticket_number: int, page: str = '1'):
+    """!transcript <номер> [страница] — сообщения по страницам; !transcript <номер> файл — весь файл"""
+    if not permissions.allowed(ctx.author, DECISION, OWNER):
+        await ctx.send('❌ У вас нет прав для выполнения этого действия!')
+        return
+
+    # Ссылка из заявки; заявка могла уйти в архив — тогда по имени, которое дало бы хранилище переписки
+    ticket = await storage.get_ticket_by_number(ctx.guild.id, ticket_number)
+    name = (ticket or {}).get('transcript') or transcripts.name(ctx.guild.id, ticket_number)
+    if not transcripts.exists(name):
+        await ctx.send(f'📭 Переписка заявки #{ticket_number} не сохранена')
+        return
+
+    if page.lower() in ('file', 'файл'):
+        path = transcripts.path(name)
+        if os.path.getsize(path) > ctx.guild.filesize_limit:
+            await ctx.send('❌ Файл переписки больше лимита вложений сервера — смотрите по страницам')
+            return
+        await ctx.send(f'📎 Переписка заявки #{ticket_number}',
+                       file=discord.File(path, filename=f'ticket-{ticket_number}{TranscriptStore.SUFFIX}'))
+        return
+
+    page_number = max(int(page), 1) if page.isdigit() else 1
+    try:
+        messages, has_more = await transcripts.page(name, (page_number - 1) * TRANSCRIPT_PAGE_SIZE,
+                                                    TRANSCRIPT_PAGE_SIZE)
+    except Exception as e:
+        tickets_log.error('ОШИБКА при чтении переписки заявки #%s: %s', ticket_number, e)
+        await ctx.send(f'❌ Ошибка при чтении переписки: {str(e)}')
+        return
+    if not messages:
+        await ctx.send('📜 Больше сообщений нет')
+        return
+
+    # 15 строк по ~220 символов укладываются в лимит описания embed (4096)
+    embed = discord.Embed(title=f'📜 Переписка заявки #{ticket_number}',
+                          description='\n'.join(map(format_transcript_line, messages)),
+                          color=discord.Color.blue())
+    embed.set_footer(text=f'Страница {page_number}' +
+                     (f' · следующая: !transcript {ticket_number} {page_number + 1}' if has_more else ''))
+    await ctx.send(embed=embed)
+
+
+# 🔹 Команда !reconcile — сверка ролей варнов с хранилищем (только для владельца)
+def format_reconcile(report):
+    lines = [
+        f'{"🔎 Пробная сверка" if report["dry_run"] else "🔧 Сверка"} ролей варнов'
+        f'{"" if report["done"] else " (идёт)"}: участников {report["members"]}, '
+        f'изменений {report["changes"]} (выдать {report["added"]}, снять {report["removed"]})'
+    ]
+    if report['failed']:
+        lines.append(f'Ошибок: {report["failed"]}')
+    for member, add, remove in report['samples']:
+        changes = [f'+{name}' for name in add] + [f'-{name}' for name in remove]
+        lines.append(f'• {member} ({member.id}): {" ".join(changes)}')
+    return '\n'.join(lines)
+
+
+@bot.command(name='reconcile')
+@commands.guild_only()
+async def reconcile_roles(ctx, mode: str = ''):
+    """!reconcile — исправить роли варнов; !reconcile dry — только показать расхождения"""
+    if not permissions.allowed(ctx.author, OWNER):
+        await ctx.send('❌ Команда доступна только владельцу!')
+        return
+    if reconciler.running(ctx.guild.id):
+        await ctx.send('⏳ Сверка ролей на этом сервере уже идёт')
+        return
+
+    dry_run = mode.lower() in ('dry', 'dry-run', 'проверка')
+    reply = asyncio.ensure_future(ctx.send('⏳ Сверка ролей варнов...'))
+
+    async def progress(report):
+        await edit_reply(reply, format_reconcile(report))
+
+    try:
+        await reconciler.run(ctx.guild, dry_run, progress)
+    except Exception as e:
+        warns_log.error('ОШИБКА при сверке ролей варнов: %s', e)
+        await edit_reply(reply, f'❌ Ошибка при сверке: {str(e)}')
+
+
+# 🔹 Команда !perf — метрики производительности (только для владельца)
+@bot.command(name='perf')
+@commands.guild_only()
+async def perf(ctx):
+    if not permissions.allowed(ctx.author, OWNER):
+        await ctx.send('❌ Команда доступна только владельцу!')
+        return
+
+    queue = actions.stats()
+    members = member_cache.stats(bot.guilds)
+    lag = health_server.lag_monitor
+    summary = (
+        f'Цикл событий: задержка {lag.lag * 1000:.1f} мс (макс. {lag.max_lag * 1000:.1f} мс)\n'
+        f'Очередь действий: {queue["queue_depth"]}, '
+        f'ожидание ср. {queue["avg_wait"] * 1000:.0f} мс\n'
+        f'Кэш участников: {members["size"]} записей, попаданий {members["hit_rate"]:.0%}'
+    )
+    if 'memory_saved_bytes' in members:
+        summary += f', сэкономлено ~{members["memory_saved_bytes"] / 2 ** 20:.0f} МБ'
+    summary += '\n\n'
+    # Лимит сообщения Discord — 2000 символов вместе с рамкой блока кода
+    await ctx.send(f'```\n{(summary + metrics.report())[:1990]}\n```')
 
 
 # 🔹 9. Запуск Discord-бота
-TOKEN = os.getenv('DISCORD_TOKEN')
-if not TOKEN:
-    print('ОШИБКА: Токен Discord не найден!')
-    print('Пожалуйста, добавьте DISCORD_TOKEN в переменные окружения')
-else:
-    bot.run(TOKEN)
+async def main(token):
+    async with bot:
+        try:
+            await bot.start(token)
+        finally:
+            # Выполнение очереди действий и сброс отложенной записи до закрытия цикла событий
+            await health_server.close()
+            warn_expiry.stop()
+            warn_backfill.stop()
+            if startup_sync is not None:
+                startup_sync.cancel()
+            await notifier.close()
+            await actions.close()
+            await storage.close()
+
+
+# Запуск только при прямом вызове: при импорте (bench.py) бот не стартует
+if __name__ == '__main__':
+    TOKEN = os.getenv('DISCORD_TOKEN')
+    if not TOKEN:
+        print('ОШИБКА: Токен Discord не найден!')
+        print('Пожалуйста, добавьте DISCORD_TOKEN в переменные окружения')
+    else:
+        log_listener = setup_logging(
+            level=os.getenv('LOG_LEVEL', 'INFO'),
+            levels=parse_levels(os.getenv('LOG_LEVELS', '')),
+            json_file=os.getenv('LOG_JSON_FILE'),
+            max_bytes=int(os.getenv('LOG_MAX_BYTES', str(10 * 1024 * 1024))),
+            backup_count=int(os.getenv('LOG_BACKUP_COUNT', '5'))
+        )
+        try:
+            asyncio.run(main(TOKEN))
+        finally:
+            log_listener.stop()
@@ -0,0 +1,86 @@
+import asyncio
+import json
+import logging
+import os
+
+log = logging.getLogger('bot.config')
+
+
+# 🔹 Файл настроек с перезагрузкой на ходу
+class ConfigFile:
+    """
+    Настройки из JSON-файла path, собранные build(data) в неизменяемый объект value
+    (нет файла — build({})). check() сравнивает (mtime, размер) файла с загруженными;
+    при изменении файл читается и собирается в рабочем потоке, а value подменяется
+    одним присваиванием в цикле событий: обработчик, который уже взял value, доработает
+    со старыми настройками, следующие получат новые — без перезапуска и без
+    потерянных нажатий кнопок. carry(new, old) переносит в новый объект накопленное
+    старым (счётчики). Ошибка в файле при запуске — ValueError; при перезагрузке
+    она логируется, и остаются прежние настройки до следующего изменения файла.
+    """
+
+    def __init__(self, path, build, name, carry=None):
+        self.path = path
+        self.build = build
+        self.name = name
+        self.carry = carry
+        self.value = None
+        self.reloads = 0
+        self.errors = 0
+        self._stamp = None
+
+    def _stat(self):
+        if not self.path:
+            return None
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _read(self):
+        """(отметка файла, собранное значение); ошибки чтения и разбора — ValueError"""
+        stamp = self._stat()
+        if stamp is None:
+            return None, self.build({})
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            raise ValueError(f'{self.path}: {e}') from None
+        if not isinstance(data, dict):
+            raise ValueError(f'{self.path}: ожидается JSON-объект')
+        try:
+            return stamp, self.build(data)
+        except (ValueError, TypeError, KeyError) as e:
+            raise ValueError(f'{self.path}: {e}') from None
+
+    def load(self):
+        """Первая загрузка (при запуске)"""
+        self._stamp, self.value = self._read()
+        if self._stamp is not None:
+            log.info('%s: загружено из %s', self.name, self.path)
+        return self.value
+
+    async def check(self):
+        """Перезагрузить, если файл изменился; True — настройки подменены"""
+        stamp = await asyncio.to_thread(self._stat)
+        if stamp == self._stamp:
+            return False
+        try:
+            stamp, value = await asyncio.to_thread(self._read)
+        except ValueError as e:
+            self.errors += 1
+            self._stamp = stamp
+            log.error('ОШИБКА в файле настроек (%s), остаются прежние: %s', self.name, e)
+            return False
+        if self.carry is not None:
+            self.carry(value, self.value)
+        self.value = value
+        self._stamp = stamp
+        self.reloads += 1
+        log.info('%s: %s', self.name, f'перезагружено из {self.path}' if stamp else 'файл удалён, настройки по умолчанию')
+        return True
+
+    def stats(self):
+        return {'from_file': int(self._stamp is not None), 'reloads': self.reloads, 'errors': self.errors}
@@ -0,0 +1,15 @@
+import os
+import tempfile
+
+# До импорта bot.py тестами: хранилище и настройки во временном каталоге, удаление канала без паузы
+_workdir = tempfile.mkdtemp(prefix='amison-test-')
+os.environ.update({
+    'WARNS_FILE': os.path.join(_workdir, 'warns.json'),
+    'TICKETS_FILE': os.path.join(_workdir, 'whitelist_tickets.json'),
+    'ARCHIVE_DIR': os.path.join(_workdir, 'ticket_archive'),
+    'TRANSCRIPT_DIR': os.path.join(_workdir, 'ticket_transcripts'),
+    'STORAGE_BACKEND': 'json',
+    'TICKET_DELETE_DELAY': '0',
+    'WARN_RULES_FILE': '',
+    'GUILD_CONFIG_FILE': os.path.join(_workdir, 'guild_config.json')
+})
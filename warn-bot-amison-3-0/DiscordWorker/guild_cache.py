@@ -0,0 +1,107 @@
+import discord
+
+
+# 🔹 Кэш ролей и категорий по серверам
+class _GuildEntry:
+    __slots__ = ('roles', 'categories')
+
+    def __init__(self, guild):
+        self.roles = {}
+        for role in guild.roles:
+            self.roles.setdefault(role.name, role.id)
+        self.categories = {}
+        for category in guild.categories:
+            self.categories.setdefault(category.name, category.id)
+
+
+def _first_id(items, name):
+    """Первая сущность с таким именем — как discord.utils.get"""
+    for item in items:
+        if item.name == name:
+            return item.id
+    return None
+
+
+class GuildCache:
+    """
+    Имя → ID роли / категории для каждого сервера.
+    Строится один раз при первом обращении и дальше обновляется точечно
+    по событиям on_guild_role_* и on_guild_channel_*, поэтому поиск — O(1).
+    После переподключения без RESUME (on_ready) события за время разрыва потеряны —
+    кэш сбрасывается целиком и строится заново из свежих объектов серверов.
+    """
+
+    def __init__(self):
+        self._guilds = {}
+
+    def _entry(self, guild):
+        entry = self._guilds.get(guild.id)
+        if entry is None:
+            entry = self._guilds[guild.id] = _GuildEntry(guild)
+        return entry
+
+    def role(self, guild, name):
+        role_id = self._entry(guild).roles.get(name)
+        return guild.get_role(role_id) if role_id else None
+
+    def category(self, guild, name):
+        category_id = self._entry(guild).categories.get(name)
+        return guild.get_channel(category_id) if category_id else None
+
+    def forget_guild(self, guild):
+        self._guilds.pop(guild.id, None)
+
+    def clear(self):
+        self._guilds.clear()
+
+    # --- роли ---
+    def _resolve_role(self, entry, guild, name):
+        role_id = _first_id(guild.roles, name)
+        if role_id is None:
+            entry.roles.pop(name, None)
+        else:
+            entry.roles[name] = role_id
+
+    def role_created(self, role):
+        entry = self._guilds.get(role.guild.id)
+        if entry is not None:
+            entry.roles.setdefault(role.name, role.id)
+
+    def role_updated(self, before, after):
+        entry = self._guilds.get(after.guild.id)
+        if entry is None or before.name == after.name:
+            return
+        if entry.roles.get(before.name) == before.id:
+            self._resolve_role(entry, after.guild, before.name)
+        entry.roles.setdefault(after.name, after.id)
+
+    def role_deleted(self, role):
+        entry = self._guilds.get(role.guild.id)
+        if entry is not None and entry.roles.get(role.name) == role.id:
+            self._resolve_role(entry, role.guild, role.name)
+
+    # --- категории ---
+    def _resolve_category(self, entry, guild, name):
+        category_id = _first_id(guild.categories, name)
+        if category_id is None:
+            entry.categories.pop(name, None)
+        else:
+            entry.categories[name] = category_id
+
+    def channel_created(self, channel):
+        entry = self._guilds.get(channel.guild.id)
+        if entry is not None and isinstance(channel, discord.CategoryChannel):
+            entry.categories.setdefault(channel.name, channel.id)
+
+    def channel_updated(self, before, after):
+        entry = self._guilds.get(after.guild.id)
+        if entry is None or not isinstance(after, discord.CategoryChannel) or before.name == after.name:
+            return
+        if entry.categories.get(before.name) == before.id:
+            self._resolve_category(entry, after.guild, before.name)
+        entry.categories.setdefault(after.name, after.id)
+
+    def channel_deleted(self, channel):
+        entry = self._guilds.get(channel.guild.id)
+        if entry is not None and isinstance(channel, discord.CategoryChannel) and entry.categories.get(channel.name) == channel.id:
+            self._resolve_category(entry, channel.guild, channel.name)
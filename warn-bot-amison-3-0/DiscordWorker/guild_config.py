@@ -0,0 +1,142 @@
+import time
+from collections import OrderedDict
+
+# Уровни доступа
+DECISION = 'decision'  # решения по заявкам (администратор, модератор)
+OWNER = 'owner'  # закрытие и удаление заявок, сверка ролей, метрики
+
+
+# 🔹 Настройки сервера
+class GuildConfig:
+    """
+    Роли, канал логов и категория заявок одного сервера. Наборы ролей уровней доступа
+    собираются один раз при загрузке: проверка участника — get_role по нескольким id
+    без перебора member.roles.
+    """
+
+    __slots__ = ('admin_role_id', 'mod_role_id', 'owner_role_id', 'perma_ban_role_id', 'log_channel_id',
+                 'tickets_category', 'levels')
+
+    KEYS = frozenset(__slots__) - {'levels'}
+    ID_KEYS = KEYS - {'tickets_category'}
+
+    def __init__(self, admin_role_id, mod_role_id, owner_role_id, perma_ban_role_id, log_channel_id,
+                 tickets_category):
+        self.admin_role_id = admin_role_id
+        self.mod_role_id = mod_role_id
+        self.owner_role_id = owner_role_id
+        self.perma_ban_role_id = perma_ban_role_id
+        self.log_channel_id = log_channel_id
+        self.tickets_category = tickets_category
+        self.levels = (
+            (DECISION, frozenset({admin_role_id, mod_role_id})),
+            (OWNER, frozenset({owner_role_id}))
+        )
+
+    @classmethod
+    def from_spec(cls, spec):
+        unknown = set(spec) - cls.KEYS
+        if unknown:
+            raise ValueError(f'неизвестные ключи {sorted(unknown)}')
+        missing = cls.KEYS - set(spec)
+        if missing:
+            raise ValueError(f'не заданы {sorted(missing)}')
+        return cls(**{key: int(value) if key in cls.ID_KEYS else str(value) for key, value in spec.items()})
+
+    def resolve(self, member):
+        """Уровни доступа участника"""
+        return frozenset(level for level, role_ids in self.levels
+                         if any(member.get_role(role_id) is not None for role_id in role_ids))
+
+
+class GuildConfigs:
+    """
+    Файл настроек (JSON): {"default": {...}, "guilds": {"<guild_id>": {...}}} — настройки
+    сервера дополняют default, default дополняет встроенные значения бота.
+    """
+
+    def __init__(self, default, guilds=None):
+        self.default = default
+        self.guilds = guilds or {}
+
+    @classmethod
+    def from_config(cls, config, default_spec):
+        unknown = set(config) - {'default', 'guilds'}
+        if unknown:
+            raise ValueError(f'Настройки серверов: неизвестные ключи {sorted(unknown)}')
+        default = dict(default_spec, **config.get('default', {}))
+        guilds = {}
+        for guild_id, spec in config.get('guilds', {}).items():
+            try:
+                guilds[int(guild_id)] = GuildConfig.from_spec(dict(default, **spec))
+            except ValueError as e:
+                raise ValueError(f'Сервер {guild_id}: {e}') from None
+        try:
+            return cls(GuildConfig.from_spec(default), guilds)
+        except ValueError as e:
+            raise ValueError(f'Настройки по умолчанию: {e}') from None
+
+    def get(self, guild_id):
+        return self.guilds.get(guild_id, self.default)
+
+
+# 🔹 Права участников
+class PermissionResolver:
+    """
+    Уровни доступа участника кэшируются (LRU на max_size записей с TTL) вместе с
+    настройками, по которым посчитаны: после перезагрузки файла настроек записи
+    не совпадают по настройкам и считаются заново. Изменение ролей участника
+    сбрасывает запись (forget из on_member_update). В экономном режиме discord.py
+    не присылает on_member_update для участников вне кэша — там ttl=0, без кэша.
+    """
+
+    def __init__(self, config_for, max_size=5000, ttl=60.0):
+        self.config_for = config_for
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def levels(self, member):
+        config = self.config_for(member.guild.id)
+        if self.ttl <= 0:
+            self.misses += 1
+            return config.resolve(member)
+
+        key = (member.guild.id, member.id)
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] is config and entry[2] > time.monotonic():
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+        self.misses += 1
+        levels = config.resolve(member)
+        self._entries[key] = (config, levels, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+        return levels
+
+    def allowed(self, member, *levels):
+        """Есть ли у участника хотя бы один из уровней; пользователь вне сервера (ЛС) — нет"""
+        if getattr(member, 'guild', None) is None:
+            return False
+        return not self.levels(member).isdisjoint(levels)
+
+    def forget(self, guild_id, user_id):
+        self._entries.pop((guild_id, int(user_id)), None)
+
+    def forget_guild(self, guild_id):
+        for key in [key for key in self._entries if key[0] == guild_id]:
+            del self._entries[key]
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0
+        }
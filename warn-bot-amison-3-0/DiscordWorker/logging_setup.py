@@ -0,0 +1,86 @@
+import json
+import logging
+import logging.handlers
+import queue
+
+
+# Подсистемы бота: logging.getLogger('bot.<имя>')
+SUBSYSTEMS = ('warns', 'tickets', 'views', 'web', 'storage', 'actions', 'members', 'shards')
+
+
+# Аргументы, которые не изменятся, пока запись ждёт в очереди
+IMMUTABLE_ARGS = (str, int, float, bool, bytes, type(None))
+
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """
+    Стандартный QueueHandler форматирует сообщение в вызывающем потоке.
+    Здесь запись с неизменяемыми аргументами (строки, числа, None) уходит в очередь
+    как есть — строка и время собираются уже в фоновом потоке QueueListener.
+    Остальные аргументы (объекты Discord, списки, словари) могут измениться до
+    форматирования — такое сообщение собирается сразу, как в QueueHandler.prepare.
+    """
+
+    def prepare(self, record):
+        args = record.args
+        if args and not (isinstance(args, tuple) and all(type(arg) in IMMUTABLE_ARGS for arg in args)):
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """Одна запись журнала — одна JSON-строка"""
+
+    def format(self, record):
+        entry = {
+            'ts': record.created,
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage()
+        }
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def parse_levels(spec):
+    """'warns=DEBUG,web=WARNING' -> {'warns': 'DEBUG', 'web': 'WARNING'}"""
+    levels = {}
+    for part in filter(None, (p.strip() for p in spec.split(','))):
+        name, _, level = part.partition('=')
+        levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def setup_logging(level='INFO', levels=None, json_file=None, max_bytes=10 * 1024 * 1024, backup_count=5):
+    """
+    Все логи (бота и discord.py) идут через очередь в один фоновый поток.
+    Возвращает запущенный QueueListener — его нужно остановить при выходе.
+    """
+    console = logging.StreamHandler()
+    console.setFormatter(logging.Formatter('[%(asctime)s] %(message)s', '%Y-%m-%d %H:%M:%S'))
+    handlers = [console]
+
+    if json_file:
+        file_handler = logging.handlers.RotatingFileHandler(
+            json_file, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8'
+        )
+        file_handler.setFormatter(JsonLinesFormatter())
+        handlers.append(file_handler)
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(LazyQueueHandler(log_queue))
+    root.setLevel(logging.WARNING)
+
+    logging.getLogger('discord').setLevel(logging.INFO)
+    logging.getLogger('bot').setLevel(level.upper())
+    for name, subsystem_level in (levels or {}).items():
+        logging.getLogger(f'bot.{name}').setLevel(subsystem_level)
+
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    return listener
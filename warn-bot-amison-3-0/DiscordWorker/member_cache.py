@@ -0,0 +1,120 @@
+import asyncio
+import logging
+import sys
+import time
+from collections import OrderedDict
+
+import discord
+
+log = logging.getLogger('bot.members')
+
+# Отметка «участника нет на сервере» — чтобы не запрашивать ушедших повторно до истечения TTL
+_MISSING = object()
+
+
+def _footprint(member):
+    """Примерная память одного участника discord.py: объект, пользователь и их слоты"""
+    size = 0
+    for obj in (member, getattr(member, '_user', None)):
+        if obj is None:
+            continue
+        size += sys.getsizeof(obj)
+        for cls in type(obj).__mro__:
+            for slot in getattr(cls, '__slots__', ()):
+                if slot == '_state':
+                    continue
+                value = getattr(obj, slot, None)
+                if value is not None and not isinstance(value, (int, bool, discord.Guild, discord.User)):
+                    size += sys.getsizeof(value)
+    return size
+
+
+# 🔹 Участники по запросу (экономный режим)
+class MemberCache:
+    """
+    Поиск участника: сначала кэш discord.py (в обычном режиме там все участники),
+    затем собственный LRU-кэш на max_size записей с TTL, и только потом
+    guild.fetch_member(). Одновременные запросы одного участника сливаются
+    в один REST-запрос.
+    """
+
+    def __init__(self, max_size=5000, ttl=300.0, lean=False):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.lean = lean
+        self.hits = 0
+        self.misses = 0
+        self.fetch_errors = 0
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._member_size = 0
+
+    async def get(self, guild, user_id):
+        """Участник сервера или None, если его нет"""
+        user_id = int(user_id)
+        member = guild.get_member(user_id)
+        if member is not None:
+            self.hits += 1
+            return member
+
+        key = (guild.id, user_id)
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[1] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return None if entry[0] is _MISSING else entry[0]
+            del self._entries[key]
+
+        self.misses += 1
+        future = self._inflight.get(key)
+        if future is None:
+            future = self._inflight[key] = asyncio.ensure_future(self._fetch(guild, user_id))
+            future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(future)
+
+    async def _fetch(self, guild, user_id):
+        try:
+            member = await guild.fetch_member(user_id)
+        except discord.NotFound:
+            member = None
+        except discord.HTTPException as e:
+            # Ошибку не кэшируем — следующий запрос попробует снова
+            self.fetch_errors += 1
+            log.error('ОШИБКА при получении участника %s: %s', user_id, e)
+            return None
+
+        if member is not None and not self._member_size:
+            self._member_size = _footprint(member)
+        self.put(guild.id, user_id, member)
+        return member
+
+    def put(self, guild_id, user_id, member):
+        key = (guild_id, int(user_id))
+        self._entries[key] = (_MISSING if member is None else member, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def forget(self, guild_id, user_id):
+        """Сбросить запись после изменения участника (роли, выход с сервера)"""
+        self._entries.pop((guild_id, int(user_id)), None)
+
+    def forget_guild(self, guild_id):
+        for key in [key for key in self._entries if key[0] == guild_id]:
+            del self._entries[key]
+
+    def stats(self, guilds=()):
+        lookups = self.hits + self.misses
+        stats = {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'fetch_errors': self.fetch_errors
+        }
+        if self.lean:
+            # Участники, которых discord.py не держит в памяти, минус собственный кэш
+            total = sum(guild.member_count or 0 for guild in guilds)
+            stats['memory_saved_bytes'] = max(total - len(self._entries), 0) * self._member_size
+        return stats
@@ -0,0 +1,153 @@
+import contextvars
+import functools
+import logging
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+
+# 🔹 Гистограммы задержек
+class Histogram:
+    """
+    Фиксированные корзины с шагом √2 от 0.5 мс до ~3 минут: observe() — один bisect
+    и инкремент, без хранения отдельных значений. Перцентили — верхняя граница корзины.
+    """
+
+    BOUNDS = tuple(0.0005 * 2 ** (i / 2) for i in range(38))
+    __slots__ = ('counts', 'count', 'total', 'max')
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.BOUNDS, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, q):
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                return min(self.BOUNDS[index], self.max) if index < len(self.BOUNDS) else self.max
+        return self.max
+
+
+_current_route = contextvars.ContextVar('current_route', default=None)
+
+RATE_LIMIT_MESSAGE = 'We are being rate limited. %s %s responded with 429. Retrying in %.2f seconds.'
+
+
+class _RateLimitFilter(logging.Filter):
+    """Считает ожидания 429 по сообщению discord.http (других хуков библиотека не даёт)"""
+
+    def __init__(self, registry):
+        super().__init__()
+        self.registry = registry
+
+    def filter(self, record):
+        if record.msg == RATE_LIMIT_MESSAGE and record.args:
+            route = _current_route.get() or f'{record.args[0]} ?'
+            self.registry.inc('rest_429_total', route)
+            self.registry.inc('rest_429_wait_seconds', route, record.args[2])
+        return True
+
+
+# 🔹 Реестр метрик
+class Metrics:
+    """Гистограммы времени обработчиков/хранилища и счётчики REST-запросов по маршрутам"""
+
+    QUANTILES = (0.5, 0.95, 0.99)
+
+    def __init__(self):
+        self.histograms = {}
+        self.counters = {}
+
+    def observe(self, name, seconds):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram()
+        histogram.observe(seconds)
+
+    def inc(self, name, label='', amount=1):
+        key = (name, label)
+        self.counters[key] = self.counters.get(key, 0) + amount
+
+    @contextmanager
+    def timer(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started)
+
+    def timed(self, name):
+        """Декоратор для корутин: время выполнения в гистограмму name"""
+        def decorator(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    self.observe(name, time.perf_counter() - started)
+            return wrapper
+        return decorator
+
+    def instrument_http(self, http):
+        """Подсчёт REST-запросов discord.py по маршрутам (метод + шаблон пути) и ожиданий 429"""
+        request = http.request
+
+        async def counted_request(route, **kwargs):
+            route_key = f'{route.method} {route.path}'
+            self.inc('rest_requests_total', route_key)
+            token = _current_route.set(route_key)
+            started = time.perf_counter()
+            try:
+                return await request(route, **kwargs)
+            finally:
+                self.observe(f'rest {route_key}', time.perf_counter() - started)
+                _current_route.reset(token)
+
+        http.request = counted_request
+        logging.getLogger('discord.http').addFilter(_RateLimitFilter(self))
+
+    def collect(self):
+        """Метрики для /metrics: перцентили, количество, суммы и счётчики"""
+        latency = {}
+        counts = {}
+        for name, histogram in self.histograms.items():
+            for q in self.QUANTILES:
+                latency[f'name="{name}",quantile="{q}"'] = histogram.percentile(q)
+            counts[f'name="{name}"'] = histogram.count
+        collected = {'latency_seconds': latency, 'latency_count': counts}
+        for (name, label), value in self.counters.items():
+            collected.setdefault(name, {})[f'route="{label}"'] = value
+        return collected
+
+    def report(self, limit=15):
+        """Текстовая таблица для команды !perf"""
+        lines = [f'{"операция":<34} {"n":>7} {"p50":>8} {"p95":>8} {"p99":>8}  (мс)']
+        ranked = sorted(self.histograms.items(), key=lambda item: item[1].total, reverse=True)
+        for name, histogram in ranked[:limit]:
+            p50, p95, p99 = (histogram.percentile(q) * 1000 for q in self.QUANTILES)
+            lines.append(f'{name[:34]:<34} {histogram.count:>7} {p50:>8.1f} {p95:>8.1f} {p99:>8.1f}')
+        rate_limited = {label: value for (name, label), value in self.counters.items() if name == 'rest_429_total'}
+        if rate_limited:
+            lines.append('')
+            lines.append('429 по маршрутам:')
+            for label, value in sorted(rate_limited.items(), key=lambda item: item[1], reverse=True)[:5]:
+                waited = self.counters.get(('rest_429_wait_seconds', label), 0)
+                lines.append(f'  {label[:50]}: {int(value)} раз, ожидание {waited:.1f} с')
+        return '\n'.join(lines)
+
+
+metrics = Metrics()
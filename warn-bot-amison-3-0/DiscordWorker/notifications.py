@@ -0,0 +1,83 @@
+import asyncio
+import logging
+
+log = logging.getLogger('bot.tickets')
+
+
+# 🔹 Пакетная отправка уведомлений в канал логов
+class NotificationBatcher:
+    """
+    Embed-уведомления копятся по каналам и уходят одним сообщением:
+    как только набралось MAX_EMBEDS (лимит Discord — 10 на сообщение) или
+    MAX_CHARS символов, либо через interval секунд после первого embed в пачке.
+    """
+
+    MAX_EMBEDS = 10
+    MAX_CHARS = 6000
+
+    def __init__(self, send, interval=2.0):
+        self.send = send
+        self.interval = interval
+        self.sent_messages = 0
+        self.sent_embeds = 0
+        self._buffers = {}
+        self._timers = {}
+        self._sending = set()
+
+    def add(self, channel, embed):
+        """Поставить embed в очередь канала; не ждёт отправки"""
+        buffer = self._buffers.get(channel.id)
+        if buffer is not None and (len(buffer[1]) >= self.MAX_EMBEDS or buffer[2] + len(embed) > self.MAX_CHARS):
+            self._flush_now(channel.id)
+            buffer = None
+        if buffer is None:
+            buffer = self._buffers[channel.id] = [channel, [], 0]
+        buffer[1].append(embed)
+        buffer[2] += len(embed)
+
+        if len(buffer[1]) >= self.MAX_EMBEDS:
+            self._flush_now(channel.id)
+        elif channel.id not in self._timers:
+            self._timers[channel.id] = asyncio.get_running_loop().create_task(self._flush_later(channel.id))
+
+    def pending(self):
+        return sum(len(buffer[1]) for buffer in self._buffers.values())
+
+    def _flush_now(self, channel_id):
+        timer = self._timers.pop(channel_id, None)
+        if timer is not None:
+            timer.cancel()
+        buffer = self._buffers.pop(channel_id, None)
+        if buffer is not None:
+            task = asyncio.get_running_loop().create_task(self._send(buffer))
+            self._sending.add(task)
+            task.add_done_callback(self._sending.discard)
+
+    async def _flush_later(self, channel_id):
+        await asyncio.sleep(self.interval)
+        self._timers.pop(channel_id, None)
+        await self.flush(channel_id)
+
+    async def flush(self, channel_id):
+        buffer = self._buffers.pop(channel_id, None)
+        if buffer is not None:
+            await self._send(buffer)
+
+    async def _send(self, buffer):
+        channel, embeds, _ = buffer
+        try:
+            await self.send(channel, embeds)
+            self.sent_messages += 1
+            self.sent_embeds += len(embeds)
+        except Exception as e:
+            log.error('ОШИБКА при отправке пачки уведомлений: %s', e)
+
+    async def close(self):
+        """Отправить всё накопленное при остановке"""
+        for timer in self._timers.values():
+            timer.cancel()
+        self._timers.clear()
+        for channel_id in list(self._buffers):
+            await self.flush(channel_id)
+        if self._sending:
+            await asyncio.gather(*self._sending)
@@ -0,0 +1,87 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import metrics
+
+log = logging.getLogger('bot.storage')
+
+
+# 🔹 Отложенная запись (write-behind)
+class WriteBehindPersister:
+    """
+    Изменения только помечают состояние «грязным». Через window секунд после первой
+    пометки prepare() в потоке событий забирает накопленное, а возвращённая им
+    функция сериализует и пишет данные в отдельном рабочем потоке.
+    Все мутации за окно сливаются в одну запись.
+    Ошибка записи возвращается через future рабочего потока и передаётся в
+    on_error(exc) уже в потоке событий.
+    """
+
+    def __init__(self, prepare, window=1.0, on_error=None):
+        self.prepare = prepare
+        self.window = window
+        self.on_error = on_error
+        self.backlog = 0
+        self.flushes = 0
+        self.coalesced = 0
+        self.errors = 0
+        self.last_flush_latency = 0.0
+        self.max_flush_latency = 0.0
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='write-behind')
+        self._timer = None
+
+    def mark_dirty(self):
+        self.backlog += 1
+        if self._timer is None:
+            self._timer = asyncio.get_running_loop().create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.window)
+        self._timer = None
+        await self.flush()
+
+    async def flush(self):
+        """Немедленно сбросить накопленные изменения"""
+        backlog, self.backlog = self.backlog, 0
+        job = self.prepare()
+        if job is None:
+            return
+        started = time.perf_counter()
+        try:
+            # Один рабочий поток — пачки пишутся строго по порядку
+            await asyncio.get_running_loop().run_in_executor(self._executor, job)
+        except Exception as e:
+            self.errors += 1
+            log.error('ОШИБКА отложенной записи: %s', e)
+            if self.on_error is not None:
+                self.on_error(e)
+            return
+        self.last_flush_latency = time.perf_counter() - started
+        self.max_flush_latency = max(self.max_flush_latency, self.last_flush_latency)
+        metrics.observe('storage.flush', self.last_flush_latency)
+        self.flushes += 1
+        self.coalesced += max(backlog - 1, 0)
+
+    async def run(self, fn, *args):
+        """Выполнить fn в потоке записи — строго по порядку с пачками журнала"""
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    async def close(self):
+        """Сброс при остановке бота"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        await self.flush()
+        self._executor.shutdown(wait=True)
+
+    def stats(self):
+        return {
+            'backlog': self.backlog,
+            'flushes': self.flushes,
+            'coalesced': self.coalesced,
+            'errors': self.errors,
+            'last_flush_latency': self.last_flush_latency,
+            'max_flush_latency': self.max_flush_latency
+        }
@@ -0,0 +1,102 @@
+import asyncio
+import logging
+import time
+
+from warn_parser import ladder_diff
+
+log = logging.getLogger('bot.warns')
+
+
+# 🔹 Сверка ролей варнов с хранилищем
+class WarnRoleReconciler:
+    """
+    Участники сервера обходятся пачками по chunk_size: без кэша участников (экономный
+    режим) — через guild.fetch_members() (REST-страницы по 1000), иначе по кэшу discord.py
+    с передачей управления циклу событий после каждой пачки. Для каждого участника
+    целевая роль лестницы варнов сервера (ladder_for(guild_id)) считается по числу
+    варнов из хранилища и сравнивается с фактическими; ставятся только отличия — через
+    edit_member_roles (очередь действий с ограничением параллельности, лимитами Discord
+    и backpressure).
+    В режиме dry_run изменения только подсчитываются.
+    """
+
+    def __init__(self, storage, guild_cache, edit_member_roles, ladder_for, lean=False, chunk_size=1000, samples=10):
+        self.storage = storage
+        self.guild_cache = guild_cache
+        self.edit_member_roles = edit_member_roles
+        self.ladder_for = ladder_for
+        self.lean = lean
+        self.chunk_size = chunk_size
+        self.samples = samples
+        self._running = set()
+
+    def running(self, guild_id):
+        return guild_id in self._running
+
+    async def _members(self, guild):
+        if self.lean or not guild.chunked:
+            async for member in guild.fetch_members(limit=None):
+                yield member
+        else:
+            for member in guild.members:
+                yield member
+
+    async def run(self, guild, dry_run=False, progress=None):
+        """
+        Сверить роли участников guild. progress(report) вызывается после каждой пачки.
+        Возвращает отчёт: участники, изменения, выдано/снято ролей, ошибки, примеры.
+        """
+        report = {'members': 0, 'changes': 0, 'added': 0, 'removed': 0, 'failed': 0, 'samples': [],
+                  'dry_run': dry_run, 'done': False}
+        if guild.id in self._running:
+            raise RuntimeError('сверка этого сервера уже идёт')
+        ladder = self.ladder_for(guild.id)
+        roles = [self.guild_cache.role(guild, name) for name in ladder.role_names]
+        if all(role is None for role in roles):
+            log.error('ОШИБКА: роли варнов не найдены на сервере %s', guild.name)
+            report['done'] = True
+            return report
+
+        self._running.add(guild.id)
+        started = time.monotonic()
+        pending = set()
+
+        def finished(future):
+            pending.discard(future)
+            if future.cancelled() or future.exception() is not None:
+                report['failed'] += 1
+
+        try:
+            counts = await self.storage.warn_counts(guild.id)
+            async for member in self._members(guild):
+                report['members'] += 1
+                add, remove = ladder_diff(member, roles, ladder.level(counts.get(member.id, 0)))
+                if add or remove:
+                    report['changes'] += 1
+                    report['added'] += len(add)
+                    report['removed'] += len(remove)
+                    if len(report['samples']) < self.samples:
+                        report['samples'].append(
+                            (member, [role.name for role in add], [role.name for role in remove])
+                        )
+                    if not dry_run:
+                        future = await self.edit_member_roles(member, add=add, remove=remove,
+                                                              reason='Сверка ролей варнов')
+                        pending.add(future)
+                        future.add_done_callback(finished)
+                if report['members'] % self.chunk_size == 0:
+                    if progress is not None:
+                        await progress(report)
+                    await asyncio.sleep(0)
+            if pending:
+                await asyncio.wait(pending)
+        finally:
+            self._running.discard(guild.id)
+
+        report['done'] = True
+        log.info('Сверка ролей варнов %s%s: участников %s, изменений %s (+%s/-%s), ошибок %s, %.1f с',
+                 guild.name, ' (пробная)' if dry_run else '', report['members'], report['changes'],
+                 report['added'], report['removed'], report['failed'], time.monotonic() - started)
+        if progress is not None:
+            await progress(report)
+        return report
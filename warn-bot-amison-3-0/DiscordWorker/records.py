@@ -0,0 +1,103 @@
+import enum
+from collections import namedtuple
+from datetime import datetime
+
+
+class TicketStatus(str, enum.Enum):
+    PENDING = 'pending'
+    APPROVED = 'approved'
+    DENIED = 'denied'
+    CLOSED = 'closed'
+    REOPENED = 'reopened'
+    DELETED = 'deleted'
+
+
+STATUSES = {status.value: status for status in TicketStatus}
+
+# Событие варна: unix-время, id исходного сообщения (или None), причина (или None)
+WarnEvent = namedtuple('WarnEvent', ('created_at', 'source_message_id', 'reason'))
+
+
+def to_epoch(value):
+    """ISO-строка (локальное время, как datetime.now().isoformat()) -> unix-время; пустая -> 0.0"""
+    return datetime.fromisoformat(value).timestamp() if value else 0.0
+
+
+def to_iso(timestamp):
+    return datetime.fromtimestamp(timestamp).isoformat() if timestamp else ''
+
+
+# 🔹 Запись заявки
+class Ticket:
+    """
+    Заявка в памяти: id — целые числа, статус — TicketStatus, время — unix-время.
+    __slots__ вместо словаря: ~3 раза меньше памяти на заявку, чем словарь со строковыми
+    id и ISO-временем. Наружу заявки отдаются словарями прежнего формата (as_dict()),
+    в снимки — кортежами полей (as_row()). transcript — имя файла сохранённой переписки
+    (TranscriptStore) или None.
+    """
+
+    __slots__ = ('ticket_number', 'guild_id', 'user_id', 'channel_id', 'nickname', 'status',
+                 'created_at', 'updated_at', 'transcript')
+
+    def __init__(self, ticket_number, guild_id, user_id, channel_id=None, nickname=None,
+                 status=TicketStatus.PENDING, created_at=0.0, updated_at=0.0, transcript=None):
+        self.ticket_number = ticket_number
+        self.guild_id = guild_id
+        self.user_id = user_id
+        self.channel_id = channel_id
+        self.nickname = nickname
+        self.status = status
+        self.created_at = created_at
+        self.updated_at = updated_at
+        self.transcript = transcript
+
+    @property
+    def key(self):
+        """Номер заявки уникален в пределах сервера"""
+        return self.guild_id, self.ticket_number
+
+    @classmethod
+    def from_dict(cls, ticket_data):
+        """Из словаря формата whitelist_tickets.json (строковые id, ISO-время)"""
+        channel_id = ticket_data.get('channel_id')
+        return cls(
+            ticket_data['ticket_number'],
+            int(ticket_data['guild_id']),
+            int(ticket_data['user_id']),
+            int(channel_id) if channel_id else None,
+            ticket_data.get('nickname'),
+            STATUSES[ticket_data.get('status', 'pending')],
+            to_epoch(ticket_data.get('created_at')),
+            to_epoch(ticket_data.get('updated_at')),
+            ticket_data.get('transcript')
+        )
+
+    def as_dict(self):
+        ticket_data = {
+            'ticket_number': self.ticket_number,
+            'guild_id': str(self.guild_id),
+            'user_id': str(self.user_id),
+            'channel_id': str(self.channel_id) if self.channel_id else None,
+            'nickname': self.nickname,
+            'status': self.status.value,
+            'created_at': to_iso(self.created_at),
+            'updated_at': to_iso(self.updated_at)
+        }
+        if self.transcript:
+            ticket_data['transcript'] = self.transcript
+        return ticket_data
+
+    @classmethod
+    def from_row(cls, row):
+        # Снимки, записанные до появления transcript, — 8 полей
+        return cls(row[0], row[1], row[2], row[3], row[4], STATUSES[row[5]], row[6], row[7],
+                   row[8] if len(row) > 8 else None)
+
+    def as_row(self):
+        """Неизменяемая копия полей (порядок — как у __init__, статус строкой)"""
+        return (self.ticket_number, self.guild_id, self.user_id, self.channel_id, self.nickname,
+                self.status.value, self.created_at, self.updated_at, self.transcript)
+
+    def __repr__(self):
+        return f'<Ticket #{self.ticket_number} guild={self.guild_id} user={self.user_id} {self.status.value}>'
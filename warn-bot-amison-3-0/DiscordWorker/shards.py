@@ -0,0 +1,209 @@
+import argparse
+import json
+import logging
+import os
+import signal
+import subprocess
+import sys
+import time
+
+from storage import write_snapshot
+
+log = logging.getLogger('bot.shards')
+
+# Discord принимает не больше одного IDENTIFY в 5 секунд (max_concurrency = 1)
+IDENTIFY_INTERVAL = 5.5
+
+
+def shard_for_guild(guild_id, shard_count):
+    """Номер шарда сервера — как считает Discord"""
+    return (int(guild_id) >> 22) % shard_count
+
+
+def split_shards(shard_count, processes):
+    """Непрерывные диапазоны шардов по процессам: 5 шардов на 2 процесса -> [0, 1, 2], [3, 4]"""
+    size, extra = divmod(shard_count, processes)
+    ranges, start = [], 0
+    for index in range(processes):
+        end = start + size + (1 if index < extra else 0)
+        ranges.append(list(range(start, end)))
+        start = end
+    return ranges
+
+
+# 🔹 Настройки шардов процесса
+class ShardConfig:
+    """
+    SHARD_COUNT — всего шардов (0 — обычный режим без шардов), SHARD_IDS — шарды этого
+    процесса через запятую, SHARD_PROCESS — номер процесса. Процесс 0 — основной:
+    держит HTTP-сервер здоровья/метрик и выполняет обслуживание хранилища.
+    """
+
+    def __init__(self, shard_count=0, shard_ids=(), process_index=0, status_dir=None):
+        self.shard_count = shard_count
+        self.shard_ids = frozenset(shard_ids) if shard_ids else frozenset(range(shard_count))
+        self.process_index = process_index
+        self.status_dir = status_dir
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            shard_count=int(os.getenv('SHARD_COUNT', '0')),
+            shard_ids=[int(shard_id) for shard_id in os.getenv('SHARD_IDS', '').split(',') if shard_id.strip()],
+            process_index=int(os.getenv('SHARD_PROCESS', '0')),
+            status_dir=os.getenv('SHARD_STATUS_DIR', 'shard_status')
+        )
+
+    @property
+    def sharded(self):
+        return self.shard_count > 0
+
+    @property
+    def primary(self):
+        return self.process_index == 0
+
+    def owns(self, guild_id):
+        """Сервер обслуживается этим процессом"""
+        return not self.sharded or shard_for_guild(guild_id, self.shard_count) in self.shard_ids
+
+    # --- состояние процессов для основного ---
+    def _status_path(self, process_index):
+        return os.path.join(self.status_dir, f'process-{process_index}.json')
+
+    def publish(self, metrics):
+        """Записать свои метрики для основного процесса (атомарно)"""
+        os.makedirs(self.status_dir, exist_ok=True)
+        write_snapshot(self._status_path(self.process_index), {
+            'process': self.process_index,
+            'shards': sorted(self.shard_ids),
+            'pid': os.getpid(),
+            'updated': time.time(),
+            'metrics': metrics
+        })
+
+    def collect(self, max_age=60.0):
+        """
+        Метрики остальных процессов по их файлам состояния: числовые значения
+        с меткой process, плюс shard_process_up (0, если файл давно не обновлялся).
+        """
+        collected = {'shard_process_up': {}, 'shard_status_age_seconds': {}}
+        if not os.path.isdir(self.status_dir):
+            return collected
+        now = time.time()
+        for name in sorted(os.listdir(self.status_dir)):
+            if not (name.startswith('process-') and name.endswith('.json')):
+                continue
+            try:
+                with open(os.path.join(self.status_dir, name), 'r', encoding='utf-8') as f:
+                    status = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if status['process'] == self.process_index:
+                continue
+            label = f'process="{status["process"]}"'
+            age = now - status['updated']
+            collected['shard_process_up'][label] = int(age < max_age)
+            collected['shard_status_age_seconds'][label] = age
+            for metric, value in status['metrics'].items():
+                if isinstance(value, (int, float)):
+                    collected.setdefault(f'shard_{metric}', {})[label] = value
+        return collected
+
+
+# 🔹 Запуск нескольких процессов бота
+def worker_env(shard_count, shard_ids, process_index):
+    env = dict(os.environ)
+    env.update({
+        'SHARD_COUNT': str(shard_count),
+        'SHARD_IDS': ','.join(map(str, shard_ids)),
+        'SHARD_PROCESS': str(process_index),
+        'STORAGE_BACKEND': 'sqlite'
+    })
+    # У каждого процесса свой файл JSON-логов: RotatingFileHandler не работает из нескольких процессов
+    if env.get('LOG_JSON_FILE'):
+        env['LOG_JSON_FILE'] = f'{env["LOG_JSON_FILE"]}.{process_index}'
+    return env
+
+
+class Launcher:
+    """
+    Держит processes процессов bot.py, каждый со своим диапазоном шардов.
+    Упавший процесс перезапускается с нарастающей паузой; SIGINT/SIGTERM
+    передаются процессам как SIGINT, чтобы они корректно сбросили очередь и хранилище.
+    """
+
+    def __init__(self, shard_count, processes, script, restart_delay=5.0, stop_timeout=30.0):
+        self.shard_count = shard_count
+        self.ranges = split_shards(shard_count, processes)
+        self.script = script
+        self.restart_delay = restart_delay
+        self.stop_timeout = stop_timeout
+        self.procs = {}
+        self.stopping = False
+
+    def spawn(self, index):
+        shard_ids = self.ranges[index]
+        # Своя группа процессов: Ctrl+C в терминале получает только запускатель и передаёт его один раз
+        self.procs[index] = (subprocess.Popen([sys.executable, self.script],
+                                              env=worker_env(self.shard_count, shard_ids, index),
+                                              start_new_session=True),
+                             time.monotonic())
+        log.info('Процесс %s запущен (pid %s), шарды %s', index, self.procs[index][0].pid, shard_ids)
+
+    def stop(self, *_):
+        self.stopping = True
+
+    def run(self):
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGTERM, self.stop)
+        # Процессы подключаются по очереди: IDENTIFY шардов не упирается в общий лимит
+        for index, shard_ids in enumerate(self.ranges):
+            if self.stopping:
+                break
+            if index:
+                time.sleep(len(self.ranges[index - 1]) * IDENTIFY_INTERVAL)
+            self.spawn(index)
+
+        delays = {}
+        while not self.stopping:
+            time.sleep(1)
+            for index, (proc, started) in list(self.procs.items()):
+                if proc.poll() is None or self.stopping:
+                    continue
+                # Быстрое падение — пауза растёт, после долгой работы сбрасывается
+                delay = delays.get(index, self.restart_delay) if time.monotonic() - started < 60 else self.restart_delay
+                log.error('Процесс %s завершился с кодом %s, перезапуск через %.0f с', index, proc.returncode, delay)
+                time.sleep(delay)
+                delays[index] = min(delay * 2, 300)
+                if not self.stopping:
+                    self.spawn(index)
+        self.shutdown()
+
+    def shutdown(self):
+        for proc, _ in self.procs.values():
+            if proc.poll() is None:
+                proc.send_signal(signal.SIGINT)
+        deadline = time.monotonic() + self.stop_timeout
+        for index, (proc, _) in self.procs.items():
+            try:
+                proc.wait(max(deadline - time.monotonic(), 0))
+            except subprocess.TimeoutExpired:
+                log.warning('Процесс %s не завершился за %.0f с, остановка принудительно', index, self.stop_timeout)
+                proc.kill()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Запуск бота несколькими процессами с шардами')
+    parser.add_argument('--processes', type=int, default=2)
+    parser.add_argument('--shards', type=int, default=0, help='всего шардов (по умолчанию — по одному на процесс)')
+    parser.add_argument('--restart-delay', type=float, default=5.0)
+    args = parser.parse_args()
+    shard_count = args.shards or args.processes
+    if args.processes < 1 or shard_count < args.processes:
+        parser.error('шардов должно быть не меньше, чем процессов')
+    if os.getenv('STORAGE_BACKEND', 'sqlite') != 'sqlite':
+        parser.error('несколько процессов делят состояние только через STORAGE_BACKEND=sqlite')
+
+    logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+    Launcher(shard_count, args.processes, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bot.py'),
+             restart_delay=args.restart_delay).run()
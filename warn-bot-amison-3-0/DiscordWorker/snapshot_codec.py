@@ -0,0 +1,190 @@
+import json
+import marshal
+import os
+import pickle
+
+from records import Ticket, WarnEvent
+
+
+def _write_atomic(path, write, binary=False):
+    """Временный файл + fsync + os.replace: при сбое остаётся прежний снимок"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb' if binary else 'w', encoding=None if binary else 'utf-8') as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def write_snapshot(path, data, **dump_kwargs):
+    """Атомарная запись JSON-снимка"""
+    _write_atomic(path, lambda f: json.dump(data, f, **dump_kwargs))
+
+
+# 🔹 Форматы снимков
+# Снимок заявок для записи: {'last_ticket_number', 'last_numbers': {guild_id: номер},
+# 'archived': {guild_id: {user_id: число}}, 'rows': [Ticket.as_row()]}; при чтении вместо
+# 'rows' — 'tickets': [Ticket], а 'last_numbers' — None, если в файле общего счётчика нет;
+# 'legacy' — снимок прежней версии формата, его нужно переписать.
+# Снимок варнов: {'warns': {guild_id: {user_id: [WarnEvent]}}, 'checkpoints': {channel_id: (guild_id, message_id)}}.
+class JsonCodec:
+    """
+    Прежний формат: whitelist_tickets.json со строковыми id и ISO-временем,
+    warns.json {guild_id: {user_id: [[время, сообщение, причина]]}}. Читается
+    и старый формат варнов со счётчиками — см. WarnStore.
+    """
+
+    name = 'json'
+
+    def path(self, base):
+        return base
+
+    def dump_tickets(self, path, snapshot):
+        write_snapshot(path, {
+            'last_ticket_number': snapshot['last_ticket_number'],
+            'last_numbers': snapshot['last_numbers'],
+            'archived': snapshot['archived'],
+            'tickets': {f'{row[1]}_{row[2]}_{row[0]}': Ticket.from_row(row).as_dict() for row in snapshot['rows']}
+        }, indent=2, ensure_ascii=False)
+
+    def load_tickets(self, path):
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        last_numbers = data.get('last_numbers')
+        return {
+            'last_ticket_number': data.get('last_ticket_number', 0),
+            'last_numbers': None if last_numbers is None else {int(g): n for g, n in last_numbers.items()},
+            'archived': {int(guild_id): {int(user_id): count for user_id, count in users.items()}
+                         for guild_id, users in data.get('archived', {}).items()},
+            'tickets': [Ticket.from_dict(ticket_data) for ticket_data in data.get('tickets', {}).values()],
+            # Файл с одним общим счётчиком: переписать снимком со счётчиками серверов
+            'legacy': last_numbers is None
+        }
+
+    def dump_warns(self, path, snapshot):
+        data = {str(guild_id): {str(user_id): [list(event) for event in events] for user_id, events in users.items()}
+                for guild_id, users in snapshot['warns'].items()}
+        data['_checkpoints'] = {str(channel_id): [str(guild_id), message_id]
+                                for channel_id, (guild_id, message_id) in snapshot['checkpoints'].items()}
+        write_snapshot(path, data, ensure_ascii=False)
+
+    def load_warns(self, path, loaded_at):
+        """
+        Возвращает снимок варнов и признак старого формата {user_id: count}: такие
+        счётчики становятся count событий без сообщения и причины со временем loaded_at.
+        """
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        checkpoints = {int(channel_id): (int(guild_id), message_id)
+                       for channel_id, (guild_id, message_id) in data.pop('_checkpoints', {}).items()}
+        legacy = False
+        warns = {}
+        for guild_id, users in data.items():
+            guild_warns = warns[int(guild_id)] = {}
+            for user_id, events in users.items():
+                if isinstance(events, int):
+                    legacy = True
+                    guild_warns[int(user_id)] = [WarnEvent(loaded_at, None, None) for _ in range(events)]
+                else:
+                    guild_warns[int(user_id)] = [WarnEvent._make(event) for event in events]
+        return {'warns': warns, 'checkpoints': checkpoints}, legacy
+
+
+class _DataUnpickler(pickle.Unpickler):
+    """Только встроенные значения (dict, list, tuple, str, числа): классы и функции не загружаются"""
+
+    def find_class(self, module, name):
+        raise pickle.UnpicklingError(f'недопустимый объект в снимке: {module}.{name}')
+
+
+class CompactCodec:
+    """
+    Компактный двоичный формат: заголовок MAGIC и marshal из кортежей полей, без
+    ключей-строк и разбора ISO-времени. marshal хранит только данные (словари, списки,
+    кортежи, строки, числа) и при загрузке ничего не выполняет. Загрузка и запись в
+    несколько раз быстрее JSON, файл меньше. Снимки прежней версии (LEGACY_MAGIC,
+    pickle) читаются без загрузки классов и переписываются при первой записи.
+    """
+
+    name = 'compact'
+    MAGIC = b'AMSNBIN2'
+    LEGACY_MAGIC = b'AMSNBIN1'
+    VERSION = 4
+
+    def path(self, base):
+        return os.path.splitext(base)[0] + '.bin'
+
+    def _dump(self, path, payload):
+        _write_atomic(path, lambda f: (f.write(self.MAGIC), f.write(marshal.dumps(payload, self.VERSION))), binary=True)
+
+    def _load(self, path):
+        """(данные, признак снимка прежней версии)"""
+        with open(path, 'rb') as f:
+            magic = f.read(len(self.MAGIC))
+            if magic == self.MAGIC:
+                # loads по всему файлу: marshal.load читает файл мелкими порциями
+                payload, legacy = marshal.loads(f.read()), False
+            elif magic == self.LEGACY_MAGIC:
+                payload, legacy = _DataUnpickler(f).load(), True
+            else:
+                raise ValueError(f'{path}: не снимок в компактном формате')
+        if not isinstance(payload, dict):
+            raise ValueError(f'{path}: повреждённый снимок')
+        return payload, legacy
+
+    def dump_tickets(self, path, snapshot):
+        self._dump(path, snapshot)
+
+    def load_tickets(self, path):
+        payload, legacy = self._load(path)
+        payload['legacy'] = legacy or payload['last_numbers'] is None
+        payload['tickets'] = [Ticket.from_row(row) for row in payload.pop('rows')]
+        return payload
+
+    def dump_warns(self, path, snapshot):
+        self._dump(path, {
+            'warns': {guild_id: {user_id: [tuple(event) for event in events] for user_id, events in users.items()}
+                      for guild_id, users in snapshot['warns'].items()},
+            'checkpoints': snapshot['checkpoints']
+        })
+
+    def load_warns(self, path, loaded_at):
+        payload, legacy = self._load(path)
+        for users in payload['warns'].values():
+            for user_id, events in users.items():
+                users[user_id] = list(map(WarnEvent._make, events))
+        return payload, legacy
+
+
+CODECS = {codec.name: codec for codec in (JsonCodec(), CompactCodec())}
+
+
+def get_codec(name):
+    try:
+        return CODECS[name]
+    except KeyError:
+        raise ValueError(f'Неизвестный формат снимков: {name} (json или compact)') from None
+
+
+def find_snapshot(base, preferred):
+    """
+    (формат, путь) самого свежего снимка base в любом из форматов или (None, None).
+    Смена STORAGE_CODEC не теряет данные: читается последний записанный файл.
+    """
+    found = None
+    for codec in CODECS.values():
+        path = codec.path(base)
+        if os.path.exists(path):
+            rank = (os.path.getmtime(path), codec is preferred)
+            if found is None or rank > found[0]:
+                found = (rank, codec, path)
+    return (found[1], found[2]) if found else (None, None)
+
+
+def write_with(codec, base, snapshot, dump):
+    """Записать снимок форматом codec и удалить снимки base в остальных форматах"""
+    path = codec.path(base)
+    dump(path, snapshot)
+    for other in CODECS.values():
+        if other.path(base) != path and os.path.exists(other.path(base)):
+            os.remove(other.path(base))
@@ -0,0 +1,440 @@
+import argparse
+import asyncio
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from metrics import metrics
+from records import Ticket
+from snapshot_codec import find_snapshot
+from storage import StorageBackend, TicketStore, WarnStore
+
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS warns (
+    guild_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (guild_id, user_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS warn_events (
+    id INTEGER PRIMARY KEY,
+    guild_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    source_message_id INTEGER,
+    reason TEXT
+);
+CREATE INDEX IF NOT EXISTS warn_events_user ON warn_events (guild_id, user_id, created_at);
+CREATE UNIQUE INDEX IF NOT EXISTS warn_events_source_user ON warn_events (source_message_id, user_id);
+CREATE TABLE IF NOT EXISTS warn_checkpoints (
+    channel_id INTEGER PRIMARY KEY,
+    guild_id INTEGER NOT NULL,
+    message_id INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tickets (
+    guild_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    ticket_number INTEGER NOT NULL,
+    channel_id INTEGER,
+    nickname TEXT,
+    status TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    transcript TEXT,
+    PRIMARY KEY (guild_id, user_id, ticket_number)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS tickets_user ON tickets (guild_id, user_id, created_at);
+CREATE INDEX IF NOT EXISTS tickets_number ON tickets (guild_id, ticket_number);
+CREATE INDEX IF NOT EXISTS tickets_channel ON tickets (channel_id);
+CREATE INDEX IF NOT EXISTS tickets_status ON tickets (status);
+CREATE TABLE IF NOT EXISTS ticket_summary (
+    guild_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    last_number INTEGER NOT NULL,
+    PRIMARY KEY (guild_id, user_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS ticket_counters (
+    guild_id INTEGER PRIMARY KEY,
+    last_number INTEGER NOT NULL
+);
+'''
+
+# Постоянные тексты запросов: sqlite3 кэширует подготовленные выражения по тексту
+SQL_ADD_WARN = '''
+INSERT INTO warns (guild_id, user_id, count) VALUES (?, ?, 1)
+ON CONFLICT (guild_id, user_id) DO UPDATE SET count = count + 1
+RETURNING count
+'''
+SQL_ADD_WARN_EVENT = 'INSERT INTO warn_events (guild_id, user_id, created_at, source_message_id, reason) VALUES (?, ?, ?, ?, ?)'
+SQL_GET_WARNS = 'SELECT count FROM warns WHERE guild_id = ? AND user_id = ?'
+SQL_GUILD_WARNS = 'SELECT user_id, count FROM warns WHERE guild_id = ?'
+SQL_WARN_SOURCE_SEEN = 'SELECT EXISTS (SELECT 1 FROM warn_events WHERE source_message_id = ? AND user_id = ?)'
+SQL_SET_CHECKPOINT = '''
+INSERT INTO warn_checkpoints (channel_id, guild_id, message_id) VALUES (?, ?, ?)
+ON CONFLICT (channel_id) DO UPDATE SET message_id = MAX(message_id, excluded.message_id)
+'''
+SQL_CHECKPOINTS = 'SELECT channel_id, guild_id, message_id FROM warn_checkpoints'
+SQL_EXPIRE_WARN_EVENTS = 'DELETE FROM warn_events WHERE guild_id = ? AND user_id = ? AND created_at <= ?'
+SQL_ACTIVE_WARNS = 'SELECT COUNT(*), MIN(created_at) FROM warn_events WHERE guild_id = ? AND user_id = ?'
+SQL_SET_WARNS = 'UPDATE warns SET count = ? WHERE guild_id = ? AND user_id = ?'
+SQL_DELETE_WARNS = 'DELETE FROM warns WHERE guild_id = ? AND user_id = ?'
+SQL_WARN_SCHEDULE = 'SELECT guild_id, user_id, MIN(created_at) FROM warn_events GROUP BY guild_id, user_id'
+# Счётчики из импорта старых данных без событий: сколько событий не хватает до count
+SQL_MISSING_WARN_EVENTS = '''
+SELECT w.guild_id, w.user_id, w.count - (
+    SELECT COUNT(*) FROM warn_events e WHERE e.guild_id = w.guild_id AND e.user_id = w.user_id
+) AS missing FROM warns w WHERE missing > 0
+'''
+# Счётчик сервера; новый сервер начинает с 1. Сервер с заявками из базы, созданной до
+# ticket_counters, продолжает общий счётчик старых данных (meta) или свои номера
+SQL_ALLOCATE_NUMBER = '''
+INSERT INTO ticket_counters (guild_id, last_number)
+VALUES (?1, CASE WHEN EXISTS (SELECT 1 FROM ticket_summary WHERE guild_id = ?1) THEN MAX(
+    COALESCE((SELECT value FROM meta WHERE key = 'last_ticket_number'), 0),
+    (SELECT MAX(last_number) FROM ticket_summary WHERE guild_id = ?1)
+) ELSE 0 END + 1)
+ON CONFLICT (guild_id) DO UPDATE SET last_number = last_number + 1
+RETURNING last_number
+'''
+SQL_SYNC_COUNTER = '''
+INSERT INTO ticket_counters (guild_id, last_number) VALUES (?, ?)
+ON CONFLICT (guild_id) DO UPDATE SET last_number = MAX(last_number, excluded.last_number)
+'''
+SQL_SET_CHANNEL = 'UPDATE tickets SET channel_id = ? WHERE guild_id = ? AND user_id = ? AND ticket_number = ?'
+SQL_CREATE_TICKET = '''
+INSERT OR REPLACE INTO tickets (guild_id, user_id, ticket_number, channel_id, nickname, status, created_at, updated_at,
+                               transcript)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+SQL_INSERT_TICKET = '''
+INSERT INTO tickets (guild_id, user_id, ticket_number, channel_id, nickname, status, created_at, updated_at)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+'''
+SQL_BUMP_SUMMARY = '''
+INSERT INTO ticket_summary (guild_id, user_id, count, last_number) VALUES (?, ?, 1, ?)
+ON CONFLICT (guild_id, user_id) DO UPDATE SET count = count + 1, last_number = MAX(last_number, excluded.last_number)
+'''
+SQL_REBUILD_SUMMARY = '''
+INSERT OR REPLACE INTO ticket_summary (guild_id, user_id, count, last_number)
+SELECT guild_id, user_id, COUNT(*), MAX(ticket_number) FROM tickets GROUP BY guild_id, user_id
+'''
+SQL_USER_SUMMARY = '''
+SELECT s.count, COALESCE(t.status, 'deleted') FROM ticket_summary s
+LEFT JOIN tickets t ON t.guild_id = s.guild_id AND t.user_id = s.user_id AND t.ticket_number = s.last_number
+WHERE s.guild_id = ? AND s.user_id = ?
+'''
+SQL_TICKET_COLUMNS = 'ticket_number, guild_id, user_id, channel_id, nickname, status, created_at, updated_at, transcript'
+SQL_GET_TICKET = f'SELECT {SQL_TICKET_COLUMNS} FROM tickets WHERE guild_id = ? AND user_id = ? AND ticket_number = ?'
+SQL_TICKET_BY_NUMBER = f'SELECT {SQL_TICKET_COLUMNS} FROM tickets WHERE guild_id = ? AND ticket_number = ?'
+SQL_USER_TICKETS = f'SELECT {SQL_TICKET_COLUMNS} FROM tickets WHERE guild_id = ? AND user_id = ? ORDER BY created_at DESC'
+SQL_SET_TRANSCRIPT = 'UPDATE tickets SET transcript = ? WHERE guild_id = ? AND user_id = ? AND ticket_number = ?'
+SQL_UPDATE_STATUS = 'UPDATE tickets SET status = ?, updated_at = ? WHERE guild_id = ? AND user_id = ? AND ticket_number = ?'
+SQL_ARCHIVE_CANDIDATES = f"SELECT {SQL_TICKET_COLUMNS} FROM tickets WHERE status = 'deleted' AND updated_at < ? LIMIT ?"
+SQL_DELETE_TICKET = 'DELETE FROM tickets WHERE guild_id = ? AND user_id = ? AND ticket_number = ?'
+SQL_BY_STATUS = f'SELECT {SQL_TICKET_COLUMNS} FROM tickets WHERE status = ?'
+
+
+def _ticket_row(row):
+    """Строка таблицы tickets -> словарь в формате whitelist_tickets.json"""
+    ticket_number, guild_id, user_id, channel_id, nickname, status, created_at, updated_at, transcript = row
+    ticket_data = {
+        'ticket_number': ticket_number,
+        'guild_id': str(guild_id),
+        'user_id': str(user_id),
+        'channel_id': str(channel_id) if channel_id is not None else None,
+        'nickname': nickname,
+        'status': status,
+        'created_at': created_at,
+        'updated_at': updated_at
+    }
+    if transcript:
+        ticket_data['transcript'] = transcript
+    return ticket_data
+
+
+class SqliteBackend(StorageBackend):
+    """
+    SQLite в режиме WAL. Все запросы выполняются в одном выделенном потоке,
+    поэтому цикл событий discord.py не блокируется на диске.
+    """
+
+    name = 'sqlite'
+
+    def __init__(self, path, archive=None):
+        self.path = path
+        self.archive = archive
+        self.conn = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='sqlite')
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, cached_statements=64)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA busy_timeout=5000')
+        conn.executescript(SCHEMA)
+        # Индекс повторов до учёта нескольких варнов в одном сообщении: его заменил warn_events_source_user
+        conn.execute('DROP INDEX IF EXISTS warn_events_source')
+        # База, созданная до сохранения переписки заявок
+        if 'transcript' not in {column[1] for column in conn.execute('PRAGMA table_info(tickets)')}:
+            conn.execute('ALTER TABLE tickets ADD COLUMN transcript TEXT')
+        # База, созданная до появления ticket_summary: счётчики строятся один раз
+        if conn.execute('SELECT EXISTS (SELECT 1 FROM tickets) AND NOT EXISTS (SELECT 1 FROM ticket_summary)').fetchone()[0]:
+            conn.execute(SQL_REBUILD_SUMMARY)
+        # Варны, перенесённые до появления событий: недостающие события получают время миграции
+        missing = conn.execute(SQL_MISSING_WARN_EVENTS).fetchall()
+        if missing:
+            now = time.time()
+            with conn:
+                conn.execute('BEGIN')
+                conn.executemany(SQL_ADD_WARN_EVENT, [(guild_id, user_id, now, None, None)
+                                                      for guild_id, user_id, count in missing
+                                                      for _ in range(count)])
+        self.conn = conn
+
+    async def _run(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        with metrics.timer(f'storage.{fn.__name__.lstrip("_")}'):
+            return await loop.run_in_executor(self._executor, fn, *args)
+
+    async def open(self):
+        await self._run(self._connect)
+
+    async def close(self):
+        if self.conn is not None:
+            await self._run(self.conn.close)
+            self.conn = None
+        self._executor.shutdown(wait=True)
+
+    async def maintenance(self):
+        await self.archive_tickets()
+        await self._run(self.conn.execute, 'PRAGMA wal_checkpoint(PASSIVE)')
+
+    def stats(self):
+        return self.archive.stats() if self.archive is not None else {}
+
+    # --- варны ---
+    def _add_warn(self, guild_id, user_id, source_message_id, reason, created_at, channel_id):
+        with self.conn:
+            # IMMEDIATE: проверка повтора и запись не перемежаются с другими процессами
+            self.conn.execute('BEGIN IMMEDIATE')
+            if source_message_id is not None and \
+                    self.conn.execute(SQL_WARN_SOURCE_SEEN, (source_message_id, user_id)).fetchone()[0]:
+                return None
+            count = self.conn.execute(SQL_ADD_WARN, (guild_id, user_id)).fetchone()[0]
+            self.conn.execute(SQL_ADD_WARN_EVENT, (guild_id, user_id, created_at, source_message_id, reason))
+            if channel_id is not None and source_message_id is not None:
+                self.conn.execute(SQL_SET_CHECKPOINT, (channel_id, guild_id, source_message_id))
+        return count
+
+    async def add_warn(self, guild_id, user_id, source_message_id=None, reason=None, created_at=None, channel_id=None):
+        return await self._run(self._add_warn, int(guild_id), int(user_id), source_message_id, reason,
+                               created_at or time.time(), int(channel_id) if channel_id is not None else None)
+
+    def _warn_checkpoints(self):
+        return {channel_id: (guild_id, message_id)
+                for channel_id, guild_id, message_id in self.conn.execute(SQL_CHECKPOINTS)}
+
+    async def warn_checkpoints(self):
+        return await self._run(self._warn_checkpoints)
+
+    def _set_warn_checkpoint(self, guild_id, channel_id, message_id):
+        self.conn.execute(SQL_SET_CHECKPOINT, (channel_id, guild_id, message_id))
+
+    async def set_warn_checkpoint(self, guild_id, channel_id, message_id):
+        await self._run(self._set_warn_checkpoint, int(guild_id), int(channel_id), message_id)
+
+    def _get_warns(self, guild_id, user_id):
+        row = self.conn.execute(SQL_GET_WARNS, (guild_id, user_id)).fetchone()
+        return row[0] if row else 0
+
+    async def get_warns(self, guild_id, user_id):
+        return await self._run(self._get_warns, int(guild_id), int(user_id))
+
+    def _warn_counts(self, guild_id):
+        return dict(self.conn.execute(SQL_GUILD_WARNS, (guild_id,)))
+
+    async def warn_counts(self, guild_id):
+        return await self._run(self._warn_counts, int(guild_id))
+
+    def _expire_warns(self, items):
+        results = []
+        with self.conn:
+            # Вся пачка — одна транзакция
+            self.conn.execute('BEGIN IMMEDIATE')
+            for guild_id, user_id, cutoff in items:
+                self.conn.execute(SQL_EXPIRE_WARN_EVENTS, (guild_id, user_id, cutoff))
+                count, oldest = self.conn.execute(SQL_ACTIVE_WARNS, (guild_id, user_id)).fetchone()
+                if count:
+                    self.conn.execute(SQL_SET_WARNS, (count, guild_id, user_id))
+                else:
+                    self.conn.execute(SQL_DELETE_WARNS, (guild_id, user_id))
+                results.append((guild_id, user_id, count, oldest))
+        return results
+
+    async def expire_warns(self, items):
+        return await self._run(self._expire_warns, [(int(g), int(u), cutoff) for g, u, cutoff in items])
+
+    def _warn_expiry_schedule(self):
+        return self.conn.execute(SQL_WARN_SCHEDULE).fetchall()
+
+    async def warn_expiry_schedule(self):
+        return await self._run(self._warn_expiry_schedule)
+
+    # --- заявки ---
+    def _allocate_ticket(self, guild_id, user_id, nickname):
+        now = datetime.now().isoformat()
+        with self.conn:
+            # IMMEDIATE: блокировка записи сразу, номер уникален и между процессами
+            self.conn.execute('BEGIN IMMEDIATE')
+            summary = self._get_user_summary(guild_id, user_id)
+            ticket_number = self.conn.execute(SQL_ALLOCATE_NUMBER, (guild_id,)).fetchone()[0]
+            self.conn.execute(SQL_INSERT_TICKET, (guild_id, user_id, ticket_number, None, nickname, 'pending', now, now))
+            self.conn.execute(SQL_BUMP_SUMMARY, (guild_id, user_id, ticket_number))
+        return ticket_number, summary
+
+    async def allocate_ticket(self, guild_id, user_id, nickname):
+        return await self._run(self._allocate_ticket, int(guild_id), int(user_id), nickname)
+
+    def _set_ticket_channel(self, guild_id, user_id, ticket_number, channel_id):
+        return self.conn.execute(SQL_SET_CHANNEL, (channel_id, guild_id, user_id, ticket_number)).rowcount > 0
+
+    async def set_ticket_channel(self, guild_id, user_id, ticket_number, channel_id):
+        return await self._run(self._set_ticket_channel, int(guild_id), int(user_id), int(ticket_number), int(channel_id))
+
+    def _set_ticket_transcript(self, guild_id, user_id, ticket_number, transcript):
+        return self.conn.execute(SQL_SET_TRANSCRIPT, (transcript, guild_id, user_id, ticket_number)).rowcount > 0
+
+    async def set_ticket_transcript(self, guild_id, user_id, ticket_number, transcript):
+        return await self._run(self._set_ticket_transcript, int(guild_id), int(user_id), int(ticket_number), transcript)
+
+    def _get_ticket(self, guild_id, user_id, ticket_number):
+        row = self.conn.execute(SQL_GET_TICKET, (guild_id, user_id, ticket_number)).fetchone()
+        return _ticket_row(row) if row else None
+
+    async def get_ticket(self, guild_id, user_id, ticket_number):
+        return await self._run(self._get_ticket, int(guild_id), int(user_id), int(ticket_number))
+
+    def _get_ticket_by_number(self, guild_id, ticket_number):
+        row = self.conn.execute(SQL_TICKET_BY_NUMBER, (guild_id, ticket_number)).fetchone()
+        return _ticket_row(row) if row else None
+
+    async def get_ticket_by_number(self, guild_id, ticket_number):
+        return await self._run(self._get_ticket_by_number, int(guild_id), int(ticket_number))
+
+    def _get_user_tickets(self, guild_id, user_id):
+        return [_ticket_row(row) for row in self.conn.execute(SQL_USER_TICKETS, (guild_id, user_id))]
+
+    async def get_user_tickets(self, guild_id, user_id):
+        return await self._run(self._get_user_tickets, int(guild_id), int(user_id))
+
+    def _get_user_summary(self, guild_id, user_id):
+        row = self.conn.execute(SQL_USER_SUMMARY, (guild_id, user_id)).fetchone()
+        return {'count': row[0], 'last_status': row[1]} if row else {'count': 0, 'last_status': None}
+
+    async def get_user_summary(self, guild_id, user_id):
+        return await self._run(self._get_user_summary, int(guild_id), int(user_id))
+
+    def _archive_tickets(self, cutoff, limit):
+        tickets = [_ticket_row(row) for row in self.conn.execute(SQL_ARCHIVE_CANDIDATES, (cutoff, limit))]
+        if not tickets:
+            return 0
+        # Сначала архив, потом удаление: сбой между шагами даёт лишь повтор в архиве
+        self.archive.append(tickets)
+        with self.conn:
+            self.conn.execute('BEGIN')
+            self.conn.executemany(SQL_DELETE_TICKET, [
+                (int(ticket['guild_id']), int(ticket['user_id']), ticket['ticket_number']) for ticket in tickets
+            ])
+        return len(tickets)
+
+    async def archive_tickets(self):
+        if self.archive is None:
+            return 0
+        return await self._run(self._archive_tickets, self.archive.cutoff(), self.archive.batch_size)
+
+    def _update_ticket_status(self, guild_id, user_id, ticket_number, status):
+        cursor = self.conn.execute(SQL_UPDATE_STATUS, (status, datetime.now().isoformat(), guild_id, user_id, ticket_number))
+        return cursor.rowcount > 0
+
+    async def update_ticket_status(self, guild_id, user_id, ticket_number, status):
+        return await self._run(self._update_ticket_status, int(guild_id), int(user_id), int(ticket_number), status)
+
+    def _tickets_by_status(self, statuses):
+        tickets = []
+        for status in statuses:
+            tickets.extend(_ticket_row(row) for row in self.conn.execute(SQL_BY_STATUS, (status,)))
+        return tickets
+
+    async def tickets_by_status(self, *statuses):
+        return await self._run(self._tickets_by_status, statuses)
+
+
+# 🔹 Перенос данных из JSON
+def import_json(db_path, warns_file, tickets_file):
+    """Разовый импорт warns.json и whitelist_tickets.json (или их .bin, вместе с журналами) в базу SQLite"""
+    backend = SqliteBackend(db_path)
+    backend._connect()
+    conn = backend.conn
+    warns_count = tickets_count = 0
+
+    with conn:
+        conn.execute('BEGIN')
+        if warns_file and find_snapshot(warns_file, None)[0] is not None:
+            warn_store = WarnStore(warns_file).load()
+            rows = [(int(guild_id), int(user_id), len(events))
+                    for guild_id, users in warn_store.data.items()
+                    for user_id, events in users.items()]
+            conn.executemany('INSERT OR REPLACE INTO warns (guild_id, user_id, count) VALUES (?, ?, ?)', rows)
+            conn.executemany('DELETE FROM warn_events WHERE guild_id = ? AND user_id = ?', [row[:2] for row in rows])
+            conn.executemany(SQL_ADD_WARN_EVENT, [(int(guild_id), int(user_id), *event)
+                                                  for guild_id, users in warn_store.data.items()
+                                                  for user_id, events in users.items()
+                                                  for event in events])
+            conn.executemany(SQL_SET_CHECKPOINT, [(int(channel_id), int(guild_id), message_id)
+                                                  for channel_id, (guild_id, message_id)
+                                                  in warn_store.checkpoints.items()])
+            warns_count = len(rows)
+
+        if tickets_file and find_snapshot(tickets_file, None)[0] is not None:
+            ticket_store = TicketStore(tickets_file).load()
+            rows = []
+            for ticket_data in map(Ticket.as_dict, ticket_store):
+                channel_id = ticket_data.get('channel_id')
+                rows.append((
+                    int(ticket_data['guild_id']),
+                    int(ticket_data['user_id']),
+                    ticket_data['ticket_number'],
+                    int(channel_id) if channel_id else None,
+                    ticket_data.get('nickname'),
+                    ticket_data.get('status', 'pending'),
+                    ticket_data.get('created_at', ''),
+                    ticket_data.get('updated_at', ''),
+                    ticket_data.get('transcript')
+                ))
+            conn.executemany(SQL_CREATE_TICKET, rows)
+            conn.execute(SQL_REBUILD_SUMMARY)
+            # Общий счётчик старых данных уже учтён в last_numbers серверов (TicketStore.load)
+            conn.executemany(SQL_SYNC_COUNTER, [(int(guild_id), last_number)
+                                                for guild_id, last_number in ticket_store.last_numbers.items()])
+            tickets_count = len(rows)
+
+    conn.close()
+    return warns_count, tickets_count
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Импорт JSON-данных бота в SQLite')
+    parser.add_argument('--db', default='bot.db')
+    parser.add_argument('--warns', default='warns.json')
+    parser.add_argument('--tickets', default='whitelist_tickets.json')
+    args = parser.parse_args()
+
+    warns_count, tickets_count = import_json(args.db, args.warns, args.tickets)
+    print(f'Импортировано: варнов {warns_count}, заявок {tickets_count} -> {args.db}')
@@ -0,0 +1,808 @@
+import json
+import os
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: блокировка файла недоступна
+    fcntl = None
+
+from metrics import metrics
+from persistence import WriteBehindPersister
+from records import STATUSES, Ticket, TicketStatus, WarnEvent, to_epoch
+from snapshot_codec import CODECS, find_snapshot, get_codec, write_snapshot, write_with
+
+
+# 🔹 Журнал изменений (append-only)
+class Journal:
+    """
+    Файл JSON-строк, куда только дописываются записи.
+    Новые записи копятся в памяти и пишутся пачкой с одним fsync (write()),
+    обычно из рабочего потока отложенной записи.
+    Оборванная при сбое последняя строка при чтении пропускается.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.records = 0
+        self._pending = []
+
+    def replay(self):
+        """Записи ротированного (если компактизация прервалась) и текущего журнала по порядку"""
+        for path in (self.path + '.1', self.path):
+            if not os.path.exists(path):
+                continue
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    self.records += 1
+                    yield record
+
+    def append(self, record):
+        self._pending.append(record)
+
+    def take(self):
+        """Забрать накопленные записи (в потоке событий)"""
+        batch, self._pending = self._pending, []
+        return batch
+
+    def write(self, batch):
+        """Дописать пачку записей одним fsync"""
+        if not batch:
+            return
+        lines = ''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in batch)
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(lines)
+            f.flush()
+            os.fsync(f.fileno())
+        self.records += len(batch)
+
+    def rotate(self):
+        """Отложить текущий журнал в <path>.1 и начать новый; вернуть путь отложенного"""
+        rotated = self.path + '.1'
+        if os.path.exists(self.path):
+            os.replace(self.path, rotated)
+        self.records = 0
+        return rotated
+
+    def close(self):
+        self.write(self.take())
+
+
+def lock_file(path):
+    """
+    Эксклюзивная блокировка path на время работы процесса: JSON-хранилище держит
+    данные в памяти, и второй процесс с теми же файлами затёр бы чужие изменения.
+    """
+    f = open(path, 'a')
+    if fcntl is not None:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            f.close()
+            raise RuntimeError(
+                f'{path} занят другим процессом бота: JSON-хранилище работает в одном процессе, '
+                f'для нескольких используйте STORAGE_BACKEND=sqlite'
+            )
+    return f
+
+
+# 🔹 Хранилище варнов
+class WarnStore:
+    """
+    Активные варны {guild_id: {user_id: [WarnEvent, ...]}} с целыми id,
+    события по возрастанию времени; количество варнов — длина списка.
+    Каждый варн и каждое истечение — одна короткая запись в журнале, повторное
+    воспроизведение журнала после сбоя безопасно. Компактизация сворачивает
+    журнал в снимок формата codec (warns.json или warns.bin). Старый формат
+    {user_id: count} читается как count событий без сообщения и причины со временем загрузки.
+    Варн участнику из уже учтённого сообщения не записывается повторно (sources —
+    пары (source_message_id, user_id): в одном сообщении бывает несколько варнов разным участникам);
+    checkpoints — сообщение, до которого канал варнов обработан без пропусков (см. WarnBackfill).
+    """
+
+    COMPACT_EVERY = 1000
+
+    def __init__(self, path, codec=None):
+        self.path = path
+        self.codec = codec or CODECS['json']
+        self.journal = Journal(path + '.log')
+        self.data = {}
+        self.sources = set()
+        # {channel_id: (guild_id, message_id)}
+        self.checkpoints = {}
+        # Снимок старого формата или другого codec — его нужно переписать при первой записи
+        self.legacy = False
+
+    def load(self):
+        """Загрузка снимка (любого формата) и хвоста журнала"""
+        self.data = {}
+        self.sources = set()
+        self.checkpoints = {}
+        self.legacy = False
+        loaded_at = time.time()
+        codec, path = find_snapshot(self.path, self.codec)
+        if codec is not None:
+            snapshot, self.legacy = codec.load_warns(path, loaded_at)
+            self.legacy = self.legacy or codec is not self.codec
+            self.data, self.checkpoints = snapshot['warns'], snapshot['checkpoints']
+            self.sources = {(event.source_message_id, user_id) for users in self.data.values()
+                            for user_id, events in users.items()
+                            for event in events if event.source_message_id is not None}
+        for record in self.journal.replay():
+            guild_id = int(record['g'])
+            if 'ch' in record:
+                self._advance(int(record['ch']), guild_id, record['m'])
+                if 'e' not in record:
+                    continue
+            guild_warns = self.data.setdefault(guild_id, {})
+            user_id = int(record['u'])
+            if 'e' in record:
+                event = WarnEvent._make(record['e'])
+                if (event.source_message_id, user_id) not in self.sources:
+                    self._insert(guild_warns, user_id, event)
+            elif 'x' in record:
+                self._drop_before(guild_warns, user_id, record['x'])
+            else:
+                # Запись старого формата: новое значение счётчика
+                self.legacy = True
+                events = guild_warns.setdefault(user_id, [])
+                del events[record['c']:]
+                events.extend(WarnEvent(loaded_at, None, None) for _ in range(record['c'] - len(events)))
+        return self
+
+    def _insert(self, guild_warns, user_id, event):
+        events = guild_warns.setdefault(user_id, [])
+        events.append(event)
+        if len(events) > 1 and events[-2].created_at > event.created_at:
+            events.sort(key=lambda e: e.created_at)
+        if event.source_message_id is not None:
+            self.sources.add((event.source_message_id, user_id))
+        return len(events)
+
+    def _drop_before(self, guild_warns, user_id, cutoff):
+        """Убрать события не новее cutoff; вернуть, сколько убрано"""
+        events = guild_warns.get(user_id)
+        if not events:
+            return 0
+        expired = 0
+        while expired < len(events) and events[expired].created_at <= cutoff:
+            self.sources.discard((events[expired].source_message_id, user_id))
+            expired += 1
+        del events[:expired]
+        if not events:
+            del guild_warns[user_id]
+        return expired
+
+    def _advance(self, channel_id, guild_id, message_id):
+        """Сдвинуть checkpoint канала вперёд (назад не сдвигается); True, если сдвинут"""
+        checkpoint = self.checkpoints.get(channel_id)
+        if checkpoint is not None and checkpoint[1] >= message_id:
+            return False
+        self.checkpoints[channel_id] = (guild_id, message_id)
+        return True
+
+    def get(self, guild_id, user_id):
+        return len(self.data.get(int(guild_id), {}).get(int(user_id), ()))
+
+    def add(self, guild_id, user_id, created_at, source_message_id=None, reason=None, channel_id=None):
+        """
+        Записать событие варна и вернуть число активных варнов, или None, если варн
+        этому участнику из этого сообщения уже учтён. channel_id — канал сообщения, его checkpoint сдвигается.
+        """
+        guild_id, user_id = int(guild_id), int(user_id)
+        if source_message_id is not None and (source_message_id, user_id) in self.sources:
+            return None
+        event = WarnEvent(created_at, source_message_id, reason)
+        count = self._insert(self.data.setdefault(guild_id, {}), user_id, event)
+        record = {'g': guild_id, 'u': user_id, 'e': event}
+        if channel_id is not None and source_message_id is not None:
+            self._advance(int(channel_id), guild_id, source_message_id)
+            record['ch'], record['m'] = int(channel_id), source_message_id
+        self.journal.append(record)
+        return count
+
+    def set_checkpoint(self, guild_id, channel_id, message_id):
+        guild_id, channel_id = int(guild_id), int(channel_id)
+        if self._advance(channel_id, guild_id, message_id):
+            self.journal.append({'ch': channel_id, 'g': guild_id, 'm': message_id})
+
+    def expire(self, guild_id, user_id, cutoff):
+        """Снять варны не новее cutoff; вернуть (осталось, время самого старого оставшегося или None)"""
+        guild_id, user_id = int(guild_id), int(user_id)
+        guild_warns = self.data.get(guild_id, {})
+        if self._drop_before(guild_warns, user_id, cutoff):
+            self.journal.append({'g': guild_id, 'u': user_id, 'x': cutoff})
+        events = guild_warns.get(user_id)
+        return (len(events), events[0].created_at) if events else (0, None)
+
+    def counts(self, guild_id):
+        return {user_id: len(events) for user_id, events in self.data.get(int(guild_id), {}).items()}
+
+    def oldest(self):
+        """(guild_id, user_id, время самого старого активного варна) для каждого пользователя"""
+        for guild_id, users in self.data.items():
+            for user_id, events in users.items():
+                yield guild_id, user_id, events[0].created_at
+
+    def needs_compaction(self, pending=0):
+        return self.journal.records + pending >= self.COMPACT_EVERY
+
+    def snapshot(self):
+        # События неизменяемы — достаточно копий списков
+        return {
+            'warns': {guild_id: {user_id: list(events) for user_id, events in users.items()}
+                      for guild_id, users in self.data.items()},
+            'checkpoints': dict(self.checkpoints)
+        }
+
+    def write_snapshot(self, snapshot):
+        """Записать снимок и сбросить журнал (в рабочем потоке)"""
+        rotated = self.journal.rotate()
+        write_with(self.codec, self.path, snapshot, self.codec.dump_warns)
+        if os.path.exists(rotated):
+            os.remove(rotated)
+
+    def close(self):
+        self.journal.close()
+
+
+# 🔹 Хранилище заявок в белый список
+class TicketStore:
+    """
+    Заявки держатся в памяти записями Ticket: {guild_id: {номер: Ticket}} (номер
+    уникален в пределах сервера) с индексами по (guild_id, user_id) и статусу.
+    Наружу заявки отдаются словарями формата whitelist_tickets.json.
+    На диск дописываются только изменённые заявки (журнал рядом со снимком),
+    полный снимок формата codec переписывается лишь при уплотнении журнала.
+    Номера заявок считаются по каждому серверу отдельно (last_numbers), новый сервер
+    начинает с 1. Общий счётчик last_ticket_number остался от старых данных: при их
+    переносе (в снимке нет last_numbers) серверы, у которых уже были заявки,
+    продолжают нумерацию с него; после переноса он не меняется.
+    Давно удалённые заявки переносятся в TicketArchive; здесь от них остаётся
+    только счётчик archived {guild_id: {user_id: число}} для сводки по пользователю.
+    """
+
+    COMPACT_EVERY = 500
+
+    def __init__(self, path, codec=None):
+        self.path = path
+        self.codec = codec or CODECS['json']
+        self.journal = Journal(path + '.log')
+        self.last_ticket_number = 0
+        self.last_numbers = {}
+        self.archived = {}
+        self.tickets = {}
+        self._by_user = {}
+        self._by_status = {}
+        # (guild_id, user_id) -> [число заявок, последняя заявка или None, если она в архиве]
+        self._summary = {}
+        # Один объект id на сервер вместо копии в каждой заявке
+        self._guild_ids = {}
+        self._dirty = set()
+        self._removed = []
+        self.legacy = False
+
+    def __len__(self):
+        return sum(len(guild_tickets) for guild_tickets in self.tickets.values())
+
+    def __iter__(self):
+        for guild_tickets in self.tickets.values():
+            yield from guild_tickets.values()
+
+    # --- загрузка ---
+    def load(self):
+        """Загрузка снимка (любого формата) и воспроизведение журнала"""
+        data = {'last_ticket_number': 0, 'last_numbers': {}, 'archived': {}, 'tickets': []}
+        codec, path = find_snapshot(self.path, self.codec)
+        if codec is not None:
+            data = codec.load_tickets(path)
+        self.legacy = codec is not None and (codec is not self.codec or data.get('legacy', False))
+
+        self.last_ticket_number = data['last_ticket_number']
+        self.last_numbers = dict(data['last_numbers'] or {})
+        self.tickets = {}
+        self._by_user.clear()
+        self._by_status.clear()
+        self._summary.clear()
+        self.archived = data['archived']
+        for guild_id, users in self.archived.items():
+            for user_id, count in users.items():
+                self._summary[(guild_id, user_id)] = [count, None]
+        for ticket in data['tickets']:
+            self._put(ticket)
+
+        for record in self.journal.replay():
+            self.last_ticket_number = max(self.last_ticket_number, record.get('last_ticket_number', 0))
+            if 'ticket' in record:
+                self._put(Ticket.from_dict(record['ticket']))
+            elif 'archived' in record:
+                self._drop(self._archived_key(record['archived']))
+
+        if data['last_numbers'] is None:
+            # Данные с общим счётчиком: серверы с заявками (в том числе архивными) продолжают
+            # с последнего выданного номера
+            for guild_id in self.last_numbers.keys() | self.archived.keys():
+                self.last_numbers[guild_id] = max(self.last_numbers.get(guild_id, 0), self.last_ticket_number)
+        return self
+
+    @staticmethod
+    def _archived_key(value):
+        """Ключ (guild_id, номер) из записи журнала; в старых журналах — строка guild_user_номер"""
+        if isinstance(value, str):
+            guild_id, _, ticket_number = value.split('_')
+            return int(guild_id), int(ticket_number)
+        return tuple(value)
+
+    # --- индексы ---
+    def _put(self, ticket):
+        ticket.guild_id = self._guild_ids.setdefault(ticket.guild_id, ticket.guild_id)
+        guild_tickets = self.tickets.setdefault(ticket.guild_id, {})
+        old = guild_tickets.get(ticket.ticket_number)
+        if old is not None:
+            self._unindex(old)
+        guild_tickets[ticket.ticket_number] = ticket
+        user_key = (ticket.guild_id, ticket.user_id)
+        ticket_number = ticket.ticket_number
+        if ticket_number > self.last_numbers.get(ticket.guild_id, 0):
+            self.last_numbers[ticket.guild_id] = ticket_number
+        summary = self._summary.get(user_key)
+        if summary is None:
+            self._summary[user_key] = [1, ticket]
+        elif old is None:
+            summary[0] += 1
+            if summary[1] is None or ticket_number > summary[1].ticket_number:
+                summary[1] = ticket
+        elif summary[1] is old:
+            summary[1] = ticket
+        self._by_user.setdefault(user_key, []).append(ticket)
+        self._by_status.setdefault(ticket.status, set()).add(ticket)
+
+    def _unindex(self, ticket):
+        user_tickets = self._by_user.get((ticket.guild_id, ticket.user_id))
+        if user_tickets and ticket in user_tickets:
+            user_tickets.remove(ticket)
+        status_tickets = self._by_status.get(ticket.status)
+        if status_tickets:
+            status_tickets.discard(ticket)
+
+    def _find(self, guild_id, ticket_number):
+        return self.tickets.get(int(guild_id), {}).get(int(ticket_number))
+
+    def _user_ticket(self, guild_id, user_id, ticket_number):
+        ticket = self._find(guild_id, ticket_number)
+        return ticket if ticket is not None and ticket.user_id == int(user_id) else None
+
+    def _drop(self, ticket_key):
+        """Убрать заявку из памяти после переноса в архив (в сводке пользователя она остаётся)"""
+        guild_id, ticket_number = ticket_key
+        ticket = self.tickets.get(guild_id, {}).pop(ticket_number, None)
+        if ticket is None:
+            return False
+        self._unindex(ticket)
+        summary = self._summary.get((ticket.guild_id, ticket.user_id))
+        if summary is not None and summary[1] is ticket:
+            summary[1] = None
+        users = self.archived.setdefault(ticket.guild_id, {})
+        users[ticket.user_id] = users.get(ticket.user_id, 0) + 1
+        self._dirty.discard(ticket)
+        return True
+
+    # --- операции ---
+    def allocate(self, guild_id, user_id, nickname):
+        """
+        Выдать следующий номер сервера и сразу создать заявку (пока без канала).
+        Возвращает номер и сводку по прошлым заявкам пользователя.
+        """
+        guild_id = int(guild_id)
+        summary = self.summary(guild_id, user_id)
+        ticket_number = self.last_numbers.get(guild_id, 0) + 1
+        self.create(guild_id, user_id, None, nickname, ticket_number)
+        return ticket_number, summary
+
+    def set_channel(self, guild_id, user_id, ticket_number, channel_id):
+        ticket = self._user_ticket(guild_id, user_id, ticket_number)
+        if ticket is None:
+            return False
+        ticket.channel_id = int(channel_id)
+        self._dirty.add(ticket)
+        return True
+
+    def set_transcript(self, guild_id, user_id, ticket_number, transcript):
+        ticket = self._user_ticket(guild_id, user_id, ticket_number)
+        if ticket is None:
+            return False
+        ticket.transcript = transcript
+        self._dirty.add(ticket)
+        return True
+
+    def create(self, guild_id, user_id, channel_id, nickname, ticket_number):
+        now = time.time()
+        ticket = Ticket(ticket_number, int(guild_id), int(user_id), int(channel_id) if channel_id else None,
+                        nickname, TicketStatus.PENDING, now, now)
+        self._put(ticket)
+        self._dirty.add(ticket)
+        return ticket.key
+
+    def get(self, guild_id, user_id, ticket_number):
+        ticket = self._user_ticket(guild_id, user_id, ticket_number)
+        return ticket.as_dict() if ticket is not None else None
+
+    def by_number(self, guild_id, ticket_number):
+        ticket = self._find(guild_id, ticket_number)
+        return ticket.as_dict() if ticket is not None else None
+
+    def by_status(self, *statuses):
+        for status in statuses:
+            for ticket in self._by_status.get(STATUSES.get(status), ()):
+                yield ticket.as_dict()
+
+    def user_tickets(self, guild_id, user_id):
+        """История заявок пользователя, новые первыми"""
+        user_tickets = sorted(self._by_user.get((int(guild_id), int(user_id)), ()),
+                              key=lambda ticket: ticket.created_at, reverse=True)
+        return [ticket.as_dict() for ticket in user_tickets]
+
+    def summary(self, guild_id, user_id):
+        """Число заявок пользователя и статус последней — без перебора истории"""
+        summary = self._summary.get((int(guild_id), int(user_id)))
+        if summary is None:
+            return {'count': 0, 'last_status': None}
+        last = summary[1]
+        # Последняя заявка уже в архиве — туда попадают только удалённые
+        return {'count': summary[0], 'last_status': last.status.value if last is not None else 'deleted'}
+
+    def set_status(self, guild_id, user_id, ticket_number, status):
+        ticket = self._user_ticket(guild_id, user_id, ticket_number)
+        if ticket is None:
+            return False
+        self._by_status.get(ticket.status, set()).discard(ticket)
+        ticket.status = STATUSES[status]
+        ticket.updated_at = time.time()
+        self._by_status.setdefault(ticket.status, set()).add(ticket)
+        self._dirty.add(ticket)
+        return True
+
+    def archive_candidates(self, cutoff, limit):
+        """
+        Копии удалённых заявок, последний раз изменённых раньше cutoff (ISO-строка),
+        с ключами (guild_id, номер); перебирается только индекс deleted
+        """
+        cutoff = to_epoch(cutoff)
+        candidates = []
+        for ticket in self._by_status.get(TicketStatus.DELETED, ()):
+            if ticket.updated_at < cutoff:
+                candidates.append((ticket.key, ticket.as_dict()))
+                if len(candidates) >= limit:
+                    break
+        return candidates
+
+    def remove_archived(self, ticket_keys):
+        """Убрать уже записанные в архив заявки; в журнал уходит запись об удалении"""
+        removed = 0
+        for ticket_key in ticket_keys:
+            ticket = self._find(*ticket_key)
+            if ticket is None or ticket.status is not TicketStatus.DELETED:
+                continue
+            self._drop(ticket.key)
+            self._removed.append(ticket.key)
+            removed += 1
+        return removed
+
+    # --- сохранение ---
+    def take_dirty(self):
+        """Изменённые заявки для журнала (в потоке событий)"""
+        batch = [{'ticket': ticket.as_dict()} for ticket in self._dirty]
+        batch.extend({'archived': list(ticket_key)} for ticket_key in self._removed)
+        self._dirty.clear()
+        self._removed = []
+        return batch
+
+    def needs_compaction(self, pending=0):
+        return self.journal.records + pending >= self.COMPACT_EVERY
+
+    def snapshot(self):
+        """Копия состояния кортежами полей — формат файла выбирает codec в рабочем потоке"""
+        return {
+            'last_ticket_number': self.last_ticket_number,
+            'last_numbers': dict(self.last_numbers),
+            'archived': {guild_id: dict(users) for guild_id, users in self.archived.items()},
+            'rows': [ticket.as_row() for ticket in self]
+        }
+
+    def write_snapshot(self, snapshot):
+        """Записать полный снимок и сбросить журнал (в рабочем потоке)"""
+        rotated = self.journal.rotate()
+        write_with(self.codec, self.path, snapshot, self.codec.dump_tickets)
+        if os.path.exists(rotated):
+            os.remove(rotated)
+
+    def close(self):
+        self.journal.write(self.take_dirty())
+
+
+# 🔹 Абстракция хранилища
+class StorageBackend:
+    """
+    Общий асинхронный интерфейс хранилища варнов и заявок.
+    Заявки возвращаются словарями в формате whitelist_tickets.json.
+    """
+
+    name = 'base'
+    # TicketArchive для давно удалённых заявок или None
+    archive = None
+
+    async def open(self):
+        pass
+
+    async def close(self):
+        pass
+
+    async def maintenance(self):
+        """Периодическое обслуживание (компактизация, checkpoint)"""
+
+    async def flush(self):
+        """Дождаться записи всех изменений на диск"""
+
+    def stats(self):
+        """Показатели хранилища для мониторинга"""
+        return {}
+
+    async def add_warn(self, guild_id, user_id, source_message_id=None, reason=None, created_at=None, channel_id=None):
+        """
+        Записать событие варна (created_at — unix-время, по умолчанию сейчас) и вернуть
+        число активных варнов. Варн участнику из уже учтённого сообщения source_message_id
+        не записывается — возвращается None. channel_id сдвигает checkpoint канала.
+        """
+        raise NotImplementedError
+
+    async def warn_checkpoints(self):
+        """{channel_id: (guild_id, id последнего обработанного сообщения)}"""
+        raise NotImplementedError
+
+    async def set_warn_checkpoint(self, guild_id, channel_id, message_id):
+        """Сдвинуть checkpoint канала вперёд (после догрузки истории)"""
+        raise NotImplementedError
+
+    async def get_warns(self, guild_id, user_id):
+        raise NotImplementedError
+
+    async def warn_counts(self, guild_id):
+        """{user_id: число активных варнов} всех пользователей сервера с варнами"""
+        raise NotImplementedError
+
+    async def expire_warns(self, items):
+        """
+        Снять истёкшие варны пачкой: items — [(guild_id, user_id, cutoff)], снимаются
+        события не новее cutoff. Возвращает [(guild_id, user_id, осталось варнов,
+        время самого старого оставшегося или None)].
+        """
+        raise NotImplementedError
+
+    async def warn_expiry_schedule(self):
+        """[(guild_id, user_id, время самого старого активного варна)] для планировщика истечения"""
+        raise NotImplementedError
+
+    async def allocate_ticket(self, guild_id, user_id, nickname):
+        """
+        Атомарно выдать следующий номер заявки сервера и создать заявку без канала.
+        Возвращает (номер, сводка прошлых заявок пользователя как в get_user_summary).
+        """
+        raise NotImplementedError
+
+    async def set_ticket_channel(self, guild_id, user_id, ticket_number, channel_id):
+        raise NotImplementedError
+
+    async def get_ticket(self, guild_id, user_id, ticket_number):
+        raise NotImplementedError
+
+    async def set_ticket_transcript(self, guild_id, user_id, ticket_number, transcript):
+        """Привязать к заявке файл сохранённой переписки (имя в TranscriptStore)"""
+        raise NotImplementedError
+
+    async def get_ticket_by_number(self, guild_id, ticket_number):
+        raise NotImplementedError
+
+    async def get_user_tickets(self, guild_id, user_id):
+        raise NotImplementedError
+
+    async def get_user_summary(self, guild_id, user_id):
+        """{'count': число заявок пользователя, 'last_status': статус последней или None}"""
+        raise NotImplementedError
+
+    async def archive_tickets(self):
+        """Перенести пачку давно удалённых заявок в архив; вернуть их число"""
+        return 0
+
+    async def ticket_history(self, guild_id, user_id, offset=0, limit=10):
+        """
+        Страница полной истории заявок пользователя, новые первыми: заявки из хранилища
+        и архива сливаются по created_at (архив читается лениво, до конца страницы).
+        Возвращает (заявки, есть ли следующая страница).
+        """
+        hot = await self.get_user_tickets(guild_id, user_id)
+        if self.archive is None:
+            page = hot[offset:offset + limit + 1]
+        else:
+            page = await self.archive.history(guild_id, user_id, offset, limit + 1, merge=hot)
+        return page[:limit], len(page) > limit
+
+    async def update_ticket_status(self, guild_id, user_id, ticket_number, status):
+        raise NotImplementedError
+
+    async def tickets_by_status(self, *statuses):
+        raise NotImplementedError
+
+
+class JsonBackend(StorageBackend):
+    """
+    Снимки с журналами (warns.json / whitelist_tickets.json или .bin в компактном
+    формате — codec). Изменения применяются в памяти сразу, а на диск уходят через
+    отложенную запись.
+    Работает в одном процессе: на время работы файл заявок блокируется.
+    """
+
+    name = 'json'
+
+    def __init__(self, warns_file, tickets_file, persist_window=1.0, archive=None, codec='json'):
+        codec = get_codec(codec)
+        self.warn_store = WarnStore(warns_file, codec)
+        self.ticket_store = TicketStore(tickets_file, codec)
+        self.archive = archive
+        self.persister = WriteBehindPersister(self._prepare_flush, window=persist_window,
+                                              on_error=self._flush_failed)
+        self._force_snapshot = False
+        self._lock = None
+
+    async def open(self):
+        self._lock = lock_file(self.ticket_store.path + '.lock')
+        with metrics.timer('storage.load'):
+            self.warn_store.load()
+            self.ticket_store.load()
+        if self.warn_store.legacy or self.ticket_store.legacy:
+            self._force_snapshot = True
+            self.persister.mark_dirty()
+
+    async def close(self):
+        await self.persister.close()
+        if self._lock is not None:
+            self._lock.close()
+            self._lock = None
+
+    async def flush(self):
+        await self.persister.flush()
+
+    async def maintenance(self):
+        await self.archive_tickets()
+
+    def stats(self):
+        stats = self.persister.stats()
+        stats['hot_tickets'] = len(self.ticket_store)
+        if self.archive is not None:
+            stats.update(self.archive.stats())
+        return stats
+
+    def _prepare_flush(self):
+        """
+        Вызывается в потоке событий: забирает накопленные изменения и, если пора,
+        копии полных снимков. Возвращает функцию для рабочего потока.
+        """
+        warn_batch = self.warn_store.journal.take()
+        ticket_batch = self.ticket_store.take_dirty()
+        if not warn_batch and not ticket_batch and not self._force_snapshot:
+            return None
+
+        force = self._force_snapshot
+        self._force_snapshot = False
+        warn_snapshot = ticket_snapshot = None
+        if force or self.warn_store.needs_compaction(len(warn_batch)):
+            warn_snapshot = self.warn_store.snapshot()
+        if force or self.ticket_store.needs_compaction(len(ticket_batch)):
+            ticket_snapshot = self.ticket_store.snapshot()
+
+        def job():
+            self.warn_store.journal.write(warn_batch)
+            self.ticket_store.journal.write(ticket_batch)
+            if warn_snapshot is not None:
+                self.warn_store.write_snapshot(warn_snapshot)
+            if ticket_snapshot is not None:
+                self.ticket_store.write_snapshot(ticket_snapshot)
+
+        return job
+
+    def _flush_failed(self, exc):
+        """Пачка не дошла до журнала — в следующий раз пишем полные снимки (в потоке событий)"""
+        self._force_snapshot = True
+
+    async def add_warn(self, guild_id, user_id, source_message_id=None, reason=None, created_at=None, channel_id=None):
+        count = self.warn_store.add(guild_id, user_id, created_at or time.time(), source_message_id, reason, channel_id)
+        if count is not None:
+            self.persister.mark_dirty()
+        return count
+
+    async def warn_checkpoints(self):
+        return dict(self.warn_store.checkpoints)
+
+    async def set_warn_checkpoint(self, guild_id, channel_id, message_id):
+        self.warn_store.set_checkpoint(guild_id, channel_id, message_id)
+        self.persister.mark_dirty()
+
+    async def get_warns(self, guild_id, user_id):
+        return self.warn_store.get(guild_id, user_id)
+
+    async def warn_counts(self, guild_id):
+        return self.warn_store.counts(guild_id)
+
+    async def expire_warns(self, items):
+        results = [(guild_id, user_id, *self.warn_store.expire(guild_id, user_id, cutoff))
+                   for guild_id, user_id, cutoff in items]
+        self.persister.mark_dirty()
+        return results
+
+    async def warn_expiry_schedule(self):
+        return list(self.warn_store.oldest())
+
+    async def allocate_ticket(self, guild_id, user_id, nickname):
+        # Без await внутри: выдача номера и создание заявки не перемежаются с другими корутинами
+        result = self.ticket_store.allocate(guild_id, user_id, nickname)
+        self.persister.mark_dirty()
+        return result
+
+    async def set_ticket_channel(self, guild_id, user_id, ticket_number, channel_id):
+        if not self.ticket_store.set_channel(guild_id, user_id, ticket_number, channel_id):
+            return False
+        self.persister.mark_dirty()
+        return True
+
+    async def get_ticket(self, guild_id, user_id, ticket_number):
+        return self.ticket_store.get(guild_id, user_id, ticket_number)
+
+    async def set_ticket_transcript(self, guild_id, user_id, ticket_number, transcript):
+        if not self.ticket_store.set_transcript(guild_id, user_id, ticket_number, transcript):
+            return False
+        self.persister.mark_dirty()
+        return True
+
+    async def get_ticket_by_number(self, guild_id, ticket_number):
+        return self.ticket_store.by_number(guild_id, ticket_number)
+
+    async def get_user_tickets(self, guild_id, user_id):
+        return self.ticket_store.user_tickets(guild_id, user_id)
+
+    async def get_user_summary(self, guild_id, user_id):
+        return self.ticket_store.summary(guild_id, user_id)
+
+    async def archive_tickets(self):
+        if self.archive is None:
+            return 0
+        candidates = self.ticket_store.archive_candidates(self.archive.cutoff(), self.archive.batch_size)
+        if not candidates:
+            return 0
+        # Сначала архив (в потоке записи журналов), потом удаление из памяти и журнала:
+        # сбой между шагами даёт лишь повтор в архиве, который история пропускает
+        await self.persister.run(self.archive.append, [ticket_data for _, ticket_data in candidates])
+        removed = self.ticket_store.remove_archived([ticket_key for ticket_key, _ in candidates])
+        self.persister.mark_dirty()
+        return removed
+
+    async def update_ticket_status(self, guild_id, user_id, ticket_number, status):
+        if not self.ticket_store.set_status(guild_id, user_id, ticket_number, status):
+            return False
+        self.persister.mark_dirty()
+        return True
+
+    async def tickets_by_status(self, *statuses):
+        return list(self.ticket_store.by_status(*statuses))
+
+
+def open_backend(name, warns_file, tickets_file, sqlite_file, persist_window=1.0, archive=None, codec='json'):
+    """Создание хранилища по имени: json или sqlite; codec — формат снимков json-хранилища"""
+    if name == 'json':
+        return JsonBackend(warns_file, tickets_file, persist_window, archive, codec)
+    if name == 'sqlite':
+        from sqlite_storage import SqliteBackend
+        return SqliteBackend(sqlite_file, archive)
+    raise ValueError(f'Неизвестное хранилище: {name}')
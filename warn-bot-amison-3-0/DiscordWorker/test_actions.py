@@ -0,0 +1,75 @@
+import asyncio
+
+from actions import ActionScheduler
+
+GUILD_ID = 111
+MEMBER_ID = 222
+
+
+class FakeRole:
+    def __init__(self, role_id):
+        self.id = role_id
+
+
+class FakeMember:
+    def __init__(self, guild, roles):
+        self.id = MEMBER_ID
+        self.guild = guild
+        self.roles = [FakeRole(GUILD_ID), *roles]
+        self.edits = []
+
+    def get_role(self, role_id):
+        return next((role for role in self.roles if role.id == role_id), None)
+
+    async def edit(self, roles, reason=None):
+        self.edits.append(sorted(role.id for role in roles))
+
+
+class FakeGuild:
+    def __init__(self):
+        self.id = GUILD_ID
+        self.members = {}
+
+    def get_member(self, member_id):
+        return self.members.get(member_id)
+
+
+def test_member_roles_use_roles_at_execution_time():
+    """Роль, выданная, пока действие ждало в очереди, не снимается полным списком ролей"""
+    guild = FakeGuild()
+    stale = FakeMember(guild, [FakeRole(1)])
+
+    async def scenario():
+        scheduler = ActionScheduler(max_concurrency=1)
+        future = await scheduler.edit_member_roles(stale, add=[FakeRole(2)], remove=[FakeRole(1)])
+        current = FakeMember(guild, [FakeRole(1), FakeRole(3)])
+        guild.members[MEMBER_ID] = current
+        scheduler.start()
+        await future
+        await scheduler.close()
+        return current
+
+    current = asyncio.run(scenario())
+    assert stale.edits == []
+    assert current.edits == [[2, 3]]
+
+
+def test_bucket_is_ready_at_most_once():
+    async def scenario():
+        scheduler = ActionScheduler(max_concurrency=2)
+        done = []
+
+        def job(name):
+            async def run():
+                done.append(name)
+            return run
+
+        for number in range(5):
+            await scheduler.submit('route', job(number), f'действие {number}', priority=5 - number)
+        assert scheduler._ready.qsize() == 1
+        scheduler.start()
+        await scheduler.drain()
+        await scheduler.close()
+        return done
+
+    assert asyncio.run(scenario()) == [4, 3, 2, 1, 0]
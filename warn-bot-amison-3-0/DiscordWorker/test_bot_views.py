@@ -0,0 +1,185 @@
+import asyncio
+
+import discord
+import pytest
+
+import bot
+from storage import JsonBackend
+
+GUILD_ID = 111
+USER_ID = 222
+
+
+class FakeResponse:
+    def __init__(self):
+        self.messages = []
+
+    def is_done(self):
+        return bool(self.messages)
+
+    async def send_message(self, content, ephemeral=False, **kwargs):
+        self.messages.append(content)
+
+
+class FakeChannel:
+    id = 333
+    name = 'заявка'
+
+    def __init__(self):
+        self.messages = []
+
+    async def send(self, content=None, **kwargs):
+        self.messages.append(content)
+
+
+class FakeInteraction:
+    def __init__(self, channel):
+        self.guild_id = GUILD_ID
+        self.guild = None
+        self.channel = channel
+        self.user = type('User', (), {'name': 'owner', 'mention': '@owner'})()
+        self.response = FakeResponse()
+
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    backend = JsonBackend(str(tmp_path / 'warns.json'), str(tmp_path / 'whitelist_tickets.json'))
+    monkeypatch.setattr(bot, 'storage', backend)
+    monkeypatch.setattr(bot.permissions, 'allowed', lambda member, *levels: True)
+    return backend
+
+
+async def _ticket(storage, status):
+    await storage.open()
+    ticket_number, _ = await storage.allocate_ticket(GUILD_ID, USER_ID, 'Player')
+    await storage.update_ticket_status(GUILD_ID, USER_ID, ticket_number, status)
+    return ticket_number
+
+
+async def _status(storage, ticket_number):
+    return (await storage.get_ticket_by_number(GUILD_ID, ticket_number))['status']
+
+
+@pytest.mark.parametrize('action, statuses', sorted(bot.WhitelistButton.STATUSES.items()))
+def test_button_rejected_outside_its_statuses(storage, action, statuses):
+    """Кнопка не срабатывает в статусе, для которого она не предназначена"""
+    other = next(status for status in ('pending', 'approved', 'closed', 'deleted') if status not in statuses)
+
+    async def scenario():
+        ticket_number = await _ticket(storage, other)
+        interaction = FakeInteraction(FakeChannel())
+        await bot.WhitelistButton(action, ticket_number).callback(interaction)
+        assert interaction.response.messages == [f'❌ Заявка #{ticket_number} уже обработана']
+        assert await _status(storage, ticket_number) == other
+        await storage.close()
+
+    asyncio.run(scenario())
+
+
+def test_button_statuses_follow_ticket_lifecycle():
+    statuses = bot.WhitelistButton.STATUSES
+    assert statuses['approve'] == statuses['deny'] == ('pending',)
+    assert set(statuses['close']) == {'approved', 'denied', 'reopened'}
+    assert statuses['delete'] == statuses['reopen'] == ('closed',)
+    assert not any('deleted' in allowed for allowed in statuses.values())
+
+
+def test_delete_retry_after_failed_transcript(storage, monkeypatch):
+    """Переписка не сохранилась — заявка остаётся закрытой, повторное «Удалить» срабатывает"""
+    attempts = []
+    deleted = []
+
+    async def save(channel, guild_id, ticket_number):
+        attempts.append(ticket_number)
+        if len(attempts) == 1:
+            raise OSError('диск заполнен')
+        return f'{guild_id}_{ticket_number}.jsonl.gz', 0
+
+    async def delete_channel(channel, reason=None):
+        deleted.append(channel)
+
+    monkeypatch.setattr(bot.transcripts, 'save', save)
+    monkeypatch.setattr(bot.actions, 'delete_channel', delete_channel)
+
+    async def scenario():
+        ticket_number = await _ticket(storage, 'closed')
+        channel = FakeChannel()
+
+        await bot.WhitelistButton('delete', ticket_number).callback(FakeInteraction(channel))
+        assert await _status(storage, ticket_number) == 'closed'
+        assert deleted == []
+        assert 'Нажмите «Удалить» ещё раз' in channel.messages[-1]
+
+        retry = FakeInteraction(channel)
+        await bot.WhitelistButton('delete', ticket_number).callback(retry)
+        assert 'уже обработана' not in retry.response.messages[0]
+        assert await _status(storage, ticket_number) == 'deleted'
+        ticket = await storage.get_ticket_by_number(GUILD_ID, ticket_number)
+        assert ticket['transcript'] == f'{GUILD_ID}_{ticket_number}.jsonl.gz'
+        assert deleted == [channel]
+        await storage.close()
+
+    asyncio.run(scenario())
+
+
+class FakeRole:
+    def __init__(self, role_id):
+        self.id = role_id
+
+
+class FakeGuild:
+    def __init__(self):
+        self.id = GUILD_ID
+        settings = bot.guild_configs.value.get(GUILD_ID)
+        self.roles = {role_id: FakeRole(role_id) for role_id in (settings.admin_role_id, settings.mod_role_id)}
+
+    def get_role(self, role_id):
+        return self.roles.get(role_id)
+
+
+def test_reopen_replaces_overwrites_of_uncached_targets(storage, monkeypatch):
+    """Прежние права под ключом discord.Object заменяются, а не дублируются по id"""
+    guild = FakeGuild()
+    member = type('Member', (), {'id': USER_ID})()
+    edits = []
+
+    async def get_member(guild, user_id):
+        return member
+
+    async def edit_channel(channel, priority=None, **fields):
+        edits.append(fields['overwrites'])
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(None)
+        return future
+
+    monkeypatch.setattr(bot.member_cache, 'get', get_member)
+    monkeypatch.setattr(bot.actions, 'edit_channel', edit_channel)
+
+    async def scenario():
+        ticket_number = await _ticket(storage, 'closed')
+        closed = discord.PermissionOverwrite(send_messages=False, read_messages=True)
+        channel = FakeChannel()
+        channel.overwrites = {discord.Object(role_id): closed for role_id in guild.roles}
+        channel.overwrites[discord.Object(USER_ID)] = closed
+
+        interaction = FakeInteraction(channel)
+        interaction.guild = guild
+
+        async def defer():
+            interaction.response.messages.append(None)
+
+        async def edit_original_response(**kwargs):
+            pass
+
+        interaction.response.defer = defer
+        interaction.edit_original_response = edit_original_response
+        await bot.WhitelistButton('reopen', ticket_number).callback(interaction)
+
+        assert len(edits) == 1
+        ids = [target.id for target in edits[0]]
+        assert sorted(ids) == sorted([*guild.roles, USER_ID])
+        assert all(overwrite.send_messages for overwrite in edits[0].values())
+        assert await _status(storage, ticket_number) == 'reopened'
+        await storage.close()
+
+    asyncio.run(scenario())
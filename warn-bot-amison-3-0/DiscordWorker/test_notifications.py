@@ -0,0 +1,53 @@
+import asyncio
+
+import discord
+
+import bot
+from actions import ActionScheduler
+from notifications import NotificationBatcher
+
+
+class FakeChannel:
+    def __init__(self, channel_id, fail=False):
+        self.id = channel_id
+        self.fail = fail
+        self.sent = []
+
+    def __str__(self):
+        return f'#{self.id}'
+
+    async def send(self, **kwargs):
+        if self.fail:
+            raise discord.DiscordException('Missing Permissions')
+        self.sent.append(kwargs['embeds'])
+
+
+def _run(monkeypatch, channel, embeds):
+    """Пачка уведомлений через send_log_embeds и очередь действий; вернуть батчер"""
+    async def scenario():
+        scheduler = ActionScheduler(max_concurrency=1)
+        monkeypatch.setattr(bot, 'actions', scheduler)
+        scheduler.start()
+        notifier = NotificationBatcher(bot.send_log_embeds, interval=60)
+        for embed in embeds:
+            notifier.add(channel, embed)
+        await notifier.close()
+        await scheduler.close()
+        return notifier, scheduler
+
+    return asyncio.run(scenario())
+
+
+def test_delivered_batch_is_counted(monkeypatch):
+    channel = FakeChannel(1)
+    embeds = [discord.Embed(title=f'Заявка #{number}') for number in range(3)]
+    notifier, _ = _run(monkeypatch, channel, embeds)
+    assert channel.sent == [embeds]
+    assert (notifier.sent_messages, notifier.sent_embeds) == (1, 3)
+
+
+def test_failed_send_is_not_counted(monkeypatch):
+    """Ошибка самой отправки доходит до батчера, а не теряется в future очереди"""
+    notifier, scheduler = _run(monkeypatch, FakeChannel(1, fail=True), [discord.Embed(title='Заявка #1')])
+    assert (notifier.sent_messages, notifier.sent_embeds) == (0, 0)
+    assert scheduler.failed == 1
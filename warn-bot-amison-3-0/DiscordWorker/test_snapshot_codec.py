@@ -0,0 +1,85 @@
+import asyncio
+import os
+import pickle
+
+import pytest
+
+from records import Ticket, TicketStatus, WarnEvent
+from snapshot_codec import CODECS
+from storage import JsonBackend
+
+GUILD_ID = 1
+USER_ID = 5
+CREATED_AT = 1700000000.0
+
+codec = CODECS['compact']
+
+
+class Payload:
+    """Класс в снимке: при чтении не должен загружаться и вызываться"""
+
+    def __reduce__(self):
+        return os.system, ('echo pwned',)
+
+
+def _legacy_snapshot(path, payload):
+    """Снимок прежней версии: LEGACY_MAGIC и pickle"""
+    with open(path, 'wb') as f:
+        f.write(codec.LEGACY_MAGIC)
+        pickle.dump(payload, f)
+
+
+def _tickets_payload():
+    ticket = Ticket(3, GUILD_ID, USER_ID, 9, 'Player', TicketStatus.APPROVED, CREATED_AT, CREATED_AT)
+    return {'last_ticket_number': 3, 'last_numbers': {GUILD_ID: 3}, 'archived': {}, 'rows': [ticket.as_row()]}
+
+
+def test_legacy_tickets_snapshot_is_read_and_marked(tmp_path):
+    path = str(tmp_path / 'whitelist_tickets.bin')
+    _legacy_snapshot(path, _tickets_payload())
+    data = codec.load_tickets(path)
+    assert data['legacy']
+    assert data['last_numbers'] == {GUILD_ID: 3}
+    assert [ticket.as_row() for ticket in data['tickets']] == _tickets_payload()['rows']
+
+
+def test_current_snapshot_is_not_legacy(tmp_path):
+    path = str(tmp_path / 'whitelist_tickets.bin')
+    codec.dump_tickets(path, _tickets_payload())
+    assert not codec.load_tickets(path)['legacy']
+
+
+@pytest.mark.parametrize('payload', [Payload(), {'rows': [Payload()]}, {'ticket': Ticket(1, GUILD_ID, USER_ID)}])
+def test_legacy_snapshot_with_objects_is_rejected(tmp_path, payload):
+    path = str(tmp_path / 'whitelist_tickets.bin')
+    _legacy_snapshot(path, payload)
+    with pytest.raises(pickle.UnpicklingError):
+        codec.load_tickets(path)
+
+
+def test_legacy_snapshots_are_rewritten_on_first_flush(tmp_path):
+    warns = str(tmp_path / 'warns.json')
+    tickets = str(tmp_path / 'whitelist_tickets.json')
+    _legacy_snapshot(str(tmp_path / 'whitelist_tickets.bin'), _tickets_payload())
+    event = (CREATED_AT, 42, 'флуд')
+    _legacy_snapshot(str(tmp_path / 'warns.bin'), {'warns': {GUILD_ID: {USER_ID: [event]}}, 'checkpoints': {}})
+
+    async def scenario():
+        backend = JsonBackend(warns, tickets, codec='compact')
+        await backend.open()
+        await backend.flush()
+        await backend.close()
+
+        for name in ('whitelist_tickets.bin', 'warns.bin'):
+            with open(tmp_path / name, 'rb') as f:
+                assert f.read(len(codec.MAGIC)) == codec.MAGIC
+
+        backend = JsonBackend(warns, tickets, codec='compact')
+        await backend.open()
+        assert not backend.ticket_store.legacy and not backend.warn_store.legacy
+        ticket = await backend.get_ticket_by_number(GUILD_ID, 3)
+        assert (ticket['nickname'], ticket['status']) == ('Player', 'approved')
+        assert backend.warn_store.snapshot()['warns'][GUILD_ID][USER_ID] == [WarnEvent(*event)]
+        await backend.close()
+
+    asyncio.run(scenario())
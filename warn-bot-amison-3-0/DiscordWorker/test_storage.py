@@ -0,0 +1,96 @@
+import asyncio
+import json
+
+from archive import TicketArchive
+from storage import JsonBackend, TicketStore
+
+OLD_GUILD = 1
+NEW_GUILD = 2
+
+
+def _legacy_tickets(path, last_ticket_number=40):
+    """whitelist_tickets.json до счётчиков по серверам: один общий last_ticket_number"""
+    ticket = {'ticket_number': 7, 'guild_id': str(OLD_GUILD), 'user_id': '5', 'status': 'approved',
+              'created_at': '2024-01-01T00:00:00', 'updated_at': '2024-01-01T00:00:00'}
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'last_ticket_number': last_ticket_number, 'tickets': {f'{OLD_GUILD}_5_7': ticket}}, f)
+
+
+def test_legacy_counter_continues_only_for_existing_guilds(tmp_path):
+    path = str(tmp_path / 'whitelist_tickets.json')
+    _legacy_tickets(path)
+    store = TicketStore(path).load()
+    assert store.legacy
+    assert store.allocate(OLD_GUILD, 6, 'a')[0] == 41
+    assert store.allocate(NEW_GUILD, 6, 'b')[0] == 1
+    assert store.last_ticket_number == 40
+
+
+def test_first_flush_migrates_to_per_guild_counters(tmp_path):
+    """После переноса новый сервер не подтягивается к общему счётчику при перезапуске"""
+    warns = str(tmp_path / 'warns.json')
+    tickets = str(tmp_path / 'whitelist_tickets.json')
+    _legacy_tickets(tickets)
+
+    async def scenario():
+        backend = JsonBackend(warns, tickets)
+        await backend.open()
+        await backend.flush()
+        with open(tickets, encoding='utf-8') as f:
+            assert json.load(f)['last_numbers'] == {str(OLD_GUILD): 40}
+
+        assert (await backend.allocate_ticket(NEW_GUILD, 6, 'b'))[0] == 1
+        await backend.close()
+
+        backend = JsonBackend(warns, tickets)
+        await backend.open()
+        assert not backend.ticket_store.legacy
+        assert (await backend.allocate_ticket(NEW_GUILD, 7, 'c'))[0] == 2
+        assert (await backend.allocate_ticket(OLD_GUILD, 7, 'd'))[0] == 41
+        await backend.close()
+
+    asyncio.run(scenario())
+
+
+def test_archived_only_guild_keeps_legacy_numbering(tmp_path):
+    path = str(tmp_path / 'whitelist_tickets.json')
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'last_ticket_number': 40, 'archived': {str(OLD_GUILD): {'5': 3}}, 'tickets': {}}, f)
+    store = TicketStore(path).load()
+    assert store.allocate(OLD_GUILD, 6, 'a')[0] == 41
+
+
+def _ticket_data(ticket_number, created_at, updated_at=None, status='approved'):
+    return {'ticket_number': ticket_number, 'guild_id': str(OLD_GUILD), 'user_id': '5', 'status': status,
+            'created_at': created_at, 'updated_at': updated_at or created_at}
+
+
+def test_history_merges_hot_and_archived_by_created_at(tmp_path):
+    """Открытая старая заявка не оттесняет более новые архивные в конец истории"""
+    warns = str(tmp_path / 'warns.json')
+    tickets = str(tmp_path / 'whitelist_tickets.json')
+    hot = [_ticket_data(1, '2024-01-01T00:00:00'), _ticket_data(3, '2024-03-01T00:00:00')]
+    with open(tickets, 'w', encoding='utf-8') as f:
+        json.dump({'last_numbers': {str(OLD_GUILD): 5},
+                   'tickets': {f'{OLD_GUILD}_5_{t["ticket_number"]}': t for t in hot}}, f)
+    archive = TicketArchive(str(tmp_path / 'archive'))
+    archive.append([
+        _ticket_data(2, '2024-02-01T00:00:00', '2024-02-05T00:00:00', 'deleted'),
+        # Удалена позже, чем создана пятая: лежит в более новом сегменте
+        _ticket_data(4, '2024-04-01T00:00:00', '2024-06-01T00:00:00', 'deleted'),
+        _ticket_data(5, '2024-05-01T00:00:00', '2024-05-10T00:00:00', 'deleted'),
+        # Повтор после прерванной архивации
+        _ticket_data(3, '2024-03-01T00:00:00'),
+    ])
+
+    async def scenario():
+        backend = JsonBackend(warns, tickets, archive=archive)
+        await backend.open()
+        pages = []
+        for offset in (0, 2, 4):
+            page, has_more = await backend.ticket_history(OLD_GUILD, 5, offset, limit=2)
+            pages.append(([t['ticket_number'] for t in page], has_more))
+        await backend.close()
+        return pages
+
+    assert asyncio.run(scenario()) == [([5, 4], True), ([3, 2], True), ([1], False)]
@@ -0,0 +1,122 @@
+import asyncio
+
+import discord
+
+from storage import JsonBackend
+from warn_backfill import WarnBackfill
+
+GUILD_ID = 1
+CHANNEL_ID = 10
+
+
+class FakeMessage:
+    def __init__(self, message_id):
+        self.id = message_id
+
+
+class FakeChannel:
+    def __init__(self, message_ids):
+        self.id = CHANNEL_ID
+        self.guild = discord.Object(GUILD_ID)
+        self.messages = [FakeMessage(message_id) for message_id in message_ids]
+        self.requested = []
+
+    def __str__(self):
+        return 'варны'
+
+    async def history(self, limit=None, after=None, oldest_first=True):
+        self.requested.append(after)
+        for message in self.messages:
+            if not isinstance(after, discord.Object) or message.id > after.id:
+                yield message
+
+
+class FakeBot:
+    def __init__(self, channel):
+        self.channel = channel
+        self.guilds = [channel.guild]
+
+    def get_channel(self, channel_id):
+        return self.channel if channel_id == self.channel.id else None
+
+
+def _scenario(tmp_path, channel, handle_message, checkpoint=None, **kwargs):
+    """Проход догрузки по каналу; вернуть (checkpoint после прохода, backfill)"""
+    async def scenario():
+        storage = JsonBackend(str(tmp_path / 'warns.json'), str(tmp_path / 'whitelist_tickets.json'))
+        await storage.open()
+        if checkpoint is not None:
+            await storage.set_warn_checkpoint(GUILD_ID, CHANNEL_ID, checkpoint)
+        backfill = WarnBackfill(FakeBot(channel), storage, handle_message, **kwargs)
+        await backfill.start()
+        checkpoints = await storage.warn_checkpoints()
+        await storage.close()
+        return checkpoints.get(CHANNEL_ID), backfill
+
+    return asyncio.run(scenario())
+
+
+def test_backfill_resumes_from_checkpoint(tmp_path):
+    seen = []
+
+    async def handle_message(message):
+        seen.append(message.id)
+        return 1
+
+    channel = FakeChannel(range(1, 16))
+    checkpoint, backfill = _scenario(tmp_path, channel, handle_message, checkpoint=10)
+    assert seen == [11, 12, 13, 14, 15]
+    assert checkpoint == (GUILD_ID, 15)
+    assert backfill.caught_up(CHANNEL_ID)
+    assert (backfill.scanned, backfill.applied) == (5, 5)
+
+
+def test_failed_backfill_keeps_contiguous_checkpoint(tmp_path):
+    """Сбой на сообщении: checkpoint — последнее обработанное подряд, канал не догружен"""
+    async def handle_message(message):
+        if message.id == 14:
+            raise RuntimeError('сбой обработчика')
+        return 0
+
+    checkpoint, backfill = _scenario(tmp_path, FakeChannel(range(1, 20)), handle_message,
+                                     checkpoint=10, checkpoint_every=2)
+    assert checkpoint == (GUILD_ID, 13)
+    assert not backfill.caught_up(CHANNEL_ID)
+
+
+def test_channel_from_rules_is_read_for_window(tmp_path):
+    async def handle_message(message):
+        return 0
+
+    channel = FakeChannel([1, 2, 3])
+    checkpoint, backfill = _scenario(tmp_path, channel, handle_message, window=3600,
+                                     channels_for=lambda guild_id: [CHANNEL_ID])
+    assert len(channel.requested) == 1 and not isinstance(channel.requested[0], discord.Object)
+    assert checkpoint == (GUILD_ID, 3)
+    assert backfill.caught_up(CHANNEL_ID)
+
+
+def test_discover_scans_new_channel_once(tmp_path):
+    async def handle_message(message):
+        return 0
+
+    channel = FakeChannel([1, 2])
+
+    async def scenario():
+        storage = JsonBackend(str(tmp_path / 'warns.json'), str(tmp_path / 'whitelist_tickets.json'))
+        await storage.open()
+        backfill = WarnBackfill(FakeBot(channel), storage, handle_message, window=3600)
+        backfill.discover(channel)
+        backfill.discover(channel)
+        for _ in range(100):
+            if backfill.caught_up(CHANNEL_ID):
+                break
+            await asyncio.sleep(0.01)
+        checkpoints = await storage.warn_checkpoints()
+        await storage.close()
+        return checkpoints, backfill
+
+    checkpoints, backfill = asyncio.run(scenario())
+    assert len(channel.requested) == 1
+    assert checkpoints == {CHANNEL_ID: (GUILD_ID, 2)}
+    assert backfill.caught_up(CHANNEL_ID)
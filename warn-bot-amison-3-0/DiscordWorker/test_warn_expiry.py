@@ -0,0 +1,86 @@
+import asyncio
+import time
+
+from warn_expiry import WarnExpiryScheduler, parse_windows
+
+GUILD_ID = 1
+WINDOW = 100.0
+
+
+def test_parse_windows():
+    assert parse_windows('1=2, 3=0,bad') == {1: 2 * 86400, 3: 0.0}
+
+
+def test_earlier_deadline_replaces_live_one():
+    scheduler = WarnExpiryScheduler(None, default_window=WINDOW)
+    now = time.time()
+    scheduler.schedule(GUILD_ID, 5, now)
+    scheduler.schedule(GUILD_ID, 5, now + 50)
+    assert scheduler._deadlines == {(GUILD_ID, 5): now + WINDOW}
+    scheduler.schedule(GUILD_ID, 5, now - 50)
+    assert scheduler._deadlines == {(GUILD_ID, 5): now - 50 + WINDOW}
+    # Заменённая запись остаётся в heap до извлечения
+    assert len(scheduler._heap) == 2
+    assert scheduler.stats()['pending'] == 1
+
+
+def test_unlimited_window_is_not_scheduled():
+    scheduler = WarnExpiryScheduler(None, default_window=WINDOW, windows={GUILD_ID: 0.0})
+    scheduler.schedule(GUILD_ID, 5, time.time())
+    assert scheduler.stats()['pending'] == 0
+
+
+def _run(scheduler, until):
+    async def scenario():
+        scheduler.start()
+        for _ in range(200):
+            if until():
+                break
+            await asyncio.sleep(0.01)
+        # Время дойти до повторной обработки, если бы заменённые записи не пропускались
+        await asyncio.sleep(0.15)
+        scheduler.stop()
+
+    asyncio.run(scenario())
+
+
+def test_replaced_deadlines_fire_once():
+    calls = []
+
+    async def on_expired(batch):
+        calls.append(sorted(batch))
+
+    scheduler = WarnExpiryScheduler(on_expired, default_window=WINDOW, batch_window=0)
+    now = time.time()
+    past = now - 2 * WINDOW
+    # Заменённый срок наступает вскоре после действующего и не должен сработать второй раз
+    scheduler.schedule(GUILD_ID, 5, now - WINDOW + 0.05)
+    for created_at in (past + 20, past + 10, past):
+        scheduler.schedule(GUILD_ID, 5, created_at)
+    scheduler.schedule(GUILD_ID, 6, past)
+    assert len(scheduler._heap) == 5
+
+    _run(scheduler, lambda: calls)
+    assert calls == [[(GUILD_ID, 5), (GUILD_ID, 6)]]
+    assert scheduler.expired == 2
+    assert scheduler.stats()['pending'] == 0
+    assert scheduler._heap == []
+
+
+def test_failed_batch_is_retried_once():
+    calls = []
+
+    async def on_expired(batch):
+        calls.append(sorted(batch))
+        if len(calls) == 1:
+            raise RuntimeError('хранилище недоступно')
+
+    scheduler = WarnExpiryScheduler(on_expired, default_window=WINDOW, batch_window=0)
+    scheduler.RETRY_DELAY = 0.05
+    scheduler.schedule(GUILD_ID, 5, time.time() - 2 * WINDOW)
+    scheduler.schedule(GUILD_ID, 5, time.time() - 3 * WINDOW)
+
+    _run(scheduler, lambda: len(calls) >= 2)
+    assert calls == [[(GUILD_ID, 5)], [(GUILD_ID, 5)]]
+    assert scheduler.expired == 1
+    assert scheduler.stats()['pending'] == 0
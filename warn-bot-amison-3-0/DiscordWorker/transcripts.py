@@ -0,0 +1,132 @@
+import asyncio
+import gzip
+import json
+import logging
+import os
+import zlib
+
+log = logging.getLogger('bot.tickets')
+
+
+# 🔹 Переписка заявок
+class TranscriptStore:
+    """
+    Перед удалением канала заявки его история сохраняется в отдельный сжатый файл
+    <directory>/<guild_id>/ticket-<номер>.jsonl.gz — строка JSON на сообщение, от старых
+    к новым. Сообщения читаются страницами по page_size, каждая страница дописывается
+    отдельным gzip-блоком в рабочем потоке, пока читается следующая: в памяти не больше
+    двух страниц. Файл пишется как .part и переименовывается после последней страницы —
+    прерванное сохранение не выдаёт себя за полную переписку.
+    """
+
+    SUFFIX = '.jsonl.gz'
+
+    def __init__(self, directory, page_size=100):
+        self.directory = directory
+        self.page_size = page_size
+        self.saved = 0
+        self.messages = 0
+        self.failed = 0
+
+    def name(self, guild_id, ticket_number):
+        """Имя файла переписки относительно directory — оно и хранится в заявке"""
+        return os.path.join(str(guild_id), f'ticket-{ticket_number}{self.SUFFIX}')
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def exists(self, name):
+        return os.path.isfile(self.path(name))
+
+    @staticmethod
+    def _line(message):
+        line = {
+            'id': message.id,
+            'at': message.created_at.isoformat(),
+            'author_id': message.author.id,
+            'author': str(message.author),
+            'content': message.content
+        }
+        if message.embeds:
+            line['embeds'] = [embed.to_dict() for embed in message.embeds]
+        if message.attachments:
+            line['attachments'] = [attachment.url for attachment in message.attachments]
+        return json.dumps(line, ensure_ascii=False)
+
+    # --- запись (в рабочем потоке) ---
+    @staticmethod
+    def _start(part):
+        os.makedirs(os.path.dirname(part), exist_ok=True)
+        if os.path.exists(part):
+            os.remove(part)
+
+    @staticmethod
+    def _append(part, lines):
+        with open(part, 'ab') as raw:
+            with gzip.GzipFile(fileobj=raw, mode='ab') as f:
+                f.write(('\n'.join(lines) + '\n').encode('utf-8'))
+
+    @staticmethod
+    def _finish(part, path):
+        with open(part, 'ab') as raw:
+            os.fsync(raw.fileno())
+        os.replace(part, path)
+
+    async def save(self, channel, guild_id, ticket_number):
+        """Сохранить историю канала; вернуть (имя файла для заявки, число сообщений)"""
+        name = self.name(guild_id, ticket_number)
+        path = self.path(name)
+        part = path + '.part'
+        count = 0
+        writing = None
+        try:
+            await asyncio.to_thread(self._start, part)
+            page = []
+            async for message in channel.history(limit=None, oldest_first=True):
+                page.append(self._line(message))
+                if len(page) >= self.page_size:
+                    if writing is not None:
+                        await writing
+                    writing = asyncio.ensure_future(asyncio.to_thread(self._append, part, page))
+                    count += len(page)
+                    page = []
+            if writing is not None:
+                await writing
+                writing = None
+            if page:
+                await asyncio.to_thread(self._append, part, page)
+                count += len(page)
+            await asyncio.to_thread(self._finish, part, path)
+        except BaseException:
+            self.failed += 1
+            if writing is not None:
+                writing.cancel()
+            raise
+        self.saved += 1
+        self.messages += count
+        log.debug('Переписка #%s сохранена: %s сообщений -> %s', channel, count, path)
+        return name, count
+
+    # --- чтение ---
+    def _page(self, name, skip, limit):
+        """limit + 1 сообщений после skip: чтение останавливается, как только страница набрана"""
+        page = []
+        try:
+            with gzip.open(self.path(name), 'rt', encoding='utf-8') as f:
+                for line in f:
+                    if skip:
+                        skip -= 1
+                        continue
+                    page.append(json.loads(line))
+                    if len(page) > limit:
+                        break
+        except (EOFError, OSError, zlib.error, ValueError) as e:
+            log.warning('Переписка %s прочитана не полностью: %s', name, e)
+        return page[:limit], len(page) > limit
+
+    async def page(self, name, skip=0, limit=20):
+        """Страница сообщений переписки и есть ли следующая; чтение — в отдельном потоке"""
+        return await asyncio.to_thread(self._page, name, skip, limit)
+
+    def stats(self):
+        return {'saved': self.saved, 'messages': self.messages, 'failed': self.failed}
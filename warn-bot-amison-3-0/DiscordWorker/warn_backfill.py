@@ -0,0 +1,145 @@
+import asyncio
+import logging
+import time
+from datetime import timedelta
+
+import discord
+
+from warn_expiry import DAY
+
+log = logging.getLogger('bot.warns')
+
+
+# 🔹 Догрузка пропущенных варнов
+class WarnBackfill:
+    """
+    После простоя история каждого канала с checkpoint читается от checkpoint вперёд,
+    от старых сообщений к новым, и передаётся тому же обработчику, что и живые
+    сообщения. discord.py отдаёт историю страницами по 100 сообщений, обработанные
+    сообщения не накапливаются — память не зависит от длины пропуска.
+    Повторный проход безопасен: варн участнику из уже учтённого сообщения не записывается.
+    Checkpoint — сообщение, до которого канал обработан без пропусков: его сдвигает
+    проход по истории, а живые варны — только в каналах, догруженных до конца в текущей
+    сессии шлюза (caught_up). Канал без checkpoint (каналы из правил варнов сервера,
+    channels_for(guild_id), и канал, где живой варн встретился впервые — discover)
+    читается за последние window секунд.
+    handle_message(message) возвращает число принятых варнов; owns(guild_id) отбирает
+    серверы этого процесса, если бот запущен несколькими процессами с шардами.
+    """
+
+    def __init__(self, bot, storage, handle_message, owns=None, channels_for=None, window=DAY,
+                 checkpoint_every=500, progress_every=1000):
+        self.bot = bot
+        self.storage = storage
+        self.handle_message = handle_message
+        self.owns = owns
+        self.channels_for = channels_for
+        self.window = window
+        self.checkpoint_every = checkpoint_every
+        self.progress_every = progress_every
+        self.scanned = 0
+        self.applied = 0
+        self.runs = 0
+        self._task = None
+        # Каналы с checkpoint, догруженные до конца в текущей сессии, и читаемые сейчас
+        self._known = set()
+        self._caught_up = set()
+        self._scanning = set()
+
+    @property
+    def running(self):
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        """Запустить проход в фоне, если он ещё не идёт"""
+        if not self.running:
+            self._task = asyncio.get_running_loop().create_task(self.run())
+        return self._task
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def caught_up(self, channel_id):
+        """Канал догружен до конца в текущей сессии: живой варн может сдвинуть его checkpoint"""
+        return channel_id in self._caught_up
+
+    def discover(self, channel):
+        """Живой варн в канале без checkpoint: догрузить канал за последние window секунд"""
+        if self.window <= 0 or channel.id in self._known or channel.id in self._scanning or self.running:
+            return
+        self._known.add(channel.id)
+        asyncio.get_running_loop().create_task(self._safe_channel(channel.guild.id, channel.id, None))
+
+    def stats(self):
+        return {'running': int(self.running), 'runs': self.runs, 'scanned': self.scanned, 'applied': self.applied,
+                'caught_up': len(self._caught_up)}
+
+    async def run(self):
+        # Новая сессия шлюза: пока канал не догружен, живые варны его checkpoint не сдвигают
+        self._caught_up.clear()
+        checkpoints = await self.storage.warn_checkpoints()
+        if self.owns is not None:
+            checkpoints = {channel_id: checkpoint for channel_id, checkpoint in checkpoints.items()
+                           if self.owns(checkpoint[0])}
+        self._known.update(checkpoints)
+        if self.channels_for is not None and self.window > 0:
+            for guild in self.bot.guilds:
+                if self.owns is not None and not self.owns(guild.id):
+                    continue
+                for channel_id in self.channels_for(guild.id) or ():
+                    if channel_id not in checkpoints:
+                        checkpoints[channel_id] = (guild.id, None)
+                        self._known.add(channel_id)
+        started = time.monotonic()
+        scanned, applied = self.scanned, self.applied
+        for channel_id, (guild_id, message_id) in checkpoints.items():
+            await self._safe_channel(guild_id, channel_id, message_id)
+        self.runs += 1
+        log.info('Догрузка варнов завершена за %.1f с: каналов %s, сообщений %s, варнов %s',
+                 time.monotonic() - started, len(checkpoints), self.scanned - scanned, self.applied - applied)
+
+    async def _safe_channel(self, guild_id, channel_id, message_id):
+        try:
+            await self._channel(guild_id, channel_id, message_id)
+        except Exception as e:
+            log.error('ОШИБКА при догрузке варнов канала %s: %s', channel_id, e)
+
+    async def _channel(self, guild_id, channel_id, message_id):
+        """Догрузить канал от message_id (None — за последние window секунд)"""
+        channel = self.bot.get_channel(channel_id)
+        if channel is None:
+            log.warning('Канал варнов %s недоступен, догрузка пропущена', channel_id)
+            return
+        if channel_id in self._scanning:
+            return
+        if message_id is not None:
+            after = discord.Object(message_id)
+        else:
+            after = discord.utils.utcnow() - timedelta(seconds=self.window)
+            log.info('Канал варнов #%s без checkpoint: догрузка с %s', channel, after.isoformat(timespec='minutes'))
+
+        self._scanning.add(channel_id)
+        scanned = applied = 0
+        last_id = None
+        try:
+            async for message in channel.history(limit=None, after=after, oldest_first=True):
+                scanned += 1
+                applied += await self.handle_message(message)
+                last_id = message.id
+                if scanned % self.checkpoint_every == 0:
+                    await self.storage.set_warn_checkpoint(guild_id, channel_id, last_id)
+                if scanned % self.progress_every == 0:
+                    log.info('Догрузка #%s: просмотрено %s сообщений, принято варнов %s', channel, scanned, applied)
+            self._caught_up.add(channel_id)
+        finally:
+            self._scanning.discard(channel_id)
+            self.scanned += scanned
+            self.applied += applied
+            # Checkpoint сдвигается и на сообщениях без варнов — следующий проход их не перечитает;
+            # сообщения до last_id обработаны по порядку, пропусков до него нет
+            if last_id is not None:
+                await self.storage.set_warn_checkpoint(guild_id, channel_id, last_id)
+        if scanned:
+            log.info('Догрузка #%s: просмотрено %s сообщений, принято варнов %s', channel, scanned, applied)
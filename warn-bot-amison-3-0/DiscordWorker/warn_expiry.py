@@ -0,0 +1,135 @@
+import asyncio
+import heapq
+import logging
+import time
+
+log = logging.getLogger('bot.warns')
+
+DAY = 86400
+
+
+def parse_windows(spec):
+    """'guild_id=дни,guild_id=дни' -> {guild_id: секунды}; 0 дней — варны сервера не истекают"""
+    windows = {}
+    for item in filter(None, (part.strip() for part in (spec or '').split(','))):
+        guild_id, _, days = item.partition('=')
+        try:
+            windows[int(guild_id)] = float(days) * DAY
+        except ValueError:
+            log.error('Неверный срок варнов %r (ожидается guild_id=дни)', item)
+    return windows
+
+
+# 🔹 Истечение варнов
+class WarnExpiryScheduler:
+    """
+    Один heap (срок, guild_id, user_id) и одна задача, которая спит до ближайшего срока.
+    На пользователя действует один срок (_deadlines) — самый ранний из запланированных,
+    обычно срок самого старого активного варна; после обработки планируется срок
+    следующего. Более ранний срок заменяет действующий, а прежняя запись остаётся
+    в heap и пропускается при извлечении (ленивое удаление), поэтому пользователь
+    не попадает в обработку дважды. Память растёт с числом пользователей с варнами,
+    а не с числом событий.
+    Сроки, наступившие в пределах batch_window, передаются в on_expired одной пачкой
+    (не больше max_batch пользователей).
+    """
+
+    RETRY_DELAY = 60.0
+
+    def __init__(self, on_expired, default_window=0.0, windows=None, batch_window=1.0, max_batch=500):
+        self.on_expired = on_expired
+        self.default_window = default_window
+        self.windows = windows or {}
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.expired = 0
+        self._heap = []
+        # {(guild_id, user_id): действующий срок}
+        self._deadlines = {}
+        self._wake = asyncio.Event()
+        self._task = None
+
+    def window(self, guild_id):
+        """Срок жизни варна на сервере в секундах (0 — бессрочно)"""
+        return self.windows.get(int(guild_id), self.default_window)
+
+    def schedule(self, guild_id, user_id, created_at):
+        """Запланировать истечение варна, выданного в created_at (unix-время)"""
+        window = self.window(guild_id)
+        if window <= 0:
+            return
+        self._push(created_at + window, int(guild_id), int(user_id))
+
+    def _push(self, deadline, guild_id, user_id):
+        """Срок пользователя; не раньше уже действующего — ничего не меняет"""
+        key = (guild_id, user_id)
+        current = self._deadlines.get(key)
+        if current is not None and current <= deadline:
+            return
+        self._deadlines[key] = deadline
+        entry = (deadline, guild_id, user_id)
+        heapq.heappush(self._heap, entry)
+        if self._heap[0] is entry:
+            self._wake.set()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self):
+        return {
+            'pending': len(self._deadlines),
+            'next_in_seconds': max(self._heap[0][0] - time.time(), 0.0) if self._heap else -1,
+            'expired': self.expired
+        }
+
+    async def _sleep_until(self, deadline):
+        """Спать до deadline или до появления более раннего срока"""
+        self._wake.clear()
+        try:
+            await asyncio.wait_for(self._wake.wait(), deadline - time.time() if deadline else None)
+        except asyncio.TimeoutError:
+            pass
+
+    def _drop_stale(self):
+        """Убрать с вершины heap заменённые и обработанные записи"""
+        while self._heap and self._deadlines.get(self._heap[0][1:]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+
+    async def _run(self):
+        while True:
+            self._drop_stale()
+            if not self._heap:
+                await self._sleep_until(None)
+                continue
+            if self._heap[0][0] > time.time():
+                await self._sleep_until(self._heap[0][0])
+                continue
+
+            # Даём соседним срокам наступить, чтобы обработать их одной пачкой
+            await asyncio.sleep(self.batch_window)
+            now = time.time()
+            batch = {}
+            while self._heap and self._heap[0][0] <= now and len(batch) < self.max_batch:
+                deadline, guild_id, user_id = heapq.heappop(self._heap)
+                key = (guild_id, user_id)
+                if self._deadlines.get(key) != deadline:
+                    # Запись заменена более ранним сроком или уже обработана
+                    continue
+                del self._deadlines[key]
+                batch[key] = None
+            if not batch:
+                continue
+            try:
+                await self.on_expired(list(batch))
+                self.expired += len(batch)
+            except Exception as e:
+                log.error('ОШИБКА при снятии истёкших варнов: %s', e)
+                # Пачка не обработана — повтор через RETRY_DELAY
+                for guild_id, user_id in batch:
+                    self._push(now + self.RETRY_DELAY, guild_id, user_id)
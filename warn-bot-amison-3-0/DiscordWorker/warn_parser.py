@@ -0,0 +1,293 @@
+import bisect
+import logging
+import re
+from collections import namedtuple
+
+log = logging.getLogger('bot.warns')
+
+# Упоминание участника: <@id> или старый вид <@!id>
+USER_MENTION = re.compile(r'<@!?(\d+)>')
+# Discord не даёт тайм-аут дольше 28 дней
+MAX_TIMEOUT_MINUTES = 28 * 24 * 60
+
+
+# 🔹 Форматы embed ботов модерации
+class EmbedFormat:
+    """
+    Как узнать embed варна и достать из него участника и причину. Признак — регулярные
+    выражения по имени автора embed (author) и/или заголовку (title); участник —
+    упоминание в одном из полей user_fields или группа 1 description_user по описанию;
+    причина — поле из reason_fields или группа 1 description_reason. Выражения
+    компилируются один раз при загрузке правил.
+    """
+
+    __slots__ = ('name', 'author', 'title', 'user_fields', 'reason_fields', 'description_user', 'description_reason')
+
+    SPEC_KEYS = frozenset({'author', 'title', 'user_fields', 'reason_fields', 'description_user', 'description_reason'})
+
+    def __init__(self, name, author=None, title=None, user_fields=(), reason_fields=(),
+                 description_user=None, description_reason=None):
+        if author is None and title is None:
+            raise ValueError(f'Формат варнов {name}: нужен признак author или title')
+        if not user_fields and description_user is None:
+            raise ValueError(f'Формат варнов {name}: нужны user_fields или description_user')
+        self.name = name
+        self.author = re.compile(author) if author is not None else None
+        self.title = re.compile(title) if title is not None else None
+        self.user_fields = frozenset(user_fields)
+        self.reason_fields = frozenset(reason_fields)
+        self.description_user = re.compile(description_user) if description_user is not None else None
+        self.description_reason = re.compile(description_reason) if description_reason is not None else None
+
+    @classmethod
+    def from_spec(cls, name, spec):
+        unknown = set(spec) - cls.SPEC_KEYS
+        if unknown:
+            raise ValueError(f'Формат варнов {name}: неизвестные ключи {sorted(unknown)}')
+        try:
+            return cls(name, **spec)
+        except re.error as e:
+            raise ValueError(f'Формат варнов {name}: {e}') from None
+
+    def matches(self, embed):
+        if self.author is not None and not self.author.search(embed.author.name or ''):
+            return False
+        return self.title is None or self.title.search(embed.title or '') is not None
+
+    def extract(self, embed):
+        """(user_id, причина); user_id — None, если участник не найден"""
+        user_id = reason = None
+        if self.user_fields or self.reason_fields:
+            for field in embed.fields:
+                if user_id is None and field.name in self.user_fields:
+                    match = USER_MENTION.search(field.value or '')
+                    if match:
+                        user_id = int(match.group(1))
+                elif reason is None and field.name in self.reason_fields:
+                    reason = field.value
+        if (user_id is None and self.description_user is not None) or \
+                (reason is None and self.description_reason is not None):
+            description = embed.description or ''
+            if user_id is None and self.description_user is not None:
+                match = self.description_user.search(description)
+                if match:
+                    user_id = int(match.group(1))
+            if reason is None and self.description_reason is not None:
+                match = self.description_reason.search(description)
+                if match:
+                    reason = match.group(1).strip()
+        return user_id, reason
+
+
+BUILTIN_FORMATS = {embed_format.name: embed_format for embed_format in (
+    # MEE6: автор «[WARN] ...», поле User с упоминанием
+    EmbedFormat('mee6', author=r'\[WARN\]', user_fields=('User',), reason_fields=('Reason', 'Причина')),
+    # Dyno: автор «Case 12 | Warn | name»
+    EmbedFormat('dyno', author=r'^Case \d+ \| Warn\b', user_fields=('User', 'Offender'), reason_fields=('Reason',)),
+    # Carl-bot: заголовок «warn | case 12», участник и причина в описании
+    EmbedFormat('carl', title=r'(?i)^warn \| case \d+',
+                description_user=r'\*\*Offender:\*\*[^\n]*?<@!?(\d+)>',
+                description_reason=r'\*\*Reason:\*\*\s*([^\n]+)')
+)}
+
+
+# 🔹 Лестница наказаний
+LadderStep = namedtuple('LadderStep', ('warns', 'role', 'timeout_minutes'))
+
+
+class WarnLadder:
+    """
+    Ступени по числу активных варнов. Роль участника — роль последней достигнутой
+    ступени с ролью; остальные роли лестницы снимаются. Тайм-аут ступени выдаётся
+    один раз — когда число варнов становится равным её порогу.
+    """
+
+    def __init__(self, steps):
+        self.steps = tuple(sorted(steps, key=lambda step: step.warns))
+        self._at = {step.warns: step for step in self.steps}
+        if len(self._at) != len(self.steps):
+            raise ValueError('Лестница варнов: пороги ступеней повторяются')
+        # Роли в порядке ступеней (без повторов) и пороги, с которых каждая действует
+        self.role_names = tuple(dict.fromkeys(step.role for step in self.steps if step.role))
+        role_steps = [step for step in self.steps if step.role]
+        self._role_thresholds = [step.warns for step in role_steps]
+        self._role_levels = [self.role_names.index(step.role) for step in role_steps]
+
+    @classmethod
+    def from_spec(cls, spec):
+        steps = []
+        for item in spec:
+            unknown = set(item) - set(LadderStep._fields)
+            if unknown:
+                raise ValueError(f'Ступень лестницы варнов: неизвестные ключи {sorted(unknown)}')
+            step = LadderStep(int(item.get('warns', 0)), item.get('role'), float(item.get('timeout_minutes') or 0))
+            if step.warns < 1:
+                raise ValueError(f'Ступень лестницы варнов: порог {step.warns} меньше 1')
+            if not step.role and not step.timeout_minutes:
+                raise ValueError(f'Ступень лестницы варнов {step.warns}: нужна role или timeout_minutes')
+            if not 0 <= step.timeout_minutes <= MAX_TIMEOUT_MINUTES:
+                raise ValueError(f'Ступень лестницы варнов {step.warns}: тайм-аут больше 28 дней')
+            steps.append(step)
+        return cls(steps)
+
+    def level(self, warn_count):
+        """Индекс роли в role_names для warn_count варнов; -1 — без роли"""
+        index = bisect.bisect_right(self._role_thresholds, warn_count) - 1
+        return self._role_levels[index] if index >= 0 else -1
+
+    def step_at(self, warn_count):
+        """Ступень, порог которой ровно warn_count, или None"""
+        return self._at.get(warn_count)
+
+
+def ladder_diff(member, roles, level, downgrade_only=False):
+    """
+    (add, remove) для приведения ролей участника к уровню level. roles — роли
+    лестницы (Role или None, если на сервере её нет) в порядке role_names.
+    downgrade_only — только понижение: без изменений, если у участника нет роли выше level.
+    """
+    add, remove = [], []
+    above = False
+    for role_level, role in enumerate(roles):
+        if role is None:
+            continue
+        has_role = member.get_role(role.id) is not None
+        if role_level == level and not has_role:
+            add.append(role)
+        elif role_level != level and has_role:
+            remove.append(role)
+            above = above or role_level > level
+    if downgrade_only and not above:
+        return [], []
+    return add, remove
+
+
+# 🔹 Правила сервера
+class GuildWarnRules:
+    """
+    Источники варнов сервера: sources — id ботов модерации, channels — id каналов
+    (None — любой бот / любой канал), formats — форматы embed, ladder — лестница наказаний.
+    """
+
+    __slots__ = ('sources', 'channels', 'formats', 'ladder')
+
+    SPEC_KEYS = frozenset({'sources', 'channels', 'formats', 'ladder'})
+
+    def __init__(self, sources, channels, formats, ladder):
+        self.sources = sources
+        self.channels = channels
+        self.formats = formats
+        self.ladder = ladder
+
+    @classmethod
+    def from_spec(cls, spec, formats):
+        unknown = set(spec) - cls.SPEC_KEYS
+        if unknown:
+            raise ValueError(f'Правила варнов: неизвестные ключи {sorted(unknown)}')
+        try:
+            embed_formats = tuple(formats[name] for name in spec.get('formats', ()))
+        except KeyError as e:
+            raise ValueError(f'Правила варнов: неизвестный формат {e.args[0]}') from None
+        if not embed_formats:
+            raise ValueError('Правила варнов: не задан ни один формат')
+        sources = spec.get('sources')
+        channels = spec.get('channels')
+        return cls(
+            frozenset(map(int, sources)) if sources else None,
+            frozenset(map(int, channels)) if channels else None,
+            embed_formats,
+            WarnLadder.from_spec(spec.get('ladder', ()))
+        )
+
+    def accepts(self, message):
+        return ((self.sources is None or message.author.id in self.sources)
+                and (self.channels is None or message.channel.id in self.channels))
+
+
+# 🔹 Разбор сообщений
+class WarnParser:
+    """
+    Правила варнов по серверам. Файл правил (JSON):
+    {"default": {...}, "guilds": {"<guild_id>": {...}}, "formats": {"<имя>": {...}}} —
+    правила сервера дополняют default, formats добавляет свои форматы к встроенным
+    (mee6, dyno, carl). Без файла действует только default_spec; файл читает и
+    перезагружает на ходу ConfigFile.
+    Сообщение отсекается до разбора embed проверками за O(1): бот, сервер, id автора
+    и канала по frozenset; затем embed сверяются с форматами сервера.
+    """
+
+    def __init__(self, default, guilds=None):
+        self.default = default
+        self.guilds = guilds or {}
+        self.skipped = 0
+        self.parsed = 0
+        self.rejected = 0
+        self.malformed = 0
+        self.parsed_by_format = {}
+
+    @classmethod
+    def from_config(cls, config, default_spec):
+        unknown = set(config) - {'default', 'guilds', 'formats'}
+        if unknown:
+            raise ValueError(f'Правила варнов: неизвестные ключи {sorted(unknown)}')
+        formats = dict(BUILTIN_FORMATS)
+        for name, spec in config.get('formats', {}).items():
+            formats[name] = EmbedFormat.from_spec(name, spec)
+        default = dict(default_spec, **config.get('default', {}))
+        guilds = {}
+        for guild_id, spec in config.get('guilds', {}).items():
+            try:
+                guilds[int(guild_id)] = GuildWarnRules.from_spec(dict(default, **spec), formats)
+            except ValueError as e:
+                raise ValueError(f'Сервер {guild_id}: {e}') from None
+        return cls(GuildWarnRules.from_spec(default, formats), guilds)
+
+    @staticmethod
+    def carry_stats(new, old):
+        """Счётчики переходят к правилам, загруженным заново (ConfigFile.carry)"""
+        new.skipped, new.parsed, new.rejected, new.malformed = old.skipped, old.parsed, old.rejected, old.malformed
+        new.parsed_by_format = old.parsed_by_format
+
+    def rules(self, guild_id):
+        return self.guilds.get(guild_id, self.default)
+
+    def ladder(self, guild_id):
+        return self.rules(guild_id).ladder
+
+    def parse(self, message):
+        """Варны сообщения: список (формат, user_id, причина); пустой — не варн"""
+        if not message.author.bot or not message.embeds or message.guild is None:
+            return ()
+        rules = self.guilds.get(message.guild.id, self.default)
+        if not rules.accepts(message):
+            self.skipped += 1
+            return ()
+
+        warns = []
+        for embed in message.embeds:
+            for embed_format in rules.formats:
+                if not embed_format.matches(embed):
+                    continue
+                user_id, reason = embed_format.extract(embed)
+                if user_id is None:
+                    self.malformed += 1
+                    log.error('ОШИБКА: ID пользователя не найден в embed %s (сообщение %s)',
+                              embed_format.name, message.id)
+                else:
+                    warns.append((embed_format.name, user_id, reason))
+                    self.parsed_by_format[embed_format.name] = self.parsed_by_format.get(embed_format.name, 0) + 1
+                break
+        if warns:
+            self.parsed += 1
+        else:
+            self.rejected += 1
+        return warns
+
+    def stats(self):
+        return {
+            'skipped': self.skipped,
+            'parsed': self.parsed,
+            'rejected': self.rejected,
+            'malformed': self.malformed,
+            'parsed_by_format': {f'format="{name}"': count for name, count in self.parsed_by_format.items()}
+        }
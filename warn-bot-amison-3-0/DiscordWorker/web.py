@@ -0,0 +1,136 @@
+import asyncio
+import json
+import logging
+import time
+
+from aiohttp import web
+
+from metrics import metrics
+
+log = logging.getLogger('bot.web')
+
+
+# 🔹 Задержка цикла событий
+class LoopLagMonitor:
+    """Раз в interval секунд измеряет, насколько позже запланированного проснулся цикл событий"""
+
+    def __init__(self, interval=0.5):
+        self.interval = interval
+        self.lag = 0.0
+        self.max_lag = 0.0
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.lag = max(time.perf_counter() - started - self.interval, 0.0)
+            self.max_lag = max(self.max_lag, self.lag)
+            metrics.observe('event_loop_lag', self.lag)
+
+
+def prefixed(prefix, source):
+    """Источник метрик с общим префиксом имён"""
+    return lambda: {f'{prefix}_{name}': value for name, value in source().items()}
+
+
+def render_prometheus(metrics, prefix='amison_'):
+    """{'name': value} или {'name': {'label=\"x\"': value}} -> текстовый формат Prometheus"""
+    lines = []
+    for name, value in metrics.items():
+        metric = prefix + name
+        lines.append(f'# TYPE {metric} gauge')
+        if isinstance(value, dict):
+            for labels, labelled_value in value.items():
+                lines.append(f'{metric}{{{labels}}} {float(labelled_value)}')
+        else:
+            lines.append(f'{metric} {float(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+# 🔹 HTTP-сервер здоровья и метрик в цикле событий бота
+class HealthServer:
+    """
+    / — ответ для UptimeRobot, /healthz — готовность шлюза, задержка websocket
+    и цикла событий (503, если бот не готов или цикл «застрял»), /metrics — Prometheus.
+    metric_sources — функции без аргументов, возвращающие словари метрик.
+    """
+
+    def __init__(self, bot, host='0.0.0.0', port=5000, max_loop_lag=1.0):
+        self.bot = bot
+        self.host = host
+        self.port = port
+        self.max_loop_lag = max_loop_lag
+        self.lag_monitor = LoopLagMonitor()
+        self.metric_sources = []
+        self.started_at = time.time()
+        self._runner = None
+
+        self.app = web.Application()
+        self.app.router.add_get('/', self.home)
+        self.app.router.add_get('/healthz', self.healthz)
+        self.app.router.add_get('/metrics', self.metrics)
+
+    async def start(self):
+        self.lag_monitor.start()
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        try:
+            await web.TCPSite(self._runner, self.host, self.port).start()
+            log.info('HTTP-сервер здоровья запущен на порту %s', self.port)
+        except OSError as e:
+            log.error('HTTP-сервер не смог запуститься: %s', e)
+
+    async def close(self):
+        self.lag_monitor.stop()
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def health(self):
+        latency = self.bot.latency
+        ready = self.bot.is_ready() and not self.bot.is_closed()
+        return {
+            'ready': ready,
+            'latency': latency if latency == latency and latency != float('inf') else None,
+            'loop_lag': self.lag_monitor.lag,
+            'uptime': time.time() - self.started_at,
+            'guilds': len(self.bot.guilds)
+        }
+
+    async def home(self, request):
+        return web.Response(text="Bot is alive!")
+
+    async def healthz(self, request):
+        health = self.health()
+        healthy = health['ready'] and health['loop_lag'] < self.max_loop_lag
+        return web.Response(text=json.dumps(health), content_type='application/json', status=200 if healthy else 503)
+
+    def collect(self):
+        health = self.health()
+        metrics = {
+            'gateway_ready': int(health['ready']),
+            'gateway_latency_seconds': health['latency'] if health['latency'] is not None else -1,
+            'event_loop_lag_seconds': self.lag_monitor.lag,
+            'event_loop_lag_max_seconds': self.lag_monitor.max_lag,
+            'uptime_seconds': health['uptime'],
+            'guilds': health['guilds']
+        }
+        for source in self.metric_sources:
+            try:
+                metrics.update(source())
+            except Exception as e:
+                log.error('ОШИБКА при сборе метрик: %s', e)
+        return metrics
+
+    async def metrics(self, request):
+        return web.Response(text=render_prometheus(self.collect()), content_type='text/plain', charset='utf-8')